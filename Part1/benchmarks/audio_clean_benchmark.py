@@ -0,0 +1,134 @@
+# Audio cleaning benchmark and parity check (see src/audio_kernel.py).
+#
+# Cleans the same clips with the original pydub chain and with the NumPy/SciPy
+# kernel, and reports time per clip and how far the kernel's output is from
+# pydub's. Exits with status 1 when the difference exceeds the tolerance, so it
+# doubles as the kernel's parity check. The corpus is synthetic (tone bursts
+# between silences, so that trimming and the compressor have work to do)
+# unless --source points to a directory of audio files, like output/audios of
+# the data collection.
+#
+#   python benchmarks/audio_clean_benchmark.py --audios 8 --audio-seconds 10
+#   python benchmarks/audio_clean_benchmark.py --source output/audios --audios 20
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import git_commit
+from src import audio_kernel
+from src import codec_policy
+
+# pydub rounds to 16 bits after every step and the kernel runs the
+# compressor's gain at a control rate, so the difference is 45-55 dB below the signal
+MIN_SNR = 40.0
+# When a 500 ms window sits right at the silence threshold, the two chains
+# can trim a few ms apart; the outputs are then compared on their overlap
+MAX_TRIM_DIFFERENCE_MS = 5
+
+def synthetic_audio(rng, seconds, sample_rate, channels):
+    import numpy as np
+    time_axis = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = rng.normal(0, 0.0005, (len(time_axis), channels))
+    position = rng.uniform(0.2, 0.9)
+    while position < seconds - 0.8:
+        duration = rng.uniform(0.1, 0.8)
+        burst = (time_axis >= position) & (time_axis < position + duration)
+        envelope = rng.uniform(0.02, 0.9) * np.sin(np.pi * (time_axis[burst] - position) / duration)
+        frequency = rng.uniform(100, 3000)
+        for channel in range(channels):
+            samples[burst, channel] += envelope * np.sin(2 * np.pi * frequency * time_axis[burst] + channel) + rng.normal(0, 0.01, burst.sum())
+        position += duration + rng.uniform(0, 0.6)
+    return np.clip(samples, -1, 1).astype(np.float32), sample_rate
+
+def load_audios(args):
+    import numpy as np
+    if args.source:
+        corpus = []
+        for name in sorted(os.listdir(args.source))[:args.audios]:
+            with open(os.path.join(args.source, name), "rb") as f:
+                corpus.append(codec_policy.decode_audio(f.read()))
+        return corpus
+    rng = np.random.default_rng(args.seed)
+    return [synthetic_audio(rng, args.audio_seconds, args.sample_rate, args.channels) for _ in range(args.audios)]
+
+def timed(clean, audios):
+    start = time.perf_counter()
+    cleaned = [clean(audio) for audio in audios]
+    return cleaned, 1000 * (time.perf_counter() - start) / len(audios)
+
+def snr(expected, actual):
+    import numpy as np
+    error = expected.astype(np.float64) - actual
+    signal = float((expected.astype(np.float64) ** 2).sum())
+    if not signal:
+        return float("inf"), float(np.abs(error).max(initial=0))
+    return 10 * np.log10(signal / max(float((error ** 2).sum()), 1e-20)), float(np.abs(error).max(initial=0))
+
+def parity(expected, actual, sample_rate=audio_kernel.TARGET_SAMPLE_RATE):
+    snrs = []
+    max_difference = 0.0
+    trim_difference = 0.0
+    for (e, _), (a, _) in zip(expected, actual):
+        frames = min(len(e), len(a))
+        trim_difference = max(trim_difference, 1000 * abs(len(e) - len(a)) / sample_rate)
+        # Aligned at the start or at the end, whichever edge was trimmed the same
+        clip_snr, clip_difference = max(snr(e[:frames], a[:frames]), snr(e[len(e) - frames:], a[len(a) - frames:]))
+        snrs.append(clip_snr)
+        max_difference = max(max_difference, clip_difference)
+    return {
+        "min_snr_db": min(snrs, default=float("inf")),
+        "max_difference": max_difference,
+        "max_trim_difference_ms": trim_difference,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audios", type=int, default=8)
+    parser.add_argument("--audio-seconds", type=float, default=10.0)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", help="Directory of audio files to use instead of a synthetic corpus")
+    parser.add_argument("--output", help="Defaults to benchmarks/results/audio-clean-<commit>.json")
+    args = parser.parse_args()
+
+    audios = load_audios(args)
+    seconds = sum(len(samples) / sample_rate for samples, sample_rate in audios)
+    print(f"-> {len(audios)} clips ({seconds:.1f} s of audio)")
+    # The first call imports SciPy; keep it out of the timing
+    audio_kernel.clean(audios[0])
+    expected, pydub_ms = timed(audio_kernel.pydub_clean, audios)
+    actual, kernel_ms = timed(audio_kernel.clean, audios)
+    result = {"audios": len(audios), "seconds": seconds, "pydub_ms": pydub_ms, "kernel_ms": kernel_ms, **parity(expected, actual)}
+    print(f"   pydub {pydub_ms:8.1f} ms  kernel {kernel_ms:7.1f} ms ({pydub_ms / kernel_ms:.1f}x)  min SNR {result['min_snr_db']:.1f} dB  max diff {result['max_difference']:.4f}  trim difference {result['max_trim_difference_ms']:.0f} ms")
+
+    failed = False
+    if result["min_snr_db"] < MIN_SNR:
+        print(f"   kernel output is too far from pydub's (SNR below {MIN_SNR} dB)")
+        failed = True
+    if result["max_trim_difference_ms"] > MAX_TRIM_DIFFERENCE_MS:
+        print(f"   silence was trimmed more than {MAX_TRIM_DIFFERENCE_MS} ms apart")
+        failed = True
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source": args.source or "synthetic",
+        "result": result,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"audio-clean-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
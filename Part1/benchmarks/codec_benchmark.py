@@ -0,0 +1,147 @@
+# Codec benchmark for the zone outputs (see src/codec_policy.py).
+#
+# Encodes the same images, audios and texts with every candidate codec and
+# reports the stored size, the compression ratio against the original PNG /
+# MP3 / plain outputs, and encode and decode time per object. The corpus is
+# synthetic (same generators as benchmark.py) unless --source points to a
+# directory with images/, audios/ and texts/ subdirectories, like the output/
+# folder of the data collection.
+#
+#   python benchmarks/codec_benchmark.py --images 50 --texts 50 --audios 10
+#   python benchmarks/codec_benchmark.py --source output --image-codecs "png,webp:lossless=1,avif:quality=60:speed=8"
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import MODALS, git_commit, synthetic_image, synthetic_text, synthetic_wav
+from src import codec_policy
+
+IMAGE_CODECS = "png,webp:lossless=1:method=4,webp:quality=90:method=4,jpeg:quality=90,avif:quality=75:speed=6,avif:quality=60:speed=8"
+AUDIO_CODECS = "mp3,opus:bitrate=96k,opus:bitrate=48k,flac,wav"
+TEXT_CODECS = "plain,zstd:level=3,zstd:level=19"
+
+def load_corpus(args):
+    # Raw bytes per modality, either generated or read from --source
+    corpus = {}
+    if args.source:
+        for modal in MODALS:
+            directory = os.path.join(args.source, modal)
+            names = sorted(os.listdir(directory))[:getattr(args, modal)] if os.path.isdir(directory) else []
+            corpus[modal] = []
+            for name in names:
+                with open(os.path.join(directory, name), "rb") as f:
+                    corpus[modal].append(f.read())
+        return corpus
+    rng = random.Random(args.seed)
+    corpus["images"] = [synthetic_image(rng, args.image_width, args.image_height) for _ in range(args.images)]
+    corpus["texts"] = [synthetic_text(rng, args.text_words) for _ in range(args.texts)]
+    corpus["audios"] = [synthetic_wav(rng, args.audio_seconds) for _ in range(args.audios)] if "audios" in MODALS else []
+    return corpus
+
+def decoders():
+    # Decoding as the next zone does it, forcing the lazy decoders to do the work
+    def decode_image(data):
+        from PIL import Image
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    return {"images": decode_image, "audios": codec_policy.decode_audio, "texts": codec_policy.decode}
+
+def encoder(modal, name):
+    codecs = {"images": codec_policy.IMAGE_CODECS, "audios": codec_policy.AUDIO_CODECS, "texts": codec_policy.TEXT_CODECS}[modal]
+    codec = codecs[name]
+    # Image and audio entries are (extension, encode)
+    return codec[1] if isinstance(codec, tuple) else codec
+
+def benchmark_codec(modal, spec, inputs, decode):
+    (name, options), = codec_policy.parse(f"{modal}={spec}").values()
+    encode = encoder(modal, name)
+    sizes, encode_seconds, decode_seconds = [], [], []
+    for item in inputs:
+        start = time.perf_counter()
+        data = encode(item, options)
+        encode_seconds.append(time.perf_counter() - start)
+        sizes.append(len(data))
+        start = time.perf_counter()
+        # Texts carry their codec in the object metadata instead of in the bytes
+        decode(data, name) if modal == "texts" else decode(data)
+        decode_seconds.append(time.perf_counter() - start)
+    return {
+        "modal": modal,
+        "codec": spec,
+        "objects": len(inputs),
+        "bytes": sum(sizes),
+        "encode_ms": 1000 * sum(encode_seconds) / len(inputs),
+        "decode_ms": 1000 * sum(decode_seconds) / len(inputs),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--texts", type=int, default=50)
+    parser.add_argument("--audios", type=int, default=5)
+    parser.add_argument("--image-width", type=int, default=600)
+    parser.add_argument("--image-height", type=int, default=400)
+    parser.add_argument("--text-words", type=int, default=400)
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", help="Directory with images/, audios/ and texts/ to use instead of a synthetic corpus")
+    parser.add_argument("--image-codecs", default=IMAGE_CODECS)
+    parser.add_argument("--audio-codecs", default=AUDIO_CODECS)
+    parser.add_argument("--text-codecs", default=TEXT_CODECS)
+    parser.add_argument("--output", help="Defaults to benchmarks/results/codecs-<commit>.json")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    decode = decoders()
+    # Codecs are compared on what the zones encode: decoded images and audios, UTF-8 texts
+    inputs = {"texts": corpus["texts"]}
+    for modal, prepare in (("images", lambda data: decode["images"](data).convert("RGB")), ("audios", decode["audios"])):
+        try:
+            inputs[modal] = [prepare(data) for data in corpus[modal]]
+        except Exception as e:
+            print(f"Skipping {modal}: could not decode the corpus ({e})")
+            inputs[modal] = []
+    candidates = {"images": args.image_codecs, "audios": args.audio_codecs, "texts": args.text_codecs}
+
+    results = []
+    for modal in MODALS:
+        if not inputs[modal]:
+            continue
+        print(f"-> {modal} ({len(inputs[modal])} objects)")
+        baseline = None
+        for spec in filter(None, candidates[modal].split(",")):
+            try:
+                result = benchmark_codec(modal, spec, inputs[modal], decode[modal])
+            except Exception as e:
+                print(f"   {spec}: failed ({e})")
+                continue
+            # The first codec of the list (the default policy) is the baseline
+            baseline = baseline or result["bytes"]
+            result["ratio"] = result["bytes"] / baseline
+            results.append(result)
+            print(f"   {spec:<28} {result['bytes'] / 1e6:9.3f} MB  {result['ratio']:6.2f}x  encode {result['encode_ms']:8.2f} ms  decode {result['decode_ms']:8.2f} ms")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source": args.source or "synthetic",
+        "results": results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"codecs-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,84 @@
+import argparse
+import os
 from src.zones.TemporalLanding import TemporalLanding
 from src.zones.PersistentLanding import PersistentLanding
 from src.zones.FormattedZone import FormattedZone
 from src.zones.TrustedZone import TrustedZone
+from src.zones.FusedZone import FusedZone
 from src.zones.DataCollection import DataCollection
+from src.work_queue import WorkQueue, run_worker
+from src import metrics
+from src import catalog
 
 SUPPORTED_MODALS = ["images", "audios", "texts"] # These are the data modals contemplated in our pipeline. Should this be extended. See Readme for information about how to do it.
 
-print("Starting data collection...")
-DataCollection.collect_data()
-DataCollection.upload_data("temporal-landing-zone")
+def report_metrics():
+    print(metrics.summary())
+    print(f"Stage metrics written to {metrics.METRICS_BUCKET}/{metrics.write_report()}")
 
-print("Starting data processing pipeline...")
-print("-> Temporal Landing Zone")
-temporal_landing = TemporalLanding(supported_modals = SUPPORTED_MODALS, bucket_origin = "temporal-landing-zone", bucket_destination = "persistent-landing-zone")
-temporal_landing.execute()
+# Guarded, as the engine's forkserver/spawn workers import this module
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="Reprocess every object instead of only the new or changed ones")
+    parser.add_argument("--streaming", action="store_true", help="Run every zone as a staged producer/consumer pipeline with bounded queues")
+    parser.add_argument("--resume", action="store_true", help="Continue every zone from where its last run stopped")
+    parser.add_argument("--fused", action="store_true", help="Run the Persistent, Formatted and Trusted zones in a single pass per object")
+    parser.add_argument("--coordinator", action="store_true", help="Shard the zones into leased work units for pipeline.py --worker processes instead of processing them here")
+    parser.add_argument("--worker", action="store_true", help="Process work units leased from the coordinator's queue until it is closed")
+    parser.add_argument("--packed-texts", action="store_true", help="Store the sentences of each text in one tar shard instead of one object per sentence")
+    parser.add_argument("--codec-policy", help="Codecs of the zone outputs, e.g. \"images=webp:lossless=1,texts=zstd\" (see src/codec_policy.py)")
+    args = parser.parse_args()
+    if args.packed_texts:
+        os.environ["PIPELINE_PACKED_TEXTS"] = "1"
+    if args.codec_policy:
+        os.environ["PIPELINE_CODEC_POLICY"] = args.codec_policy
+    incremental = not args.full
 
-print("-> Persistent Landing Zone")
-persistent_landing = PersistentLanding(supported_modals = SUPPORTED_MODALS, bucket_origin = "persistent-landing-zone", bucket_destination = "formatted-zone")
-persistent_landing.execute()
+    temporal_landing = TemporalLanding(supported_modals = SUPPORTED_MODALS, bucket_origin = "temporal-landing-zone", bucket_destination = "persistent-landing-zone", incremental = incremental)
+    fused_zone = FusedZone(supported_modals = SUPPORTED_MODALS, bucket_origin = "persistent-landing-zone", bucket_formatted = "formatted-zone", bucket_trusted = "trusted-zone", bucket_destination = "exploitation-zone", incremental = incremental)
+    persistent_landing = PersistentLanding(supported_modals = SUPPORTED_MODALS, bucket_origin = "persistent-landing-zone", bucket_destination = "formatted-zone", incremental = incremental)
+    formatted_zone = FormattedZone(supported_modals = SUPPORTED_MODALS, bucket_origin = "formatted-zone", bucket_destination = "trusted-zone", incremental = incremental)
+    trusted_zone = TrustedZone(supported_modals = SUPPORTED_MODALS, bucket_origin = "trusted-zone", bucket_destination="exploitation-zone", incremental = incremental)
+    staged_zones = [("Persistent Landing Zone", persistent_landing), ("Formatted Zone", formatted_zone), ("Trusted Zone", trusted_zone)]
 
-print("-> Formatted Zone")
-formatted_zone = FormattedZone(supported_modals = SUPPORTED_MODALS, bucket_origin = "formatted-zone", bucket_destination = "trusted-zone")
-formatted_zone.execute()
+    if os.getenv("PIPELINE_METRICS_PORT"):
+        metrics.serve(int(os.getenv("PIPELINE_METRICS_PORT")))
 
-print("-> Trusted Zone")
-trusted_zone = TrustedZone(supported_modals = SUPPORTED_MODALS, bucket_origin = "trusted-zone", bucket_destination="exploitation-zone")
-trusted_zone.execute()
\ No newline at end of file
+    if args.worker:
+        run_worker(WorkQueue(), {type(zone).__name__: zone for _, zone in staged_zones})
+        report_metrics()
+        return
+
+    if args.coordinator:
+        # Opened before the long data collection so that workers started
+        # alongside the coordinator wait for this run's units
+        queue = WorkQueue()
+        queue.open()
+
+    print("Starting data collection...")
+    DataCollection.collect_data()
+    DataCollection.upload_data("temporal-landing-zone")
+
+    print("Starting data processing pipeline...")
+    print("-> Temporal Landing Zone")
+    temporal_landing.execute(streaming = args.streaming, resume = args.resume)
+
+    if args.fused:
+        print("-> Persistent Landing + Formatted + Trusted Zones (fused)")
+        fused_zone.execute(streaming = args.streaming, resume = args.resume)
+    elif args.coordinator:
+        for name, zone in staged_zones:
+            print(f"-> {name} (distributed)")
+            zone.distribute(queue)
+        queue.close()
+    else:
+        for name, zone in staged_zones:
+            print(f"-> {name}")
+            zone.execute(streaming = args.streaming, resume = args.resume)
+
+    # Every zone run appends catalog parts; merge them so readers fetch one file per bucket
+    catalog.compact()
+    report_metrics()
+
+if __name__ == "__main__":
+    main()
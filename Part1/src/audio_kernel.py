@@ -0,0 +1,197 @@
+import math
+import numpy as np
+
+# Parameters of AudioObj.clean()
+TARGET_SAMPLE_RATE = 48000
+SILENCE_THRESHOLD = -50
+SILENCE_DURATION = 500
+# Silence is only trimmed when it starts or ends within this many ms of the edges
+SILENCE_EDGE = 1000
+HEADROOM = 0.1
+COMPRESSOR_THRESHOLD = -20.0
+COMPRESSOR_RATIO = 4.0
+COMPRESSOR_ATTACK = 5.0
+COMPRESSOR_RELEASE = 50.0
+HIGH_PASS = 80
+LOW_PASS = 16000
+GAIN = 2
+
+# The compressor's gain is computed once every this many samples and
+# interpolated in between
+COMPRESSOR_BLOCK = 16
+
+# AudioObj.clean() over a float64 NumPy array instead of pydub, whose
+# silence detection, compressor and filters loop per millisecond or per sample
+# in Python. Every step reproduces pydub's: the linear-interpolation resampler
+# of audioop.ratecv, the 500 ms RMS windows of detect_silence (from a running
+# sum of squares), its peak normalize, its compressor (RMS of the last 5 ms,
+# with its attack and release rules) and its one-pole high- and low-pass
+# filters, run by SciPy as two cascaded sections. pydub rounds to 16 bits after
+# every step and this kernel does not, and the compressor's gain runs at a
+# control rate of COMPRESSOR_BLOCK samples, so the results differ slightly
+# (see benchmarks/audio_clean_benchmark.py).
+def pydub_clean(audio):
+    # The original pydub chain, on (samples, sample_rate); for comparisons
+    from pydub.effects import normalize, compress_dynamic_range
+    from pydub.silence import detect_silence
+    from src import codec_policy
+    segment = codec_policy.to_segment(audio)
+    segment = segment.set_frame_rate(TARGET_SAMPLE_RATE)
+    segment = segment.set_channels(1)
+    silence_ranges = detect_silence(segment, min_silence_len=SILENCE_DURATION, silence_thresh=SILENCE_THRESHOLD)
+    if silence_ranges:
+        if silence_ranges[-1][1] > len(segment) - SILENCE_EDGE:
+            segment = segment[:silence_ranges[-1][0]]
+        if silence_ranges[0][0] < SILENCE_EDGE:
+            segment = segment[silence_ranges[0][1]:]
+    segment = normalize(segment, headroom=HEADROOM)
+    segment = compress_dynamic_range(segment, threshold=COMPRESSOR_THRESHOLD, ratio=COMPRESSOR_RATIO, attack=COMPRESSOR_ATTACK, release=COMPRESSOR_RELEASE)
+    segment = segment.high_pass_filter(HIGH_PASS)
+    segment = segment.low_pass_filter(LOW_PASS)
+    segment = normalize(segment, headroom=HEADROOM)
+    segment = segment + GAIN
+    return codec_policy.from_segment(segment)
+
+def _signal():
+    try:
+        from scipy import signal
+    except ImportError:
+        raise ImportError("The audio cleaning kernel requires SciPy: pip install scipy")
+    return signal
+
+def db_to_gain(db):
+    return 10 ** (db / 20)
+
+def resample(samples, sample_rate, target_rate=TARGET_SAMPLE_RATE):
+    # audioop.ratecv: output k is the linear interpolation of the input at
+    # k * sample_rate / target_rate, up to the last input sample
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+    divisor = math.gcd(sample_rate, target_rate)
+    step, rate = sample_rate // divisor, target_rate // divisor
+    positions = np.arange((len(samples) - 1) * rate // step + 1) * (step / rate)
+    before = positions.astype(np.int64)
+    after = np.minimum(before + 1, len(samples) - 1)
+    return samples[before] + (positions - before) * (samples[after] - samples[before])
+
+def windowed_rms(squares_sum, starts, ends):
+    # RMS of [start, end) from the running sum of squares, with the frames past
+    # the end counted as silence (like pydub's slices); empty windows are 0
+    last = len(squares_sum) - 1
+    energy = (squares_sum[np.minimum(ends, last)] - squares_sum[np.minimum(starts, last)]) / np.maximum(ends - starts, 1)
+    return np.sqrt(np.maximum(energy, 0))
+
+def running_squares(samples):
+    squares_sum = np.zeros(len(samples) + 1)
+    np.cumsum(samples * samples, out=squares_sum[1:])
+    return squares_sum
+
+def trim_silence(samples, sample_rate=TARGET_SAMPLE_RATE):
+    # detect_silence: the 500 ms windows starting at every ms whose RMS is at
+    # most -50 dBFS are silent, and silent windows less than 500 ms apart are
+    # one range. The first and last ranges are cut when they touch the edges.
+    length = round(len(samples) * 1000 / sample_rate)
+    if length < SILENCE_DURATION:
+        return samples
+    starts = np.arange(length - SILENCE_DURATION + 1)
+    frames = lambda ms: ms * sample_rate // 1000
+    rms = windowed_rms(running_squares(samples), frames(starts), frames(starts + SILENCE_DURATION))
+    silent = starts[rms <= db_to_gain(SILENCE_THRESHOLD)]
+    if len(silent) == 0:
+        return samples
+    breaks = np.flatnonzero(np.diff(silent) > SILENCE_DURATION)
+    first = (silent[0], (silent[breaks[0]] if len(breaks) else silent[-1]) + SILENCE_DURATION)
+    last = (silent[breaks[-1] + 1] if len(breaks) else silent[0], silent[-1] + SILENCE_DURATION)
+    end = len(samples)
+    if last[1] > length - SILENCE_EDGE:
+        end = frames(min(last[0], length))
+    start = frames(min(first[1], length)) if first[0] < SILENCE_EDGE else 0
+    return samples[start:max(start, end)]
+
+def normalize(samples):
+    # Peak at -HEADROOM dBFS; silence is left as it is
+    peak = np.abs(samples).max(initial=0)
+    return samples * (db_to_gain(-HEADROOM) / peak) if peak else samples
+
+def compress(samples, sample_rate=TARGET_SAMPLE_RATE):
+    # compress_dynamic_range: the attenuation target of a sample is set by
+    # the RMS of the 5 ms before it. pydub moves the attenuation towards it by
+    # target/attack (up) or target/release (down) per sample while the RMS is
+    # above the threshold, and holds it while it is below. The same rules are
+    # applied once per block, with the steps of its samples above the threshold.
+    if len(samples) == 0:
+        return samples
+    look = int(COMPRESSOR_ATTACK * sample_rate / 1000)
+    attack = COMPRESSOR_ATTACK * sample_rate / 1000
+    release = COMPRESSOR_RELEASE * sample_rate / 1000
+    # Sample i looks at [i - look, i), shorter at the start
+    squares_sum = running_squares(samples)[:-1]
+    before = np.zeros(len(samples))
+    before[look:] = squares_sum[:len(squares_sum) - look]
+    lengths = np.minimum(np.arange(len(samples)), look)
+    rms = np.sqrt(np.maximum(squares_sum - before, 0) / np.maximum(lengths, 1))
+    threshold = db_to_gain(COMPRESSOR_THRESHOLD)
+    above = rms > threshold
+    target = np.zeros(len(samples))
+    target[above] = (1 - 1 / COMPRESSOR_RATIO) * 20 * np.log10(rms[above] / threshold)
+
+    blocks = -(-len(samples) // COMPRESSOR_BLOCK)
+    padding = blocks * COMPRESSOR_BLOCK - len(samples)
+    steps = np.pad(above, (0, padding)).reshape(blocks, COMPRESSOR_BLOCK).sum(axis=1)
+    totals = np.pad(target, (0, padding)).reshape(blocks, COMPRESSOR_BLOCK).sum(axis=1)
+    # Blocks with no sample above the threshold hold the attenuation
+    active = np.flatnonzero(steps)
+    levels = totals[active] / steps[active]
+    current = 0.0
+    ends = []
+    for up, down, level in zip((totals[active] / attack).tolist(), (totals[active] / release).tolist(), levels.tolist()):
+        if current <= level:
+            current = current + up if current + up < level else level
+        else:
+            # Released below the target, pydub climbs back to it within a few samples
+            current = current - down if current - down > level else level
+        ends.append(current)
+    held = np.zeros(blocks + 1, dtype=np.int64)
+    held[active + 1] = active + 1
+    np.maximum.accumulate(held, out=held)
+    attenuation = np.zeros(blocks + 1)
+    attenuation[active + 1] = ends
+    attenuation = attenuation[held]
+    # Gain of every sample, interpolated between the block ends
+    gains = db_to_gain(-attenuation)
+    ramp = np.arange(1, COMPRESSOR_BLOCK + 1) / COMPRESSOR_BLOCK
+    per_sample = (gains[:-1, None] + (gains[1:] - gains[:-1])[:, None] * ramp).ravel()
+    return samples * per_sample[:len(samples)]
+
+def filter_band(samples, sample_rate=TARGET_SAMPLE_RATE):
+    # pydub's one-pole high-pass at HIGH_PASS Hz, then one-pole low-pass at
+    # LOW_PASS Hz, both starting from the first sample, as one sosfilt call
+    if len(samples) == 0:
+        return samples
+    dt = 1 / sample_rate
+    rc_high, rc_low = 1 / (2 * math.pi * HIGH_PASS), 1 / (2 * math.pi * LOW_PASS)
+    high = rc_high / (rc_high + dt)
+    low = dt / (rc_low + dt)
+    sections = np.array([
+        [high, -high, 0, 1, -high, 0],
+        [low, 0, 0, 1, low - 1, 0],
+    ])
+    state = np.array([[(1 - high) * samples[0], 0], [(1 - low) * samples[0], 0]])
+    filtered, _ = _signal().sosfilt(sections, samples, zi=state)
+    return np.clip(filtered, -1, 1)
+
+def clean(audio):
+    # (samples, sample_rate) -> (samples, TARGET_SAMPLE_RATE), samples being a
+    # float32 (frames, channels) array in [-1, 1]; the output is mono
+    samples, sample_rate = audio
+    # Mean of the channels, like audioop.tomono
+    mono = samples.astype(np.float64) @ np.full(samples.shape[1], 1 / samples.shape[1])
+    mono = resample(mono, sample_rate)
+    mono = trim_silence(mono)
+    mono = normalize(mono)
+    mono = compress(mono)
+    mono = filter_band(mono)
+    mono = normalize(mono)
+    # pydub clips to 16 bits
+    mono = np.clip(mono * db_to_gain(GAIN), -1, 32767 / 32768)
+    return mono.astype(np.float32)[:, None], TARGET_SAMPLE_RATE
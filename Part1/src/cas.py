@@ -0,0 +1,72 @@
+import hashlib
+import os
+import threading
+from botocore.exceptions import ClientError
+from src.minio_connection import MinIOConnection
+from src import metrics
+from src import codec_policy
+
+# Optional content-addressed layer (PIPELINE_CONTENT_ADDRESSED=1). Bytes are
+# stored once per bucket under .cas/sha256/<xx>/<digest>; the logical key
+# becomes a small pointer object whose body is the digest and whose metadata
+# names the blob. Identical content is therefore uploaded and stored once, and
+# pointers to the same content share an ETag. Readers go through read() /
+# physical_key(), which follow pointers and return plain objects unchanged.
+CAS_PREFIX = ".cas/sha256/"
+POINTER_METADATA = "cas-blob"
+
+_known_blobs = set()
+_lock = threading.Lock()
+
+def enabled():
+    return os.getenv("PIPELINE_CONTENT_ADDRESSED", "0") == "1"
+
+def blob_key(digest):
+    return f"{CAS_PREFIX}{digest[:2]}/{digest}"
+
+def put(bucket, key, data, put_object, metadata=None):
+    # put_object(bucket, key, data, metadata) does the actual upload and returns its result
+    digest = hashlib.sha256(data).hexdigest()
+    if _blob_exists(bucket, digest):
+        metrics.record("cas_hit", 0, 0, bytes_in=len(data))
+    else:
+        put_object(bucket, blob_key(digest), data, metadata)
+        with _lock:
+            _known_blobs.add((bucket, digest))
+    # metadata (e.g. the codec of a compressed text) goes on the pointer, which readers see first
+    return put_object(bucket, key, digest.encode("ascii"), {**(metadata or {}), POINTER_METADATA: digest})
+
+def _blob_exists(bucket, digest):
+    with _lock:
+        if (bucket, digest) in _known_blobs:
+            return True
+    try:
+        MinIOConnection().head_object(Bucket=bucket, Key=blob_key(digest))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    with _lock:
+        _known_blobs.add((bucket, digest))
+    return True
+
+def resolve(bucket, response):
+    # Body of a get_object response, following the pointer if it is one and
+    # undoing transparent compression (see src/codec_policy.py). Bodies are
+    # closed once read, which releases the mapping of a local-storage object.
+    metadata = response.get("Metadata", {})
+    digest = metadata.get(POINTER_METADATA)
+    with response["Body"] as body:
+        data = body.read() if digest is None else None
+    if digest is not None:
+        with MinIOConnection().get_object(Bucket=bucket, Key=blob_key(digest))["Body"] as body:
+            data = body.read()
+    return codec_policy.decode(data, metadata.get(codec_policy.CODEC_METADATA))
+
+def read(bucket, key):
+    return resolve(bucket, MinIOConnection().get_object(Bucket=bucket, Key=key))
+
+def physical_key(bucket, key):
+    # Key that holds the bytes of a logical key, for ranged reads
+    digest = MinIOConnection().head_object(Bucket=bucket, Key=key).get("Metadata", {}).get(POINTER_METADATA)
+    return key if digest is None else blob_key(digest)
@@ -0,0 +1,163 @@
+import io
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from src.minio_connection import MinIOConnection
+
+CATALOG_BUCKET = "pipeline-catalog"
+# Rows buffered by a writer before they are written out as a Parquet part
+FLUSH_ROWS = int(os.getenv("PIPELINE_CATALOG_FLUSH_ROWS", 10000))
+
+# Columns of the catalog and their pandas dtypes. Every part file has all of
+# them, so parts written by different zones concatenate cleanly.
+SCHEMA = {
+    "bucket": "string",
+    "key": "string",
+    "etag": "string",
+    "size": "Int64",
+    "modality": "string",
+    "zone": "string",
+    "source_bucket": "string",
+    "source_key": "string",
+    "source_etag": "string",
+    "width": "Int64",
+    "height": "Int64",
+    "duration_seconds": "float64",
+    "sample_rate": "Int64",
+    "channels": "Int64",
+    "chunks": "Int64",
+    "characters": "Int64",
+    "written_at": "datetime64[ns, UTC]",
+}
+
+# Columnar catalog of every object the zones write: one row per write with its
+# size, ETag, modality, content attributes (dimensions, duration, chunk
+# counts), the object it was produced from and when. Writers append Parquet
+# parts under CATALOG_BUCKET/<bucket>/, so writing never rewrites existing
+# data; load() reads the parts of a bucket and keeps the latest row per key.
+def enabled():
+    return os.getenv("PIPELINE_CATALOG", "1") == "1"
+
+def lineage(bucket, objs):
+    # Source of the outputs produced from objs; a single object is named by key and ETag
+    if len(objs) == 1:
+        return {"Bucket": bucket, "Key": objs[0]["Key"], "ETag": objs[0]["ETag"]}
+    return {"Bucket": bucket}
+
+class CatalogWriter:
+    def __init__(self, zone_name, bucket):
+        self.zone_name = zone_name
+        self.bucket = bucket
+        self.rows = []
+        self._lock = threading.Lock()
+
+    def record(self, written, modal, attributes=None, source=None):
+        # written: list of {"Key", "ETag", "Size"}; source: {"Bucket", "Key", "ETag"} it was produced from
+        if not enabled():
+            return
+        source = source or {}
+        now = datetime.now(timezone.utc)
+        rows = [{
+            "bucket": self.bucket,
+            "key": obj["Key"],
+            "etag": obj["ETag"],
+            "size": obj["Size"],
+            "modality": modal,
+            "zone": self.zone_name,
+            "source_bucket": source.get("Bucket"),
+            "source_key": source.get("Key"),
+            "source_etag": source.get("ETag"),
+            **(attributes or {}),
+            "written_at": now,
+        } for obj in written]
+        with self._lock:
+            self.rows.extend(rows)
+            full = len(self.rows) >= FLUSH_ROWS
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return
+        try:
+            write_part(self.bucket, frame(rows))
+        except Exception as e:
+            print(f"Failed to write {len(rows)} catalog rows of {self.bucket}: {e}")
+            # Kept for the next flush
+            with self._lock:
+                self.rows = rows + self.rows
+
+def frame(rows):
+    import pandas as pd
+    return pd.DataFrame(rows, columns=list(SCHEMA)).astype(SCHEMA)
+
+def write_part(bucket, df):
+    minio_client = MinIOConnection()
+    try:
+        minio_client.create_bucket(Bucket=CATALOG_BUCKET)
+    except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
+        pass
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    key = f"{bucket}/{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex[:8]}.parquet"
+    minio_client.put_object(Bucket=CATALOG_BUCKET, Key=key, Body=buffer.getvalue())
+    return key
+
+def part_keys(bucket=None):
+    paginator = MinIOConnection().get_paginator("list_objects_v2")
+    try:
+        return [obj["Key"] for page in paginator.paginate(Bucket=CATALOG_BUCKET, Prefix=f"{bucket}/" if bucket else "") for obj in page.get("Contents", []) if obj["Key"].endswith(".parquet")]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchBucket", "404"):
+            return []
+        raise
+
+def read_parts(keys):
+    import pandas as pd
+    minio_client = MinIOConnection()
+    parts = []
+    for key in keys:
+        with minio_client.get_object(Bucket=CATALOG_BUCKET, Key=key)["Body"] as body:
+            parts.append(pd.read_parquet(io.BytesIO(body.read())))
+    return pd.concat(parts, ignore_index=True).astype(SCHEMA) if parts else frame([])
+
+def latest(df):
+    return df.sort_values("written_at", kind="stable").drop_duplicates(["bucket", "key"], keep="last").reset_index(drop=True)
+
+def load(bucket=None, modality=None, history=False):
+    # Catalog of one bucket (or of all of them) as a pandas DataFrame. Unless
+    # history is set, only the latest row of every object is kept.
+    df = read_parts(part_keys(bucket))
+    if not history:
+        df = latest(df)
+    if modality is not None:
+        df = df[df["modality"] == modality].reset_index(drop=True)
+    return df
+
+def query(sql, bucket=None):
+    # Runs SQL with DuckDB against the latest catalog rows, exposed as the table "catalog"
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("Querying the catalog with SQL requires duckdb: pip install duckdb")
+    connection = duckdb.connect()
+    connection.register("catalog", load(bucket))
+    return connection.execute(sql).df()
+
+def compact(bucket=None):
+    # Merges the parts of each bucket into a single one. Parts written while
+    # compacting are left alone, since only the parts that were read are deleted.
+    minio_client = MinIOConnection()
+    by_bucket = {}
+    for key in part_keys(bucket):
+        by_bucket.setdefault(key.split("/", 1)[0], []).append(key)
+    for name, keys in by_bucket.items():
+        if len(keys) < 2:
+            continue
+        write_part(name, latest(read_parts(keys)))
+        for key in keys:
+            minio_client.delete_object(Bucket=CATALOG_BUCKET, Key=key)
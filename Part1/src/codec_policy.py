@@ -0,0 +1,178 @@
+import io
+import os
+import threading
+import numpy as np
+
+# Codec used for every object a zone writes, chosen per destination bucket and
+# modality. PIPELINE_CODEC_POLICY is a comma-separated list of
+# "[<bucket>/]<modal>=<codec>[:<option>=<value>...]" entries; an entry for a
+# bucket overrides the one for the whole modality, e.g.
+#
+#   PIPELINE_CODEC_POLICY="images=webp:lossless=1:method=4,exploitation-zone/images=avif:quality=70:speed=8,audios=opus:bitrate=96k,texts=zstd:level=6"
+#
+# The defaults keep the original outputs: PNG images, MP3 audios, plain texts.
+DEFAULT_POLICY = "images=png,audios=mp3,texts=plain"
+
+# User metadata naming the codec of a compressed object; objects without it are read as they are
+CODEC_METADATA = "content-codec"
+
+_parsed = {}
+_lock = threading.Lock()
+_zstd = threading.local()
+
+def parse(spec):
+    policy = {}
+    for entry in filter(None, (entry.strip() for entry in spec.split(","))):
+        target, codec = entry.split("=", 1)
+        name, *options = codec.split(":")
+        policy[target.strip()] = (name.strip().lower(), dict(_parse_option(option) for option in options))
+    return policy
+
+def _parse_option(option):
+    name, value = option.split("=", 1)
+    for convert in (int, float):
+        try:
+            return name, convert(value)
+        except ValueError:
+            pass
+    return name, value
+
+def policy():
+    # Read at call time so pipeline.py and the benchmarks can switch it per run
+    spec = os.getenv("PIPELINE_CODEC_POLICY", "")
+    with _lock:
+        if spec not in _parsed:
+            _parsed[spec] = {**parse(DEFAULT_POLICY), **parse(spec)}
+        return _parsed[spec]
+
+def codec_for(bucket, modal):
+    # (name, options) of the codec for objects of a modality written to a bucket
+    current = policy()
+    return current.get(f"{bucket}/{modal}") or current[modal]
+
+# Images: PIL images -> (extension, bytes)
+def _save_image(image, format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+def _rgb(image):
+    # JPEG has no alpha channel or palette
+    return image if image.mode in ("RGB", "L") else image.convert("RGB")
+
+IMAGE_CODECS = {
+    "png": (".png", lambda image, options: _save_image(image, "PNG", compress_level=options.get("level", 6))),
+    "webp": (".webp", lambda image, options: _save_image(image, "WEBP", lossless=bool(options.get("lossless", 0)), quality=options.get("quality", 80), method=options.get("method", 4))),
+    "jpeg": (".jpg", lambda image, options: _save_image(_rgb(image), "JPEG", quality=options.get("quality", 90), optimize=bool(options.get("optimize", 0)), progressive=bool(options.get("progressive", 0)))),
+    "avif": (".avif", lambda image, options: _save_image(image, "AVIF", quality=options.get("quality", 75), speed=options.get("speed", 6))),
+}
+
+def choose(bucket, modal, codec=None):
+    # codec overrides the policy; it is a codec spec without the modality, e.g. "webp:quality=80"
+    if codec is not None:
+        return parse(f"{modal}={codec}")[modal]
+    return codec_for(bucket, modal)
+
+def extension(modal, codec=None):
+    # Extension of the keys written with codec, or with the modality's default policy
+    codecs = {"images": IMAGE_CODECS, "audios": AUDIO_CODECS}[modal]
+    return codecs[choose(None, modal, codec)[0]][0]
+
+def encode_image(image, bucket, codec=None):
+    name, options = choose(bucket, "images", codec)
+    extension, encode = IMAGE_CODECS[name]
+    return extension, encode(image, options)
+
+# Audios: (samples, sample_rate) -> (extension, bytes), where samples is a
+# float32 (frames, channels) array in [-1, 1]. WAV and FLAC are encoded in
+# this process by libsndfile; MP3 and Opus take one ffmpeg run.
+def _soundfile():
+    try:
+        import soundfile
+    except ImportError:
+        raise ImportError("Audio decoding and encoding requires soundfile: pip install soundfile")
+    return soundfile
+
+def pcm16(samples):
+    return np.clip(np.rint(samples * 32768), -32768, 32767).astype("<i2")
+
+def to_segment(audio):
+    # pydub segment of 16-bit samples, built in memory
+    from pydub import AudioSegment
+    samples, sample_rate = audio
+    return AudioSegment(data=pcm16(samples).tobytes(), sample_width=2, frame_rate=sample_rate, channels=samples.shape[1])
+
+def from_segment(segment):
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32).reshape(-1, segment.channels)
+    return samples / (1 << (8 * segment.sample_width - 1)), segment.frame_rate
+
+def decode_audio(data):
+    # libsndfile decodes WAV, FLAC, Ogg and MP3 in this process; other formats take one ffmpeg run
+    soundfile = _soundfile()
+    try:
+        return soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except soundfile.LibsndfileError:
+        from pydub import AudioSegment
+        return from_segment(AudioSegment.from_file(io.BytesIO(data)))
+
+def _write_audio(audio, format, **params):
+    samples, sample_rate = audio
+    buffer = io.BytesIO()
+    _soundfile().write(buffer, samples, sample_rate, format=format, subtype="PCM_16", **params)
+    return buffer.getvalue()
+
+def _flac_level(options):
+    # libsndfile takes the compression level as 0-1; only passed when set, as older soundfiles do not know it
+    return {"compression_level": options["level"] / 8} if "level" in options else {}
+
+def _export_audio(audio, format, **params):
+    buffer = io.BytesIO()
+    to_segment(audio).export(buffer, format=format, **params)
+    return buffer.getvalue()
+
+AUDIO_CODECS = {
+    "mp3": (".mp3", lambda audio, options: _export_audio(audio, "mp3", bitrate=options.get("bitrate"))),
+    "opus": (".opus", lambda audio, options: _export_audio(audio, "opus", codec="libopus", bitrate=options.get("bitrate", "96k"))),
+    "flac": (".flac", lambda audio, options: _write_audio(audio, "FLAC", **_flac_level(options))),
+    "wav": (".wav", lambda audio, options: _write_audio(audio, "WAV")),
+}
+
+def encode_audio(audio, bucket, codec=None):
+    name, options = choose(bucket, "audios", codec)
+    extension, encode = AUDIO_CODECS[name]
+    return extension, encode(audio, options)
+
+# Texts: UTF-8 bytes -> bytes. zstd is transparent: the key keeps its extension,
+# the object is marked with CODEC_METADATA, and decode() (called by every
+# reader through cas.resolve) restores the text of marked objects.
+TEXT_CODECS = {
+    "plain": lambda data, options: data,
+    "zstd": lambda data, options: _zstandard().ZstdCompressor(level=options.get("level", 3)).compress(data),
+}
+
+def encode_text(data, bucket):
+    # Returns the bytes to store and their metadata (None when stored as they are)
+    name, options = codec_for(bucket, "texts")
+    encoded = TEXT_CODECS[name](data, options)
+    # Short chunks do not shrink; those are stored as they are
+    if name == "plain" or len(encoded) >= len(data):
+        return data, None
+    return encoded, {CODEC_METADATA: name}
+
+def decode(data, codec=None):
+    # codec is the CODEC_METADATA of the object, if it has one
+    if codec is None or codec == "plain":
+        return data
+    if codec != "zstd":
+        raise ValueError(f"Unknown content codec {codec}")
+    decompressor = getattr(_zstd, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd.decompressor = _zstandard().ZstdDecompressor()
+    return decompressor.decompress(data)
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The zstd text codec requires zstandard: pip install zstandard")
+    return zstandard
@@ -1,38 +1,52 @@
 import re
 import unicodedata
 from src.dataobj.ADataObj import ADataObj
-from src.minio_connection import MinIOConnection
+from src import uploader
+from src import shards
+from src import codec_policy
 from src.chroma_connection import ChromaConnection
+from src import metrics
 from src.embedder import embed_text
-import os
 import io
 
 class TextObj(ADataObj):
     def __init__(self, key, text_data):
-        self.path_prefix = key.split("/")[0]
-        split_filename = os.path.splitext(key.split("/")[1])
-        self.filename = split_filename[0]
-        self.extension = split_filename[1].lower()
+        self.set_key(key)
         self.texts = [text_data.decode("utf-8", errors="ignore")]
         self.embeddings = []
 
-    def save(self, bucket_destination, chromadb: bool=False, collection_name: str=None):        
+    def serialize(self, bucket_destination=None):
+        outputs = []
         for i, text in enumerate(self.texts):
-            buffer = io.BytesIO(text.encode('utf-8'))
-            key = self.path_prefix + "/" + self.filename + f"_{i}" + self.extension
-            minio_client = MinIOConnection()
-            minio_client.upload_fileobj(Fileobj=buffer, Bucket=bucket_destination, Key=key)
-            minio_client.head_object(Bucket=bucket_destination, Key=key)
+            data, metadata = codec_policy.encode_text(text.encode('utf-8'), bucket_destination)
+            outputs.append((self.path_prefix + "/" + self.filename + f"_{i}" + self.extension, data, metadata))
+        return outputs
+
+    def save(self, bucket_destination, chromadb: bool=False, collection_name: str=None):        
+        outputs = self.outputs(bucket_destination)
+        if shards.packed_texts() and len(outputs) > 1:
+            # One shard per document instead of one object per chunk. Chunks are
+            # stored uncompressed so that they can be read with ranged GETs.
+            shard_key = self.path_prefix + "/" + self.filename + ".tar"
+            written, ids = shards.write_shard(bucket_destination, shard_key, [(text.encode('utf-8'), {"key": key}) for (key, _, _), text in zip(outputs, self.texts)])
+        else:
+            written = uploader.put_many(bucket_destination, outputs)
+            ids = [key for key, _, _ in outputs]
         
-            if chromadb:
-                chroma_client = ChromaConnection()
-                collection_str = f"text_{collection_name}"
-                collection = chroma_client.get_or_create_collection(name=collection_str)
-                collection.add(
-                    documents=[text],
-                    embeddings=[self.embeddings[i]],
-                    ids=[key]
+        if chromadb and outputs:
+            chroma_client = ChromaConnection()
+            collection_str = f"text_{collection_name}"
+            collection = chroma_client.get_or_create_collection(name=collection_str)
+            with metrics.timed("chroma_upsert"):
+                collection.upsert(
+                    documents=[self.texts[i] for i in range(len(outputs))],
+                    embeddings=[self.embeddings[i] for i in range(len(outputs))],
+                    ids=ids
                 )
+        return written
+
+    def catalog_attributes(self):
+        return {"chunks": len(self.texts), "characters": sum(len(text) for text in self.texts)}
 
     def format(self):
         for text in self.texts:
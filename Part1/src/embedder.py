@@ -1,27 +1,49 @@
-import torch
-from imagebind.models.imagebind_model import imagebind_huge, ModalityType
-from imagebind import data
-from pydub import AudioSegment
 import os
-from PIL import Image
+import tempfile
+import threading
 
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-model = imagebind_huge(pretrained=True)
-model.eval()
-model.to(device)
+# torch and imagebind are imported, and the model loaded onto the device, the
+# first time something is embedded, so zones that never embed start instantly.
+model = None
+device = None
+_load_lock = threading.Lock()
 
-def embed_image(image: Image):
+# Zones call the embedder from several I/O threads; inference is serialized so
+# the threads only overlap on network work.
+_model_lock = threading.Lock()
+
+def get_model():
+    global model, device
+    if model is None:
+        with _load_lock:
+            if model is None:
+                import torch
+                from imagebind.models.imagebind_model import imagebind_huge
+                device = "cuda:0" if torch.cuda.is_available() else "cpu"
+                loaded = imagebind_huge(pretrained=True)
+                loaded.eval()
+                loaded.to(device)
+                model = loaded
+    return model
+
+def embed_image(image):
     try:
-        image.save("/tmp/temp_image_file", format='PNG')
+        import torch
+        from imagebind import data
+        from imagebind.models.imagebind_model import ModalityType
+        model = get_model()
+        fd, temp_image_file = tempfile.mkstemp()
+        os.close(fd)
+        image.save(temp_image_file, format='PNG')
 
         inputs = {
-            ModalityType.VISION: data.load_and_transform_vision_data(["/tmp/temp_image_file"], device)
+            ModalityType.VISION: data.load_and_transform_vision_data([temp_image_file], device)
         }
-        with torch.no_grad():
+        with _model_lock, torch.no_grad():
             embeddings = model(inputs)
 
         image_vector = embeddings[ModalityType.VISION].squeeze(0)
-        os.remove("/tmp/temp_image_file")
+        os.remove(temp_image_file)
         return image_vector
     except Exception as e:
         print(f"Error processing image bytes: {e}")
@@ -29,11 +51,15 @@ def embed_image(image: Image):
 
 def embed_text(text):
     try:
+        import torch
+        from imagebind import data
+        from imagebind.models.imagebind_model import ModalityType
+        model = get_model()
         inputs = {
             ModalityType.TEXT: data.load_and_transform_text([text], device),
         }
 
-        with torch.no_grad():
+        with _model_lock, torch.no_grad():
             embeddings = model(inputs)
 
         text_vector = embeddings[ModalityType.TEXT]
@@ -43,19 +69,30 @@ def embed_text(text):
         return None
 
 
-def embed_audio(audio: AudioSegment):
+def embed_audio(audio):
+    # audio: (samples, sample_rate) of an AudioObj
     try:
-        audio.export("/tmp/temp_audio_file", format="wav")
+        import io
+        import torch
+        import soundfile
+        from imagebind import data
+        from imagebind.models.imagebind_model import ModalityType
+        model = get_model()
+        # ImageBind loads audio with torchaudio, which also reads file objects,
+        # so the WAV never touches the disk
+        samples, sample_rate = audio
+        wav = io.BytesIO()
+        soundfile.write(wav, samples, sample_rate, format="WAV", subtype="PCM_16")
+        wav.seek(0)
 
         inputs = {
-            ModalityType.AUDIO: data.load_and_transform_audio_data(["/tmp/temp_audio_file"], device),
+            ModalityType.AUDIO: data.load_and_transform_audio_data([wav], device),
         }
 
-        with torch.no_grad():
+        with _model_lock, torch.no_grad():
             embeddings = model(inputs)
         
         audio_vector = embeddings[ModalityType.AUDIO].squeeze(0)
-        os.remove("/tmp/temp_audio_file")
         return audio_vector
     except Exception as e:
         print(f"Error processing audio bytes: {e}")
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from tqdm import tqdm
+from src import metrics
+
+DEFAULT_IO_WORKERS = int(os.getenv("PIPELINE_IO_WORKERS", 16))
+DEFAULT_CPU_WORKERS = int(os.getenv("PIPELINE_CPU_WORKERS", os.cpu_count() or 1))
+# Pools are created while other threads run (e.g. ModalityScheduler's) and may
+# hold a lock, which a forked child would inherit held. forkserver workers are
+# forked from a clean single-threaded server instead; spawn where it is missing.
+START_METHOD = os.getenv("PIPELINE_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+def cpu_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+
+# Thread pool for network-bound steps (MinIO / ChromaDB) and process pool for
+# CPU-bound steps (decode, format(), clean()). cpu_workers=0 runs them inline.
+# Fire-and-forget writes go to a separate background pool so that tasks on the
+# I/O pool can wait on them without starving it. An engine can borrow a
+# process pool shared with other engines (see scheduler.py); it then runs at
+# most cpu_workers tasks on it at a time and leaves it open on exit.
+class ExecutionEngine:
+
+    def __init__(self, io_workers=None, cpu_workers=None, shared_cpu_pool=None):
+        self.io_workers = io_workers if io_workers is not None else DEFAULT_IO_WORKERS
+        self.cpu_workers = cpu_workers if cpu_workers is not None else DEFAULT_CPU_WORKERS
+        self._shared_cpu_pool = shared_cpu_pool
+        self._io_pool = None
+        self._cpu_pool = None
+        self._cpu_slots = None
+        self._background_pool = None
+
+    def __enter__(self):
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers)
+        self._background_pool = ThreadPoolExecutor(max_workers=self.io_workers)
+        if self.cpu_workers > 0 and self._shared_cpu_pool is not None:
+            self._cpu_pool = self._shared_cpu_pool
+            self._cpu_slots = threading.BoundedSemaphore(self.cpu_workers)
+        elif self.cpu_workers > 0:
+            self._cpu_pool = cpu_pool(self.cpu_workers)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._io_pool.shutdown(wait=True)
+        self._background_pool.shutdown(wait=True)
+        if self._cpu_pool is not None and self._cpu_pool is not self._shared_cpu_pool:
+            self._cpu_pool.shutdown(wait=True)
+        self._io_pool = None
+        self._cpu_pool = None
+        self._cpu_slots = None
+        self._background_pool = None
+
+    def run_cpu(self, fn, *args):
+        if self._cpu_pool is None:
+            return fn(*args)
+        if self._cpu_slots is None:
+            return self._submit_cpu(fn, *args)
+        with self._cpu_slots:
+            return self._submit_cpu(fn, *args)
+
+    def _submit_cpu(self, fn, *args):
+        result, samples, worker_rss = self._cpu_pool.submit(metrics.run_collected, metrics.current_context(), fn, *args).result()
+        metrics.merge(samples, worker_rss)
+        return result
+
+    def submit_background(self, fn, *args):
+        return self._background_pool.submit(metrics.run_in_context, metrics.current_context(), fn, *args)
+
+    def map(self, fn, items, desc=None, total=None, position=None):
+        # Results are yielded in submission order, and at most 2 * io_workers
+        # items are in flight so memory stays bounded on large buckets.
+        in_flight = deque()
+        max_in_flight = self.io_workers * 2
+        labels = metrics.current_context()
+        with tqdm(total=total, desc=desc, position=position) as progress:
+            for item in items:
+                in_flight.append((item, self._io_pool.submit(metrics.run_in_context, labels, fn, item)))
+                if len(in_flight) >= max_in_flight:
+                    yield self._collect(in_flight.popleft(), progress)
+            while in_flight:
+                yield self._collect(in_flight.popleft(), progress)
+
+    def _collect(self, entry, progress):
+        item, future = entry
+        result = future.result()
+        progress.update(1)
+        return item, result
@@ -0,0 +1,146 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import time
+from src.minio_connection import MinIOConnection
+from src.execution_engine import ExecutionEngine
+from src.checkpoint import CHECKPOINT_DIR
+from src.catalog import CatalogWriter
+from src import uploader
+from src import metrics
+from src import modalities
+
+INGEST_WORKERS = int(os.getenv("PIPELINE_INGEST_WORKERS", 32))
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Bulk upload of a local drop (e.g. the output/ folder of the data collection)
+# into the temporal landing zone. Files are uploaded concurrently, large ones
+# as multipart uploads, and a file is skipped when an object with the same
+# key, size and ETag is already in the bucket, so an interrupted ingest is
+# resumed by running it again. Files that fail are written to a summary that
+# --retry-failed reads back.
+def local_files(directory):
+    # (path, key) of every file in the dataset folders of directory; keys are the file names
+    for dataset in sorted(os.listdir(directory)):
+        for root, _, files in os.walk(os.path.join(directory, dataset)):
+            for file in sorted(files):
+                yield os.path.join(root, file), file
+
+def local_etag(path, size):
+    # The ETag S3 gives the file when it is uploaded with uploader's settings:
+    # the MD5 of the content, or for multipart uploads the MD5 of the part MD5s
+    part_size = uploader.transfer_config(size).multipart_chunksize if size >= uploader.MULTIPART_THRESHOLD else None
+    whole = hashlib.md5()
+    parts = []
+    part = hashlib.md5()
+    part_bytes = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(min(HASH_BLOCK_SIZE, part_size - part_bytes) if part_size else HASH_BLOCK_SIZE)
+            if not block:
+                break
+            if part_size is None:
+                whole.update(block)
+                continue
+            part.update(block)
+            part_bytes += len(block)
+            if part_bytes == part_size:
+                parts.append(part.digest())
+                part, part_bytes = hashlib.md5(), 0
+    if part_size is None:
+        return f'"{whole.hexdigest()}"'
+    if part_bytes:
+        parts.append(part.digest())
+    return f'"{hashlib.md5(b"".join(parts)).hexdigest()}-{len(parts)}"'
+
+def remote_objects(bucket):
+    paginator = MinIOConnection().get_paginator("list_objects_v2")
+    return {obj["Key"]: (obj["Size"], obj["ETag"]) for page in paginator.paginate(Bucket=bucket) for obj in page.get("Contents", [])}
+
+def upload_file(path, key, bucket, size, etag):
+    minio_client = MinIOConnection()
+    with metrics.timed("upload", bytes_out=size):
+        if size < uploader.MULTIPART_THRESHOLD:
+            content_md5 = base64.b64encode(bytes.fromhex(etag.strip('"'))).decode("ascii")
+            with open(path, "rb") as f:
+                response = minio_client.put_object(Bucket=bucket, Key=key, Body=f, ContentMD5=content_md5)
+        else:
+            minio_client.upload_file(path, bucket, key, Config=uploader.transfer_config(size))
+            response = minio_client.head_object(Bucket=bucket, Key=key)
+    if not uploader.encrypted_etag(response) and response["ETag"] != etag:
+        raise uploader.UploadVerificationError(f"ETag {response['ETag']} of {bucket}/{key} does not match {path}")
+    return {"Key": key, "ETag": response["ETag"], "Size": size}
+
+def failures_path(bucket):
+    return os.path.join(CHECKPOINT_DIR, f"ingest-{bucket}-failures.json")
+
+def ingest(directory, bucket, workers=None, retry_failed=False):
+    with metrics.context(zone="DataCollection"):
+        return ingest_directory(directory, bucket, workers, retry_failed)
+
+def ingest_directory(directory, bucket, workers=None, retry_failed=False):
+    minio_client = MinIOConnection()
+    try:
+        minio_client.create_bucket(Bucket=bucket)
+    except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
+        print(f"Bucket '{bucket}' already exists")
+
+    if retry_failed and os.path.exists(failures_path(bucket)):
+        with open(failures_path(bucket)) as f:
+            files = [(failure["path"], failure["key"]) for failure in json.load(f)["failed"]]
+    else:
+        files = list(local_files(directory))
+    existing = remote_objects(bucket)
+    catalog = CatalogWriter("DataCollection", bucket)
+
+    def ingest_file(item):
+        path, key = item
+        try:
+            size = os.path.getsize(path)
+            with metrics.timed("checksum", bytes_in=size):
+                etag = local_etag(path, size)
+            if existing.get(key) == (size, etag):
+                return "skipped", size, None
+            written = upload_file(path, key, bucket, size, etag)
+            catalog.record([written], modalities.modal_for_key(key) or "others", source={"Key": path})
+            return "uploaded", size, None
+        except Exception as e:
+            return "failed", 0, str(e)
+
+    start = time.perf_counter()
+    summary = {"uploaded": 0, "skipped": 0, "failed": [], "bytes": 0}
+    with ExecutionEngine(io_workers=workers or INGEST_WORKERS, cpu_workers=0) as engine:
+        for (path, key), (status, size, error) in engine.map(ingest_file, files, desc=f"Ingest {bucket}", total=len(files)):
+            if status == "failed":
+                print(f"Failed to upload {path}: {error}")
+                summary["failed"].append({"path": path, "key": key, "error": error})
+                continue
+            summary[status] += 1
+            if status == "uploaded":
+                summary["bytes"] += size
+    summary["seconds"] = time.perf_counter() - start
+    catalog.flush()
+
+    if summary["failed"]:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        with open(failures_path(bucket), "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"{len(summary['failed'])} files failed; retry them with --retry-failed (see {failures_path(bucket)})")
+    elif os.path.exists(failures_path(bucket)):
+        os.remove(failures_path(bucket))
+    print(f"Uploaded {summary['uploaded']} files ({summary['bytes'] / 1e6:.1f} MB) in {summary['seconds']:.2f}s, skipped {summary['skipped']} already in '{bucket}'")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload a local data drop to the temporal landing zone")
+    parser.add_argument("directory", nargs="?", default=None, help="Defaults to the output/ folder of the data collection")
+    parser.add_argument("--bucket", default="temporal-landing-zone")
+    parser.add_argument("--workers", type=int, default=None, help=f"Concurrent uploads (default {INGEST_WORKERS})")
+    parser.add_argument("--retry-failed", action="store_true", help="Only upload the files that failed in the last ingest")
+    args = parser.parse_args()
+    if args.directory is None:
+        from src.zones.DataCollection import DataCollection
+        args.directory = DataCollection.OUTPUT_DIR
+    ingest(args.directory, args.bucket, args.workers, args.retry_failed)
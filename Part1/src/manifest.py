@@ -0,0 +1,58 @@
+import json
+import threading
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from src.minio_connection import MinIOConnection
+
+MANIFEST_BUCKET = "pipeline-manifests"
+
+# Records, for every source object a zone has produced output for, the ETag
+# and size it had and the transform version that processed it. Stored as one
+# JSON document per zone in the MANIFEST_BUCKET.
+class Manifest:
+    def __init__(self, zone_name, bucket_destination, transform_version):
+        self.key = f"{bucket_destination}/{zone_name}.json"
+        self.transform_version = str(transform_version)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def load(self):
+        minio_client = MinIOConnection()
+        try:
+            response = minio_client.get_object(Bucket=MANIFEST_BUCKET, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "NoSuchBucket", "404"):
+                self.entries = {}
+                return self
+            raise
+        with response["Body"] as body:
+            self.entries = json.loads(body.read()).get("entries", {})
+        return self
+
+    def is_current(self, obj):
+        entry = self.entries.get(obj["Key"])
+        if entry is None:
+            return False
+        return entry["etag"] == obj["ETag"] and entry["size"] == obj["Size"] and entry["version"] == self.transform_version
+
+    def record(self, obj):
+        with self._lock:
+            self.entries[obj["Key"]] = {
+                "etag": obj["ETag"],
+                "size": obj["Size"],
+                "version": self.transform_version,
+                "processed_at": datetime.now(timezone.utc).isoformat(),
+            }
+
+    def save(self):
+        minio_client = MinIOConnection()
+        try:
+            minio_client.create_bucket(Bucket=MANIFEST_BUCKET)
+        except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
+            pass
+        # Serialize whole saves so an older snapshot never overwrites a newer one
+        with self._save_lock:
+            with self._lock:
+                body = json.dumps({"version": self.transform_version, "entries": self.entries}).encode("utf-8")
+            minio_client.put_object(Bucket=MANIFEST_BUCKET, Key=self.key, Body=body, ContentType="application/json")
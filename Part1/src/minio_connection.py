@@ -1,21 +1,79 @@
 import boto3
 import os
+import threading
+from botocore.config import Config
 from dotenv import load_dotenv
 
+# Every zone thread shares one client per process, so its connection pool has
+# to cover the I/O workers plus the background writes and managed transfers.
+MAX_POOL_CONNECTIONS = int(os.getenv("PIPELINE_MAX_POOL_CONNECTIONS", 2 * int(os.getenv("PIPELINE_IO_WORKERS", 16)) + 16))
+MAX_ATTEMPTS = int(os.getenv("PIPELINE_S3_MAX_ATTEMPTS", 5))
+CONNECT_TIMEOUT = float(os.getenv("PIPELINE_S3_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("PIPELINE_S3_READ_TIMEOUT", 60))
+
+def client_config(max_pool_connections=None, config_class=Config):
+    return config_class(
+        max_pool_connections=max_pool_connections or MAX_POOL_CONNECTIONS,
+        retries={"mode": "adaptive", "total_max_attempts": MAX_ATTEMPTS},
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        tcp_keepalive=True,
+    )
+
+def client_kwargs():
+    load_dotenv()
+    return {
+        "aws_access_key_id": os.getenv("ACCESS_KEY_ID"),
+        "aws_secret_access_key": os.getenv("SECRET_ACCESS_KEY"),
+        "endpoint_url": "http://" + os.getenv("S3_API_ENDPOINT"),
+    }
+
 class MinIOConnection:
-    
+
     _instance = None
-    
+    _lock = threading.Lock()
+
     def __new__(cls):
         if cls._instance is None:
-            load_dotenv()
-            access_key_id = os.getenv("ACCESS_KEY_ID")
-            secret_access_key = os.getenv("SECRET_ACCESS_KEY")
-            minio_url = "http://" + os.getenv("S3_API_ENDPOINT")
-            cls._instance = boto3.client(
-                "s3",
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key,
-                endpoint_url=minio_url
-            )
-        return cls._instance
\ No newline at end of file
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls.create()
+        return cls._instance
+
+    @classmethod
+    def create(cls, max_pool_connections=None):
+        # A new client, independent of the shared one; for the local and memory
+        # backends (PIPELINE_STORAGE, see src/storage.py) a store with the same API
+        from src import storage
+        store = storage.create()
+        if store is not None:
+            return store
+        return boto3.session.Session().client("s3", config=client_config(max_pool_connections), **client_kwargs())
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # Sockets and locks inherited from the parent must not be reused
+        cls._instance = None
+        cls._lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=MinIOConnection._reset_after_fork)
+
+# asyncio variant, backed by aiobotocore (optional dependency). Only available
+# with the S3 backend:
+#
+#   async with AsyncMinIOConnection().client() as client:
+#       await client.get_object(Bucket=..., Key=...)
+class AsyncMinIOConnection:
+    def __init__(self, max_pool_connections=None):
+        try:
+            from aiobotocore.config import AioConfig
+            from aiobotocore.session import get_session
+        except ImportError:
+            raise ImportError("AsyncMinIOConnection requires aiobotocore: pip install aiobotocore")
+        self._session = get_session()
+        self._config_class = AioConfig
+        self.max_pool_connections = max_pool_connections
+
+    def client(self):
+        return self._session.create_client("s3", config=client_config(self.max_pool_connections, self._config_class), **client_kwargs())
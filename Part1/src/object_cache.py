@@ -0,0 +1,150 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from botocore.exceptions import ClientError
+from src.minio_connection import MinIOConnection
+from src import metrics
+from src import cas
+
+CACHE_DIR = os.getenv("PIPELINE_CACHE_DIR", os.path.join(".cache", "objects"))
+CACHE_MAX_BYTES = int(os.getenv("PIPELINE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+# Entries younger than this are served without asking MinIO whether they changed
+CACHE_VALIDATE_SECONDS = float(os.getenv("PIPELINE_CACHE_VALIDATE_SECONDS", 60))
+
+# Read-through disk cache for MinIO objects, capped in bytes and evicted in
+# least-recently-used order. Every entry remembers the ETag it was read with;
+# once it is older than validate_seconds, a conditional GET (If-None-Match)
+# checks it, so a changed object is downloaded again and an unchanged one
+# costs a 304 instead of a transfer. The index is a SQLite file in the cache
+# directory, so the cache survives restarts and can be shared by processes.
+class ObjectCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, validate_seconds=CACHE_VALIDATE_SECONDS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.validate_seconds = validate_seconds
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, etag TEXT, size INTEGER, validated_at REAL, accessed_at REAL)")
+        self._conn.commit()
+
+    def read(self, bucket, key):
+        name = hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            row = self._conn.execute("SELECT etag, validated_at FROM entries WHERE name = ?", (name,)).fetchone()
+
+        response = None
+        if row is not None:
+            etag, validated_at = row
+            try:
+                if time.time() - validated_at < self.validate_seconds:
+                    return self._hit(name, path, validated=False)
+                try:
+                    response = MinIOConnection().get_object(Bucket=bucket, Key=key, IfNoneMatch=etag)
+                except ClientError as e:
+                    if e.response["Error"]["Code"] not in ("304", "NotModified"):
+                        raise
+                    return self._hit(name, path, validated=True)
+            except FileNotFoundError:
+                # Evicted by another thread or process in the meantime
+                response = None
+        if response is None:
+            response = MinIOConnection().get_object(Bucket=bucket, Key=key)
+
+        with metrics.timed("cache_miss") as timer:
+            data = cas.resolve(bucket, response)
+            timer.bytes_in = len(data)
+        with self._lock:
+            self.misses += 1
+        self._store(name, path, response["ETag"], data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            for (name,) in self._conn.execute("SELECT name FROM entries").fetchall():
+                self._remove(name)
+            self._conn.commit()
+
+    def _hit(self, name, path, validated):
+        with metrics.timed("cache_hit") as timer:
+            with open(path, "rb") as f:
+                data = f.read()
+            timer.bytes_in = len(data)
+        now = time.time()
+        with self._lock:
+            self.hits += 1
+            if validated:
+                self.revalidations += 1
+                self._conn.execute("UPDATE entries SET validated_at = ?, accessed_at = ? WHERE name = ?", (now, now, name))
+            else:
+                self._conn.execute("UPDATE entries SET accessed_at = ? WHERE name = ?", (now, name))
+            self._conn.commit()
+        return data
+
+    def _store(self, name, path, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        # Write to a temporary file first so readers never see a partial entry
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (name, etag, len(data), now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        for name, size in self._conn.execute("SELECT name, size FROM entries ORDER BY accessed_at").fetchall():
+            if total_bytes <= self.max_bytes:
+                break
+            self._remove(name)
+            total_bytes -= size
+            self.evictions += 1
+
+    def _remove(self, name):
+        self._conn.execute("DELETE FROM entries WHERE name = ?", (name,))
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = ObjectCache()
+    return _default_cache
+
+def read(bucket, key):
+    return default_cache().read(bucket, key)
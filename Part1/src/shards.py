@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import tarfile
+import threading
+from src.minio_connection import MinIOConnection
+from src import metrics
+from src import uploader
+from src import cas
+
+# Packed storage for small chunks (e.g. the sentences of a text). All the
+# chunks of a document go into one uncompressed tar shard, WebDataset style
+# (<n>.txt holds the chunk, <n>.json its metadata), next to a JSON index with
+# the byte offset and size of every chunk. A chunk is addressed as
+# "<shard key>#<n>" and read back with a single ranged GET.
+INDEX_SUFFIX = ".idx.json"
+
+def packed_texts():
+    # Checked at call time so pipeline.py and the benchmark can switch it per run
+    return os.getenv("PIPELINE_PACKED_TEXTS", "0") == "1"
+
+def chunk_id(shard_key, position):
+    return f"{shard_key}#{position}"
+
+def split_chunk_id(chunk_id):
+    shard_key, position = chunk_id.rsplit("#", 1)
+    return shard_key, int(position)
+
+def pack(shard_key, chunks):
+    # chunks: list of (data, metadata); returns the tar bytes and its index
+    buffer = io.BytesIO()
+    index = {"shard": shard_key, "chunks": {}}
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        for position, (data, metadata) in enumerate(chunks):
+            offset = _add_member(tar, f"{position:06d}.txt", data)
+            _add_member(tar, f"{position:06d}.json", json.dumps(metadata).encode("utf-8"))
+            index["chunks"][chunk_id(shard_key, position)] = {"offset": offset, "size": len(data), "metadata": metadata}
+    return buffer.getvalue(), index
+
+def _add_member(tar, name, payload):
+    # Returns the offset of the payload in the archive: right after the member's header
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    offset = tar.offset + len(info.tobuf(tar.format, tar.encoding, tar.errors))
+    tar.addfile(info, io.BytesIO(payload))
+    return offset
+
+def write_shard(bucket, shard_key, chunks):
+    data, index = pack(shard_key, chunks)
+    written = uploader.put_many(bucket, [(shard_key, data, None), (shard_key + INDEX_SUFFIX, json.dumps(index).encode("utf-8"), None)])
+    return written, list(index["chunks"])
+
+# Random access to packed chunks. Shard indexes are fetched once and cached.
+class ShardReader:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index(self, shard_key):
+        with self._lock:
+            index = self._indexes.get(shard_key)
+        if index is None:
+            index = json.loads(cas.read(self.bucket, shard_key + INDEX_SUFFIX))
+            # Ranged reads go to the object that actually holds the bytes
+            index["physical_key"] = cas.physical_key(self.bucket, shard_key)
+            with self._lock:
+                self._indexes[shard_key] = index
+        return index
+
+    def entry(self, chunk_id):
+        shard_key, _ = split_chunk_id(chunk_id)
+        return self.index(shard_key)["chunks"][chunk_id]
+
+    def metadata(self, chunk_id):
+        return self.entry(chunk_id)["metadata"]
+
+    def get(self, chunk_id):
+        return self.get_many([chunk_id])[chunk_id]
+
+    def get_many(self, chunk_ids):
+        # One ranged GET per shard, covering all the requested chunks of that shard
+        by_shard = {}
+        for requested in chunk_ids:
+            by_shard.setdefault(split_chunk_id(requested)[0], []).append(requested)
+        chunks = {}
+        for shard_key, requested in by_shard.items():
+            index = self.index(shard_key)
+            entries = {requested_id: index["chunks"][requested_id] for requested_id in requested}
+            start = min(entry["offset"] for entry in entries.values())
+            end = max(entry["offset"] + entry["size"] for entry in entries.values())
+            data = b""
+            if end > start:
+                with metrics.timed("shard_read", bytes_in=end - start):
+                    response = MinIOConnection().get_object(Bucket=self.bucket, Key=index["physical_key"], Range=f"bytes={start}-{end - 1}")
+                    with response["Body"] as body:
+                        data = body.read()
+            for requested_id, entry in entries.items():
+                chunks[requested_id] = data[entry["offset"] - start:entry["offset"] - start + entry["size"]]
+        return chunks
+
+    def chunk_ids(self, shard_key):
+        return list(self.index(shard_key)["chunks"])
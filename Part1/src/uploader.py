@@ -0,0 +1,96 @@
+import base64
+import hashlib
+import io
+import math
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from src.minio_connection import MinIOConnection
+from src import metrics
+from src import cas
+
+# Payloads below the threshold go out as a single put_object whose Content-MD5
+# is checked by the server and whose ETag is checked here, so no head_object
+# is needed. The ETag of an object encrypted with SSE-KMS or SSE-C is not its
+# MD5, so only the server's Content-MD5 check applies to those. Larger
+# payloads use a managed multipart upload, whose parts are checksummed by
+# botocore.
+MULTIPART_THRESHOLD = int(os.getenv("PIPELINE_UPLOAD_MULTIPART_THRESHOLD", 32 * 1024 * 1024))
+MIN_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10000
+# Fraction of uploads that are read back with head_object, e.g. 0.01
+VERIFY_SAMPLE_RATE = float(os.getenv("PIPELINE_UPLOAD_VERIFY_SAMPLE_RATE", 0))
+BATCH_WORKERS = int(os.getenv("PIPELINE_UPLOAD_BATCH_WORKERS", 8))
+
+_batch_pool = None
+_batch_lock = threading.Lock()
+
+class UploadVerificationError(Exception):
+    pass
+
+def transfer_config(size):
+    # Parts of at least MIN_PART_SIZE, growing with the payload so it never needs more than MAX_PARTS
+    chunk_size = max(MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+    return TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=chunk_size, max_concurrency=4)
+
+def put(bucket, key, data, metadata=None):
+    # Uploads data with its user metadata and returns {"Key", "ETag", "Size"} of the written object
+    if cas.enabled():
+        return cas.put(bucket, key, data, _put_object, metadata)
+    return _put_object(bucket, key, data, metadata)
+
+def _put_object(bucket, key, data, metadata=None):
+    minio_client = MinIOConnection()
+    extra_args = {"Metadata": metadata} if metadata else {}
+    with metrics.timed("upload", bytes_out=len(data)):
+        if len(data) < MULTIPART_THRESHOLD:
+            digest = hashlib.md5(data)
+            response = minio_client.put_object(Bucket=bucket, Key=key, Body=data, ContentMD5=base64.b64encode(digest.digest()).decode("ascii"), **extra_args)
+            etag = response["ETag"]
+            if not encrypted_etag(response) and etag.strip('"') != digest.hexdigest():
+                raise UploadVerificationError(f"ETag {etag} of {bucket}/{key} does not match the uploaded data")
+        else:
+            minio_client.upload_fileobj(Fileobj=io.BytesIO(data), Bucket=bucket, Key=key, Config=transfer_config(len(data)), ExtraArgs=extra_args or None)
+            etag = None
+    if etag is None:
+        # Multipart uploads do not return the ETag; one extra request is negligible at this size
+        etag = verify(bucket, key, data)
+    elif VERIFY_SAMPLE_RATE and random.random() < VERIFY_SAMPLE_RATE:
+        verify(bucket, key, data, etag)
+    return {"Key": key, "ETag": etag, "Size": len(data)}
+
+def encrypted_etag(response):
+    return "SSECustomerAlgorithm" in response or response.get("ServerSideEncryption", "").startswith("aws:kms")
+
+def verify(bucket, key, data, etag=None):
+    with metrics.timed("head_object"):
+        response = MinIOConnection().head_object(Bucket=bucket, Key=key)
+    if response["ContentLength"] != len(data) or (etag is not None and response["ETag"] != etag):
+        raise UploadVerificationError(f"{bucket}/{key} does not match the uploaded data")
+    return response["ETag"]
+
+def put_many(bucket, outputs):
+    # Uploads a list of (key, bytes, metadata) concurrently, in order of the results
+    if len(outputs) <= 1:
+        return [put(bucket, key, data, metadata) for key, data, metadata in outputs]
+    labels = metrics.current_context()
+    futures = [_pool().submit(metrics.run_in_context, labels, put, bucket, key, data, metadata) for key, data, metadata in outputs]
+    return [future.result() for future in futures]
+
+def _pool():
+    global _batch_pool
+    if _batch_pool is None:
+        with _batch_lock:
+            if _batch_pool is None:
+                _batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+    return _batch_pool
+
+def _reset_after_fork():
+    global _batch_pool, _batch_lock
+    _batch_pool = None
+    _batch_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
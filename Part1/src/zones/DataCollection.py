@@ -3,7 +3,7 @@ from datasets import load_dataset
 import os
 from PIL import Image
 import requests
-from src.minio_connection import MinIOConnection
+from src.ingest import ingest
 import pandas as pd
 import wave
 from piper import PiperVoice
@@ -92,20 +92,8 @@ class DataCollection():
         cls.wikipedia_scrapper(topics)
 
     @classmethod
-    def upload_data(cls, bucket_destination):
-        minio_client = MinIOConnection()
-        try:
-            minio_client.create_bucket(Bucket=bucket_destination)
-        except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
-            print(f"Bucket '{bucket_destination}' already exists")
-
-        for dataset in os.listdir(cls.OUTPUT_DIR):
-            for root, _, files in os.walk(cls.OUTPUT_DIR + dataset):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        minio_client.upload_file(file_path, bucket_destination, file)
-                    except Exception as e:
-                        print(f"Failed to upload {file}: {e}")
+    def upload_data(cls, bucket_destination, workers=None, retry_failed=False):
+        # Concurrent, skip-existing upload of OUTPUT_DIR (see src/ingest.py)
+        return ingest(cls.OUTPUT_DIR, bucket_destination, workers, retry_failed)
             
 
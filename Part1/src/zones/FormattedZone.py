@@ -1,12 +1,15 @@
 from src.zones.AZone import AZone
+from src import metrics
+from src import image_kernel
 
 class FormattedZone(AZone):
-    def __init__(self, supported_modals, bucket_origin, bucket_destination):
-        self.bucket_origin = bucket_origin
-        self.bucket_destination = bucket_destination
-        self.supported_modals = supported_modals
+    # clean() resizes every image to 600x400
+    TARGET_SIZES = {"images": image_kernel.CLEAN_SIZE}
 
-    def treatData(self, dataobj):
-        dataobj.clean()
-        dataobj.save(self.bucket_destination)
-    
\ No newline at end of file
+    def __init__(self, supported_modals, bucket_origin, bucket_destination, **kwargs):
+        super().__init__(supported_modals, bucket_origin, bucket_destination, **kwargs)
+
+    def transform(self, dataobj):
+        with metrics.timed("clean"):
+            dataobj.clean()
+    
@@ -0,0 +1,158 @@
+import os
+from src.minio_connection import MinIOConnection
+from src.manifest import Manifest
+from src.streaming import Stage
+from src import metrics
+from src import cas
+from src import uploader
+from src.catalog import CatalogWriter, lineage
+from src.zones.AZone import AZone, build_dataobj
+from src.zones.PersistentLanding import PersistentLanding
+from src.zones.FormattedZone import FormattedZone
+from src.zones.TrustedZone import TrustedZone, EMBED_WORKERS
+
+def follow(dataobj, outputs):
+    # The next zone would read the object back under the key it was written to
+    if len(outputs) == 1:
+        dataobj.set_key(outputs[0][0])
+
+def format_and_clean(dataobj, bucket_formatted, bucket_trusted, bucket_destination):
+    # Returns the object, its formatted and trusted outputs and their catalog
+    # attributes. The object is also encoded for bucket_destination, so that
+    # load() only uploads; its content is kept, as embed() still needs it.
+    with metrics.timed("format"):
+        dataobj.format()
+    with metrics.timed("serialize") as timer:
+        formatted = dataobj.serialize(bucket_formatted)
+        timer.bytes_out = sum(len(data) for _, data, _ in formatted)
+    formatted_attributes = dataobj.catalog_attributes()
+    follow(dataobj, formatted)
+    with metrics.timed("clean"):
+        dataobj.clean()
+    with metrics.timed("serialize") as timer:
+        trusted = dataobj.serialize(bucket_trusted)
+        timer.bytes_out = sum(len(data) for _, data, _ in trusted)
+    follow(dataobj, trusted)
+    with metrics.timed("serialize") as timer:
+        outputs = dataobj.encode(bucket_destination, keep_payload=True)
+        timer.bytes_out = sum(len(data) for _, data, _ in outputs)
+    return dataobj, formatted, trusted, (formatted_attributes, dataobj.catalog_attributes())
+
+def decode_format_and_clean(modal, key, data, bucket_formatted, bucket_trusted, bucket_destination, target_size=None):
+    dataobj = build_dataobj(modal, key, data, target_size)
+    if dataobj is None:
+        return None, [], [], ({}, {})
+    return format_and_clean(dataobj, bucket_formatted, bucket_trusted, bucket_destination)
+
+# Runs Persistent Landing -> Formatted Zone -> Trusted Zone in a single pass:
+# every persistent-landing object is downloaded and decoded once and flows
+# through format(), clean() and embed() in memory. The formatted and trusted
+# outputs are still written, in the background, so lineage is preserved and
+# the staged zones' manifests are kept up to date.
+class FusedZone(AZone):
+    TRANSFORM_VERSION = f"{PersistentLanding.TRANSFORM_VERSION}.{FormattedZone.TRANSFORM_VERSION}.{TrustedZone.TRANSFORM_VERSION}"
+    # The formatted outputs are full resolution, as PersistentLanding writes
+    # them. With PIPELINE_FUSED_REDUCED_DECODE=1, images are decoded at the
+    # size the Formatted Zone's clean() reduces them to instead, and the
+    # formatted images are written at that size too.
+    TARGET_SIZES = FormattedZone.TARGET_SIZES if os.getenv("PIPELINE_FUSED_REDUCED_DECODE", "0") == "1" else {}
+
+    def __init__(self, supported_modals, bucket_origin, bucket_formatted, bucket_trusted, bucket_destination, **kwargs):
+        super().__init__(supported_modals, bucket_origin, bucket_destination, **kwargs)
+        self.bucket_formatted = bucket_formatted
+        self.bucket_trusted = bucket_trusted
+
+    def transform(self, dataobj):
+        dataobj.format()
+        dataobj.clean()
+        dataobj.embed()
+
+    def load(self, dataobj):
+        return dataobj.save(self.bucket_destination, chromadb=True, collection_name="multimodal_collection")
+
+    def process(self, engine, modal, key):
+        minio_client = MinIOConnection()
+        try:
+            with metrics.timed("get_object") as timer:
+                response = minio_client.get_object(Bucket=self.bucket_origin, Key=key)
+                data = cas.resolve(self.bucket_origin, response)
+                timer.bytes_in = len(data)
+            source = {"Key": key, "ETag": response["ETag"], "Size": response["ContentLength"]}
+            dataobj, formatted, trusted, attributes = engine.run_cpu(decode_format_and_clean, modal, key, data, self.bucket_formatted, self.bucket_trusted, self.bucket_destination, self.TARGET_SIZES.get(modal))
+            if dataobj is None:
+                return True
+            writes = self.write_intermediate(engine, formatted, trusted)
+            with metrics.timed("embed"):
+                dataobj.embed()
+            written = self.load(dataobj)
+            self.record(modal, source, writes, attributes, dataobj, written)
+            return True
+        except Exception as e:
+            print(f"Failed to process {key}: {e}")
+            return False
+
+    def write_intermediate(self, engine, formatted, trusted):
+        return engine.submit_background(uploader.put_many, self.bucket_formatted, formatted), engine.submit_background(uploader.put_many, self.bucket_trusted, trusted)
+
+    def record(self, modal, source, writes, attributes, dataobj, written):
+        formatted_write, trusted_write = writes
+        formatted, trusted = formatted_write.result(), trusted_write.result()
+        self.persistent_manifest.record(source)
+        for obj in formatted:
+            self.formatted_manifest.record(obj)
+        for obj in trusted:
+            self.trusted_manifest.record(obj)
+        # Catalog rows carry the lineage the staged zones would have recorded
+        formatted_attributes, trusted_attributes = attributes
+        self.formatted_catalog.record(formatted, modal, formatted_attributes, lineage(self.bucket_origin, [source]))
+        self.trusted_catalog.record(trusted, modal, trusted_attributes, lineage(self.bucket_formatted, formatted))
+        self.record_written(modal, written, dataobj, lineage(self.bucket_trusted, trusted))
+
+    def stages(self, engine):
+        cpu_workers = max(engine.cpu_workers, 1)
+        return [
+            Stage("fetch", self.fetch_stage, workers=engine.io_workers),
+            Stage("transform", lambda item: self.transform_stage(engine, item), workers=cpu_workers),
+            Stage("embed", lambda item: self.embed_stage(engine, item), workers=EMBED_WORKERS),
+            Stage("upload", self.upload_stage, workers=engine.io_workers),
+        ]
+
+    def transform_stage(self, engine, item):
+        modal, obj, data = item
+        return modal, obj, engine.run_cpu(decode_format_and_clean, modal, obj["Key"], data, self.bucket_formatted, self.bucket_trusted, self.bucket_destination, self.TARGET_SIZES.get(modal))
+
+    def embed_stage(self, engine, item):
+        modal, obj, (dataobj, formatted, trusted, attributes) = item
+        if dataobj is None:
+            return modal, obj, None
+        writes = self.write_intermediate(engine, formatted, trusted)
+        with metrics.timed("embed"):
+            dataobj.embed()
+        return modal, obj, (dataobj, writes, attributes)
+
+    def upload_stage(self, item):
+        if item[2] is None:
+            return item
+        modal, obj, (dataobj, writes, attributes) = item
+        written = self.load(dataobj)
+        self.record(modal, obj, writes, attributes, dataobj, written)
+        return modal, obj, None
+
+    def execute(self, streaming=False, resume=False):
+        minio_client = MinIOConnection()
+        for bucket in (self.bucket_formatted, self.bucket_trusted):
+            try:
+                minio_client.create_bucket(Bucket=bucket)
+            except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
+                print(f"Bucket '{bucket}' already exists")
+
+        self.persistent_manifest = Manifest(PersistentLanding.__name__, self.bucket_formatted, PersistentLanding.TRANSFORM_VERSION).load()
+        self.formatted_manifest = Manifest(FormattedZone.__name__, self.bucket_trusted, FormattedZone.TRANSFORM_VERSION).load()
+        self.trusted_manifest = Manifest(TrustedZone.__name__, self.bucket_destination, TrustedZone.TRANSFORM_VERSION).load()
+        self.formatted_catalog = CatalogWriter(type(self).__name__, self.bucket_formatted)
+        self.trusted_catalog = CatalogWriter(type(self).__name__, self.bucket_trusted)
+        super().execute(streaming, resume)
+        for manifest in (self.persistent_manifest, self.formatted_manifest, self.trusted_manifest):
+            manifest.save()
+        self.formatted_catalog.flush()
+        self.trusted_catalog.flush()
@@ -1,12 +1,11 @@
 from src.zones.AZone import AZone
+from src import metrics
 
 class PersistentLanding(AZone):
-    def __init__(self, supported_modals, bucket_origin, bucket_destination):
-        self.supported_modals = supported_modals
-        self.bucket_origin = bucket_origin
-        self.bucket_destination = bucket_destination
+    def __init__(self, supported_modals, bucket_origin, bucket_destination, **kwargs):
+        super().__init__(supported_modals, bucket_origin, bucket_destination, **kwargs)
 
-    def treatData(self, dataobj):
-        dataobj.format()
-        dataobj.save(self.bucket_destination)
-    
\ No newline at end of file
+    def transform(self, dataobj):
+        with metrics.timed("format"):
+            dataobj.format()
+    
@@ -1,14 +1,43 @@
-from src.zones.AZone import AZone
+import os
+from src.zones.AZone import AZone, build_dataobj
+from src.streaming import Stage
+from src import metrics
+
+# Threads of the streaming embed stage; each runs the in-process model
+EMBED_WORKERS = int(os.getenv("PIPELINE_EMBED_WORKERS", 1))
 
 class TrustedZone(AZone):
-    def __init__(self, supported_modals, bucket_origin, bucket_destination):
-        self.supported_modals = supported_modals
-        self.bucket_origin = bucket_origin
-        self.bucket_destination = bucket_destination
+    # Embedding needs the model loaded in this process, so by default it runs
+    # on the I/O threads instead of a process pool.
+    def __init__(self, supported_modals, bucket_origin, bucket_destination, **kwargs):
+        kwargs.setdefault("cpu_workers", 0)
+        super().__init__(supported_modals, bucket_origin, bucket_destination, **kwargs)
+
+    def transform(self, dataobj):
+        with metrics.timed("embed"):
+            dataobj.embed()
+
+    def load(self, dataobj):
+        return dataobj.save(self.bucket_destination, chromadb=True, collection_name="multimodal_collection")
 
-    def treatData(self, dataobj):
-        dataobj.embed()
-        dataobj.save(self.bucket_destination, chromadb=True, collection_name="multimodal_collection")
+    # In streaming mode the embedding gets its own bounded stage between the
+    # decode and the upload, as in the fused zone, so that the model's
+    # throughput shows up as the queue in front of it
+    def stages(self, engine):
+        return [
+            Stage("fetch", self.fetch_stage, workers=engine.io_workers),
+            Stage("decode", lambda item: self.decode_stage(engine, item), workers=max(engine.cpu_workers, 1)),
+            Stage("embed", self.embed_stage, workers=EMBED_WORKERS),
+            Stage("upload", self.upload_stage, workers=engine.io_workers),
+        ]
 
+    def decode_stage(self, engine, item):
+        modal, obj, data = item
+        return modal, obj, engine.run_cpu(build_dataobj, modal, obj["Key"], data, self.TARGET_SIZES.get(modal))
 
-    
\ No newline at end of file
+    def embed_stage(self, item):
+        modal, obj, dataobj = item
+        if dataobj is not None:
+            self.transform(dataobj)
+            self.encode(dataobj)
+        return modal, obj, dataobj
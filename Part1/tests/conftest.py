@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+# The tests run against the in-memory storage backend (see src/storage.py)
+os.environ["PIPELINE_STORAGE"] = "memory"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.minio_connection import MinIOConnection
+from src import storage as storage_backends
+from src import cas
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    # An empty store, and a fresh .checkpoints directory, for every test. The
+    # in-memory objects and the known CAS blobs are shared by the process.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage_backends, "_memory_buckets", {})
+    monkeypatch.setattr(cas, "_known_blobs", set())
+    MinIOConnection._instance = None
+    yield MinIOConnection()
+    MinIOConnection._instance = None
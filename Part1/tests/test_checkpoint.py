@@ -0,0 +1,77 @@
+from src.checkpoint import CheckpointLedger
+from src.streaming import Stage
+from src.zones.AZone import AZone
+
+def obj(key, etag='"1"'):
+    return {"Key": key, "ETag": etag, "Size": 1}
+
+def test_resume_keeps_the_run_and_its_items():
+    ledger = CheckpointLedger("FormattedZone", "trusted-zone").start()
+    run_id = ledger.run_id
+    ledger.mark_done(obj("texts/a.txt"))
+    ledger.mark_in_flight(obj("texts/b.txt"))
+    ledger.mark_failed(obj("texts/c.txt"), "boom")
+    ledger.close()
+
+    ledger = CheckpointLedger("FormattedZone", "trusted-zone").start(resume=True)
+    assert ledger.run_id == run_id
+    assert ledger.counts() == {"done": 1, "in_flight": 1, "failed": 1}
+    assert ledger.done_objects() == [obj("texts/a.txt")]
+    assert ledger.is_done(obj("texts/a.txt"))
+    # A changed object is processed again
+    assert not ledger.is_done(obj("texts/a.txt", '"2"'))
+    assert not ledger.is_done(obj("texts/b.txt"))
+    ledger.close()
+
+def test_new_run_starts_empty():
+    ledger = CheckpointLedger("FormattedZone", "trusted-zone").start()
+    run_id = ledger.run_id
+    ledger.mark_done(obj("texts/a.txt"))
+    ledger.close()
+
+    ledger = CheckpointLedger("FormattedZone", "trusted-zone").start()
+    assert ledger.run_id != run_id
+    assert ledger.counts() == {}
+    ledger.close()
+
+class FlakyZone(AZone):
+    def __init__(self, *args, fail=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail = set(fail)
+        self.processed = []
+
+    def stages(self, engine):
+        return [Stage("fetch", self.fetch_stage), Stage("transform", self.transform_stage)]
+
+    def transform_stage(self, item):
+        self.processed.append(item[1]["Key"])
+        if item[1]["Key"] in self.fail:
+            raise ValueError("interrupted")
+        return item
+
+def test_resumed_zone_only_processes_what_is_left(storage):
+    storage.create_bucket(Bucket="origin")
+    for key in ("texts/a.txt", "texts/b.txt", "texts/c.txt"):
+        storage.put_object(Bucket="origin", Key=key, Body=key.encode())
+    # Not incremental, so only the ledger can skip the objects done before
+    first = FlakyZone(["texts"], "origin", "destination", io_workers=1, cpu_workers=0, incremental=False, fail={"texts/b.txt"})
+    first.execute(streaming=True)
+    assert sorted(first.processed) == ["texts/a.txt", "texts/b.txt", "texts/c.txt"]
+
+    resumed = FlakyZone(["texts"], "origin", "destination", io_workers=1, cpu_workers=0, incremental=False)
+    resumed.execute(streaming=True, resume=True)
+    assert resumed.processed == ["texts/b.txt"]
+
+    restarted = FlakyZone(["texts"], "origin", "destination", io_workers=1, cpu_workers=0, incremental=False)
+    restarted.execute(streaming=True)
+    assert sorted(restarted.processed) == ["texts/a.txt", "texts/b.txt", "texts/c.txt"]
+
+def test_done_objects_reach_the_manifest_on_resume():
+    ledger = CheckpointLedger("FlakyZone", "destination").start()
+    ledger.mark_done(obj("texts/a.txt"))
+    ledger.close()
+
+    zone = FlakyZone(["texts"], "origin", "destination")
+    manifest = zone.load_manifest()
+    zone.start_ledger(manifest, resume=True).close()
+    assert manifest.is_current(obj("texts/a.txt"))
@@ -0,0 +1,60 @@
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from src import cas
+from src import codec_policy
+from src import uploader
+
+TEXT = ("A sentence that repeats, so that it compresses. " * 20).encode("utf-8")
+
+def test_zstd_text_round_trip(monkeypatch):
+    monkeypatch.setenv("PIPELINE_CODEC_POLICY", "texts=zstd:level=6")
+    data, metadata = codec_policy.encode_text(TEXT, "formatted-zone")
+    assert metadata == {codec_policy.CODEC_METADATA: "zstd"}
+    assert len(data) < len(TEXT)
+    assert codec_policy.decode(data, metadata[codec_policy.CODEC_METADATA]) == TEXT
+
+def test_short_and_plain_texts_are_stored_as_they_are(monkeypatch):
+    monkeypatch.setenv("PIPELINE_CODEC_POLICY", "texts=zstd")
+    assert codec_policy.encode_text(b"short", "formatted-zone") == (b"short", None)
+    monkeypatch.setenv("PIPELINE_CODEC_POLICY", "")
+    assert codec_policy.encode_text(TEXT, "formatted-zone") == (TEXT, None)
+    # Unmarked objects are never decompressed, whatever their bytes
+    assert codec_policy.decode(TEXT) == TEXT
+
+def test_bucket_entries_override_the_modality(monkeypatch):
+    monkeypatch.setenv("PIPELINE_CODEC_POLICY", "texts=plain,exploitation-zone/texts=zstd:level=3")
+    assert codec_policy.codec_for("formatted-zone", "texts") == ("plain", {})
+    assert codec_policy.codec_for("exploitation-zone", "texts") == ("zstd", {"level": 3})
+
+def test_unknown_codec_is_an_error():
+    with pytest.raises(ValueError):
+        codec_policy.decode(TEXT, "brotli")
+
+@pytest.mark.parametrize("content_addressed", ["0", "1"])
+def test_stored_text_is_decoded_by_readers(storage, monkeypatch, content_addressed):
+    monkeypatch.setenv("PIPELINE_CODEC_POLICY", "texts=zstd")
+    monkeypatch.setenv("PIPELINE_CONTENT_ADDRESSED", content_addressed)
+    storage.create_bucket(Bucket="formatted-zone")
+    data, metadata = codec_policy.encode_text(TEXT, "formatted-zone")
+    uploader.put("formatted-zone", "texts/a_0.txt", data, metadata)
+    assert storage.head_object(Bucket="formatted-zone", Key="texts/a_0.txt")["Metadata"][codec_policy.CODEC_METADATA] == "zstd"
+    assert cas.read("formatted-zone", "texts/a_0.txt") == TEXT
+
+@pytest.mark.parametrize("codec", ["png", "webp:lossless=1"])
+def test_lossless_image_round_trip(codec):
+    pixels = np.random.default_rng(0).integers(0, 256, (32, 48, 3), dtype=np.uint8)
+    extension, data = codec_policy.encode_image(Image.fromarray(pixels), "formatted-zone", codec)
+    assert extension == codec_policy.extension("images", codec)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(data)).convert("RGB")), pixels)
+
+@pytest.mark.parametrize("codec", ["wav", "flac:level=8"])
+def test_lossless_audio_round_trip(codec):
+    # 16-bit PCM, so values on the 1/32768 grid come back exactly
+    samples = (np.random.default_rng(0).integers(-32768, 32767, (4800, 2)) / 32768).astype(np.float32)
+    extension, data = codec_policy.encode_audio((samples, 48000), "formatted-zone", codec)
+    assert extension == codec_policy.extension("audios", codec)
+    decoded, sample_rate = codec_policy.decode_audio(data)
+    assert sample_rate == 48000
+    assert np.array_equal(decoded, samples)
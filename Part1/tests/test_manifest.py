@@ -0,0 +1,52 @@
+from src.manifest import Manifest
+from src.streaming import Stage
+from src.zones.AZone import AZone
+
+def test_current_only_for_the_same_etag_size_and_version():
+    manifest = Manifest("FormattedZone", "trusted-zone", 1)
+    manifest.record({"Key": "texts/a.txt", "ETag": '"1"', "Size": 3})
+    manifest.save()
+
+    loaded = Manifest("FormattedZone", "trusted-zone", 1).load()
+    assert loaded.is_current({"Key": "texts/a.txt", "ETag": '"1"', "Size": 3})
+    assert not loaded.is_current({"Key": "texts/a.txt", "ETag": '"2"', "Size": 3})
+    assert not loaded.is_current({"Key": "texts/a.txt", "ETag": '"1"', "Size": 4})
+    assert not loaded.is_current({"Key": "texts/b.txt", "ETag": '"1"', "Size": 3})
+    assert not Manifest("FormattedZone", "trusted-zone", 2).load().is_current({"Key": "texts/a.txt", "ETag": '"1"', "Size": 3})
+
+def test_missing_manifest_loads_empty():
+    assert Manifest("FormattedZone", "trusted-zone", 1).load().entries == {}
+
+class RecordingZone(AZone):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, io_workers=1, cpu_workers=0, **kwargs)
+        self.processed = []
+
+    def stages(self, engine):
+        return [Stage("fetch", self.fetch_stage), Stage("transform", self.transform_stage)]
+
+    def transform_stage(self, item):
+        self.processed.append(item[1]["Key"])
+        return item
+
+def run_zone(**kwargs):
+    zone = RecordingZone(["texts"], "origin", "destination", **kwargs)
+    zone.execute(streaming=True)
+    return sorted(zone.processed)
+
+def test_incremental_run_skips_unchanged_objects(storage, monkeypatch):
+    storage.create_bucket(Bucket="origin")
+    storage.put_object(Bucket="origin", Key="texts/a.txt", Body=b"a")
+    storage.put_object(Bucket="origin", Key="texts/b.txt", Body=b"b")
+    assert run_zone() == ["texts/a.txt", "texts/b.txt"]
+    assert run_zone() == []
+
+    storage.put_object(Bucket="origin", Key="texts/b.txt", Body=b"changed")
+    storage.put_object(Bucket="origin", Key="texts/c.txt", Body=b"c")
+    assert run_zone() == ["texts/b.txt", "texts/c.txt"]
+    assert run_zone(incremental=False) == ["texts/a.txt", "texts/b.txt", "texts/c.txt"]
+
+    # A new transform version reprocesses everything
+    monkeypatch.setattr(RecordingZone, "TRANSFORM_VERSION", 2)
+    assert run_zone() == ["texts/a.txt", "texts/b.txt", "texts/c.txt"]
+    assert run_zone() == []
@@ -0,0 +1,83 @@
+import time
+from src.work_queue import WorkQueue
+
+def listed(count):
+    return [{"Key": f"texts/{i}.txt", "ETag": f'"{i}"', "Size": i, "LastModified": "ignored"} for i in range(count)]
+
+def test_enqueue_shards_objects_into_units():
+    queue = WorkQueue("queue.sqlite")
+    queue.open()
+    assert queue.enqueue("FormattedZone", "texts", listed(5), unit_size=2) == 3
+    units = [queue.lease("worker-a") for _ in range(3)]
+    assert [len(unit["objs"]) for unit in units] == [2, 2, 1]
+    # Only the columns the zones need are kept
+    assert units[0]["objs"][0] == {"Key": "texts/0.txt", "ETag": '"0"', "Size": 0}
+    assert queue.lease("worker-a") is None
+    assert queue.stats("FormattedZone") == {"leased": 3}
+
+def test_ack_records_the_failed_objects():
+    queue = WorkQueue("queue.sqlite")
+    queue.open()
+    queue.enqueue("FormattedZone", "texts", listed(3))
+    unit = queue.lease("worker-a")
+    assert queue.ack(unit["unit_id"], "worker-a", [unit["objs"][1]])
+    assert queue.stats("FormattedZone") == {"done": 1}
+    assert [obj["Key"] for obj in queue.completed_objects("FormattedZone")] == ["texts/0.txt", "texts/2.txt"]
+
+def test_expired_lease_is_handed_to_the_next_worker():
+    queue = WorkQueue("queue.sqlite")
+    queue.open()
+    queue.enqueue("FormattedZone", "texts", listed(1))
+    unit = queue.lease("worker-a", lease_seconds=0.1)
+    assert queue.lease("worker-b") is None
+    time.sleep(0.2)
+    released = queue.lease("worker-b")
+    assert released["unit_id"] == unit["unit_id"]
+    # The worker that lost the lease can no longer ack the unit
+    assert not queue.ack(unit["unit_id"], "worker-a", [])
+    assert queue.ack(unit["unit_id"], "worker-b", [])
+
+def test_unit_fails_after_max_attempts():
+    queue = WorkQueue("queue.sqlite", max_attempts=2)
+    queue.open()
+    queue.enqueue("FormattedZone", "texts", listed(1))
+    queue.lease("worker-a", lease_seconds=0.05)
+    time.sleep(0.1)
+    queue.lease("worker-b", lease_seconds=0.05)
+    time.sleep(0.1)
+    assert queue.lease("worker-c") is None
+    assert queue.stats("FormattedZone") == {"failed": 1}
+
+def test_release_requeues_until_max_attempts():
+    queue = WorkQueue("queue.sqlite", max_attempts=2)
+    queue.open()
+    queue.enqueue("FormattedZone", "texts", listed(1))
+    unit = queue.lease("worker-a")
+    queue.release(unit["unit_id"], "worker-a")
+    assert queue.stats("FormattedZone") == {"pending": 1}
+    unit = queue.lease("worker-b")
+    queue.release(unit["unit_id"], "worker-b")
+    assert queue.stats("FormattedZone") == {"failed": 1}
+
+def test_keep_leased_renews_the_lease():
+    queue = WorkQueue("queue.sqlite")
+    queue.open()
+    queue.enqueue("FormattedZone", "texts", listed(1))
+    unit = queue.lease("worker-a", lease_seconds=0.3)
+    with queue.keep_leased(unit["unit_id"], "worker-a", lease_seconds=0.3):
+        time.sleep(0.7)
+        assert queue.lease("worker-b") is None
+    assert queue.ack(unit["unit_id"], "worker-a", [])
+
+def test_open_starts_a_new_run():
+    queue = WorkQueue("queue.sqlite")
+    assert queue.run_state() == (None, False)
+    first = queue.open()
+    queue.enqueue("FormattedZone", "texts", listed(1))
+    queue.close()
+    assert queue.run_state() == (first, True)
+    second = queue.open()
+    assert second != first
+    assert queue.run_state() == (second, False)
+    # The units of the previous run are dropped
+    assert queue.lease("worker-a") is None
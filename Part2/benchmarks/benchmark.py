@@ -0,0 +1,272 @@
+# End-to-end pipeline benchmark.
+#
+# Generates a synthetic corpus of images, texts and WAVs, uploads it to the
+# temporal landing zone of a local S3 stand-in and runs every zone of the
+# pipeline on it, one modality at a time, each in a fresh process so that peak
+# RSS can be attributed to a single zone and modality. Results are written as
+# JSON so that runs on different commits can be compared.
+#
+#   python benchmarks/benchmark.py --images 200 --texts 200 --audios 50
+#   python benchmarks/benchmark.py --s3 minio   # use S3_API_ENDPOINT instead of an in-process moto server
+#   python benchmarks/benchmark.py --s3 minio --wipe   # ...deleting every bucket already on it
+#   python benchmarks/benchmark.py --storage local   # a local directory instead of S3 (see src/storage.py)
+#   python benchmarks/benchmark.py --storage memory  # in-memory objects; zones then run in this process
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODALS = ["images", "texts"]
+ZONES = ["TemporalLanding", "PersistentLanding", "FormattedZone", "TrustedZone"]
+WORDS = "skin lesion melanoma nevus dermatology biopsy diagnosis patient tissue cell pigment border asymmetry diameter evolution treatment".split()
+
+def build_zone(name, modals):
+    # Same buckets as pipeline.py; incremental is off so every run does the full work
+    from src.zones.TemporalLanding import TemporalLanding
+    from src.zones.PersistentLanding import PersistentLanding
+    from src.zones.FormattedZone import FormattedZone
+    from src.zones.TrustedZone import TrustedZone
+    from src.zones.FusedZone import FusedZone
+    if name == "TemporalLanding":
+        return TemporalLanding(modals, "temporal-landing-zone", "persistent-landing-zone", incremental=False), "temporal-landing-zone"
+    if name == "PersistentLanding":
+        return PersistentLanding(modals, "persistent-landing-zone", "formatted-zone", incremental=False), "persistent-landing-zone"
+    if name == "FormattedZone":
+        return FormattedZone(modals, "formatted-zone", "trusted-zone", incremental=False), "formatted-zone"
+    if name == "TrustedZone":
+        return TrustedZone(modals, "trusted-zone", "exploitation-zone", incremental=False), "trusted-zone"
+    if name == "FusedZone":
+        return FusedZone(modals, "persistent-landing-zone", "formatted-zone", "trusted-zone", "exploitation-zone", incremental=False), "persistent-landing-zone"
+    raise ValueError(f"Unknown zone {name}")
+
+def synthetic_image(rng, width, height):
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(20):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(5, max(6, width // 6))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def synthetic_text(rng, words):
+    sentences = []
+    while sum(len(sentence.split()) for sentence in sentences) < words:
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(rng.randrange(6, 18))).capitalize() + ".")
+    return "\n\n".join(" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)).encode("utf-8")
+
+def synthetic_wav(rng, seconds, sample_rate=16000):
+    frequency = rng.uniform(110, 880)
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        sample = 0.5 * math.sin(2 * math.pi * frequency * i / sample_rate) + rng.uniform(-0.05, 0.05)
+        frames += int(sample * 32767).to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+def generate_corpus(args):
+    # The zones write to fixed bucket names, so the benchmark owns the whole
+    # server: moto, local and memory storage start empty, and a server that
+    # already has buckets (e.g. the MinIO of S3_API_ENDPOINT) is only emptied
+    # with --wipe
+    from src.minio_connection import MinIOConnection
+    minio_client = MinIOConnection()
+    buckets = [b["Name"] for b in minio_client.list_buckets().get("Buckets", [])]
+    if buckets and not args.wipe:
+        print(f"The server already has buckets ({', '.join(buckets)}); the benchmark would delete them. Point S3_API_ENDPOINT to a dedicated server, or pass --wipe to delete them.")
+        sys.exit(1)
+    for bucket in buckets:
+        paginator = minio_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket):
+            for obj in page.get("Contents", []):
+                minio_client.delete_object(Bucket=bucket, Key=obj["Key"])
+        minio_client.delete_bucket(Bucket=bucket)
+    minio_client.create_bucket(Bucket="temporal-landing-zone")
+
+    rng = random.Random(args.seed)
+    corpus = {"images": 0, "texts": 0, "audios": 0, "bytes": 0}
+    generators = [
+        ("images", args.images, "jpg", lambda: synthetic_image(rng, args.image_width, args.image_height)),
+        ("texts", args.texts, "txt", lambda: synthetic_text(rng, args.text_words)),
+        ("audios", args.audios, "wav", lambda: synthetic_wav(rng, args.audio_seconds)),
+    ]
+    for modal, count, extension, generate in generators:
+        for i in range(count):
+            body = generate()
+            minio_client.put_object(Bucket="temporal-landing-zone", Key=f"dataset{i % 3 + 1}/{modal}_{i:05d}.{extension}", Body=body)
+            corpus[modal] += 1
+            corpus["bytes"] += len(body)
+    return corpus
+
+def use_local_chroma():
+    # In-process Chroma, so the benchmark does not need a running server
+    import chromadb
+    from src.chroma_connection import ChromaConnection
+    connection = ChromaConnection.__new__(ChromaConnection)
+    connection._client = chromadb.EphemeralClient()
+    connection._initialized = True
+
+def run_child(zone_name, modal, streaming):
+    # Runs one zone on one modality in this (fresh) process and prints the result as JSON
+    print("BENCHMARK_RESULT " + json.dumps(measure(zone_name, modal, streaming)))
+
+def measure(zone_name, modal, streaming):
+    from src import metrics
+    from src.minio_connection import MinIOConnection
+    from src.checkpoint import CheckpointLedger
+    use_local_chroma()
+    modals = MODALS if modal == "*" else [modal]
+    zone, bucket_origin = build_zone(zone_name, modals)
+    paginator = MinIOConnection().get_paginator("list_objects_v2")
+    prefix = "" if modal == "*" else modal
+    objs = [obj for page in paginator.paginate(Bucket=bucket_origin, Prefix=prefix) for obj in page.get("Contents", [])]
+
+    start = time.perf_counter()
+    zone.execute(streaming=streaming)
+    seconds = time.perf_counter() - start
+
+    total_bytes = sum(obj["Size"] for obj in objs)
+    ledger = CheckpointLedger(type(zone).__name__, zone.bucket_destination)
+    failed = ledger.counts().get("failed", 0)
+    ledger.close()
+    result = {
+        "zone": zone_name,
+        "modal": modal,
+        "objects": len(objs),
+        "failed": failed,
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "objects_per_second": len(objs) / seconds if seconds else 0.0,
+        "mb_per_second": total_bytes / 1e6 / seconds if seconds else 0.0,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_worker_rss_mb": metrics.peak_worker_rss_mb(),
+        "stages": metrics.report(),
+    }
+    metrics.reset()
+    return result
+
+def start_moto():
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        print("moto is not installed: pip install 'moto[server]', or use --s3 minio")
+        sys.exit(1)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ["S3_API_ENDPOINT"] = f"{host}:{port}"
+    os.environ.setdefault("ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    return server
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--texts", type=int, default=50)
+    parser.add_argument("--audios", type=int, default=0)
+    parser.add_argument("--image-width", type=int, default=1024)
+    parser.add_argument("--image-height", type=int, default=768)
+    parser.add_argument("--text-words", type=int, default=400)
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zones", default=",".join(ZONES), help="Comma separated zones to run, in order (FusedZone is also accepted)")
+    parser.add_argument("--modals", default=",".join(MODALS))
+    parser.add_argument("--streaming", action="store_true", help="Run the zones in streaming mode")
+    parser.add_argument("--s3", choices=["moto", "minio"], default="moto", help="moto starts an in-process server; minio uses S3_API_ENDPOINT")
+    parser.add_argument("--wipe", action="store_true", help="Delete every bucket on the server before the benchmark, if it is not empty")
+    parser.add_argument("--storage", choices=["s3", "local", "memory"], default="s3", help="Storage backend; memory runs every zone in this process, so peak RSS accumulates")
+    parser.add_argument("--output", help="Defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--child", nargs=2, metavar=("ZONE", "MODAL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.streaming)
+        return
+
+    server = start_moto() if args.storage == "s3" and args.s3 == "moto" else None
+    checkpoints = tempfile.mkdtemp(prefix="benchmark-checkpoints-")
+    os.environ["PIPELINE_STORAGE"] = args.storage
+    if args.storage == "local":
+        os.environ["PIPELINE_STORAGE_DIR"] = tempfile.mkdtemp(prefix="benchmark-storage-")
+    if args.storage == "memory":
+        os.environ["PIPELINE_CHECKPOINT_DIR"] = checkpoints
+    env = {**os.environ, "PIPELINE_CHECKPOINT_DIR": checkpoints}
+    try:
+        modals = args.modals.split(",")
+        if "audios" not in modals:
+            args.audios = 0
+        print("Generating corpus...")
+        corpus = generate_corpus(args)
+        print(corpus)
+
+        results = []
+        for zone_name in args.zones.split(","):
+            # The Temporal Landing Zone routes every modality in one listing
+            for modal in (["*"] if zone_name == "TemporalLanding" else modals):
+                print(f"-> {zone_name} {modal}")
+                if args.storage == "memory":
+                    results.append(measure(zone_name, modal, args.streaming))
+                    print_result(results[-1])
+                    continue
+                command = [sys.executable, os.path.abspath(__file__), "--child", zone_name, modal] + (["--streaming"] if args.streaming else [])
+                completed = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+                lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCHMARK_RESULT ")]
+                if completed.returncode != 0 or not lines:
+                    print(f"Failed to benchmark {zone_name} {modal}:\n{completed.stderr[-2000:]}")
+                    continue
+                result = json.loads(lines[-1][len("BENCHMARK_RESULT "):])
+                results.append(result)
+                print_result(result)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "s3": args.s3,
+        "storage": args.storage,
+        "streaming": args.streaming,
+        "corpus": corpus,
+        "results": results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{report['commit'] or 'unknown'}{'' if args.storage == 's3' else '-' + args.storage}{'-streaming' if args.streaming else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+def print_result(result):
+    print(f"   {result['objects']} objects ({result['failed']} failed) in {result['seconds']:.2f}s: {result['objects_per_second']:.1f} obj/s, {result['mb_per_second']:.2f} MB/s, peak RSS {result['peak_rss_mb']:.0f} MB (workers {result['peak_worker_rss_mb']:.0f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Image cleaning benchmark and parity check (see src/image_kernel.py).
+#
+# Cleans the same images with the original PIL chain, the fused kernel one
+# image at a time and the fused kernel in batches, and reports time per image
+# and how far the fused output is from PIL's. Exits with status 1 when the
+# difference exceeds the tolerance, so it doubles as the kernel's parity check.
+# The corpus is synthetic (same generator as benchmark.py) unless --source
+# points to a directory of images, like output/images of the data collection.
+#
+#   python benchmarks/image_clean_benchmark.py --images 50
+#   python benchmarks/image_clean_benchmark.py --source output/images --batch-size 32
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import git_commit, synthetic_image
+from src import image_kernel
+
+# Rounding in the blur passes can move a pixel by a few levels after sharpening
+MAX_DIFFERENCE = 4
+MAX_MEAN_DIFFERENCE = 0.25
+
+def load_images(args):
+    from PIL import Image
+    if args.source:
+        names = sorted(os.listdir(args.source))[:args.images]
+        corpus = []
+        for name in names:
+            with open(os.path.join(args.source, name), "rb") as f:
+                corpus.append(f.read())
+    else:
+        rng = random.Random(args.seed)
+        corpus = [synthetic_image(rng, args.image_width, args.image_height) for _ in range(args.images)]
+    images = []
+    for data in corpus:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        images.append(image)
+    return images
+
+def timed(clean, images):
+    start = time.perf_counter()
+    cleaned = clean(images)
+    return cleaned, 1000 * (time.perf_counter() - start) / len(images)
+
+def parity(expected, actual):
+    import numpy as np
+    differences = [np.abs(np.asarray(e, dtype=np.int16) - np.asarray(a, dtype=np.int16)) for e, a in zip(expected, actual)]
+    return {
+        "max_difference": int(max(d.max() for d in differences)),
+        "mean_difference": float(sum(d.mean() for d in differences) / len(differences)),
+        # Share of pixel values more than one level away from PIL's
+        "off_by_more_than_one": float(sum((d > 1).mean() for d in differences) / len(differences)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=30)
+    parser.add_argument("--image-width", type=int, default=1024)
+    parser.add_argument("--image-height", type=int, default=768)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", help="Directory of images to use instead of a synthetic corpus")
+    parser.add_argument("--modes", default=",".join(image_kernel.FUSED_MODES), help="Image modes to convert the corpus to")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", help="Defaults to benchmarks/results/image-clean-<commit>.json")
+    args = parser.parse_args()
+
+    images = load_images(args)
+    results = []
+    failed = False
+    for mode in args.modes.split(","):
+        inputs = [image.convert(mode) for image in images]
+        print(f"-> {mode} ({len(inputs)} images)")
+        expected, pil_ms = timed(lambda batch: [image_kernel.pil_clean(image) for image in batch], inputs)
+        fused, fused_ms = timed(lambda batch: [image_kernel.clean(image) for image in batch], inputs)
+        batched, batch_ms = timed(lambda batch: [cleaned for i in range(0, len(batch), args.batch_size) for cleaned in image_kernel.clean_images(batch[i:i + args.batch_size])], inputs)
+        result = {"mode": mode, "images": len(inputs), "pil_ms": pil_ms, "fused_ms": fused_ms, "batch_ms": batch_ms, **parity(expected, fused)}
+        if parity(fused, batched)["max_difference"] != 0:
+            print("   batched output differs from the single-image output")
+            failed = True
+        if result["max_difference"] > MAX_DIFFERENCE or result["mean_difference"] > MAX_MEAN_DIFFERENCE:
+            print(f"   fused output is too far from PIL's (max {MAX_DIFFERENCE}, mean {MAX_MEAN_DIFFERENCE})")
+            failed = True
+        results.append(result)
+        print(f"   PIL {pil_ms:7.2f} ms  fused {fused_ms:7.2f} ms ({pil_ms / fused_ms:.2f}x)  batch {batch_ms:7.2f} ms ({pil_ms / batch_ms:.2f}x)  max diff {result['max_difference']}  mean diff {result['mean_difference']:.4f}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source": args.source or "synthetic",
+        "results": results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"image-clean-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+
+CHECKPOINT_DIR = os.getenv("PIPELINE_CHECKPOINT_DIR", ".checkpoints")
+
+# Durable per-zone progress ledger kept in a local SQLite file. Every object is
+# marked in flight before it is processed and done (or failed) right after, so
+# a crashed run can be resumed from the exact object it stopped at.
+class CheckpointLedger:
+    def __init__(self, zone_name, bucket_destination, directory=CHECKPOINT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{bucket_destination}__{zone_name}.sqlite")
+        self.run_id = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started_at TEXT, finished_at TEXT, status TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, etag TEXT, size INTEGER, status TEXT, run_id TEXT, updated_at TEXT, error TEXT)")
+        self._conn.commit()
+
+    def start(self, resume=False):
+        with self._lock:
+            last_run = self._conn.execute("SELECT run_id, status FROM runs ORDER BY started_at DESC LIMIT 1").fetchone()
+            if resume and last_run is not None:
+                self.run_id = last_run[0]
+                counts = self._counts()
+                print(f"Resuming {last_run[1]} run {self.run_id}: {counts.get('done', 0)} done, {counts.get('in_flight', 0)} in flight, {counts.get('failed', 0)} failed")
+                self._conn.execute("UPDATE runs SET status = 'running', finished_at = NULL WHERE run_id = ?", (self.run_id,))
+            else:
+                if resume:
+                    print("No previous run to resume, starting a new one")
+                self.run_id = uuid.uuid4().hex
+                self._conn.execute("DELETE FROM items")
+                self._conn.execute("INSERT INTO runs VALUES (?, ?, NULL, 'running')", (self.run_id, _now()))
+            self._conn.commit()
+        return self
+
+    def counts(self):
+        with self._lock:
+            return self._counts()
+
+    def done_objects(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, etag, size FROM items WHERE status = 'done'").fetchall()
+        return [{"Key": key, "ETag": etag, "Size": size} for key, etag, size in rows]
+
+    def is_done(self, obj):
+        with self._lock:
+            row = self._conn.execute("SELECT etag, status FROM items WHERE key = ?", (obj["Key"],)).fetchone()
+        return row is not None and row[1] == "done" and row[0] == obj["ETag"]
+
+    def mark_in_flight(self, obj):
+        self._set(obj, "in_flight")
+
+    def mark_done(self, obj):
+        self._set(obj, "done")
+
+    def mark_failed(self, obj, error=None):
+        self._set(obj, "failed", error)
+
+    def finish(self):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET status = 'completed', finished_at = ? WHERE run_id = ?", (_now(), self.run_id))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _counts(self):
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+
+    def _set(self, obj, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (obj["Key"], obj["ETag"], obj["Size"], status, self.run_id, _now(), error),
+            )
+            self._conn.commit()
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
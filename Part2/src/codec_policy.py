@@ -0,0 +1,118 @@
+import io
+import os
+import threading
+
+# Codec used for every object a zone writes, chosen per destination bucket and
+# modality. PIPELINE_CODEC_POLICY is a comma-separated list of
+# "[<bucket>/]<modal>=<codec>[:<option>=<value>...]" entries; an entry for a
+# bucket overrides the one for the whole modality, e.g.
+#
+#   PIPELINE_CODEC_POLICY="images=webp:lossless=1:method=4,exploitation-zone/images=avif:quality=70:speed=8,texts=zstd:level=6"
+#
+# The defaults keep the original outputs: PNG images, plain texts.
+DEFAULT_POLICY = "images=png,texts=plain"
+
+# User metadata naming the codec of a compressed object; objects without it are read as they are
+CODEC_METADATA = "content-codec"
+
+_parsed = {}
+_lock = threading.Lock()
+_zstd = threading.local()
+
+def parse(spec):
+    policy = {}
+    for entry in filter(None, (entry.strip() for entry in spec.split(","))):
+        target, codec = entry.split("=", 1)
+        name, *options = codec.split(":")
+        policy[target.strip()] = (name.strip().lower(), dict(_parse_option(option) for option in options))
+    return policy
+
+def _parse_option(option):
+    name, value = option.split("=", 1)
+    for convert in (int, float):
+        try:
+            return name, convert(value)
+        except ValueError:
+            pass
+    return name, value
+
+def policy():
+    # Read at call time so pipeline.py and the benchmarks can switch it per run
+    spec = os.getenv("PIPELINE_CODEC_POLICY", "")
+    with _lock:
+        if spec not in _parsed:
+            _parsed[spec] = {**parse(DEFAULT_POLICY), **parse(spec)}
+        return _parsed[spec]
+
+def codec_for(bucket, modal):
+    # (name, options) of the codec for objects of a modality written to a bucket
+    current = policy()
+    return current.get(f"{bucket}/{modal}") or current[modal]
+
+# Images: PIL images -> (extension, bytes)
+def _save_image(image, format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+def _rgb(image):
+    # JPEG has no alpha channel or palette
+    return image if image.mode in ("RGB", "L") else image.convert("RGB")
+
+IMAGE_CODECS = {
+    "png": (".png", lambda image, options: _save_image(image, "PNG", compress_level=options.get("level", 6))),
+    "webp": (".webp", lambda image, options: _save_image(image, "WEBP", lossless=bool(options.get("lossless", 0)), quality=options.get("quality", 80), method=options.get("method", 4))),
+    "jpeg": (".jpg", lambda image, options: _save_image(_rgb(image), "JPEG", quality=options.get("quality", 90), optimize=bool(options.get("optimize", 0)), progressive=bool(options.get("progressive", 0)))),
+    "avif": (".avif", lambda image, options: _save_image(image, "AVIF", quality=options.get("quality", 75), speed=options.get("speed", 6))),
+}
+
+def choose(bucket, modal, codec=None):
+    # codec overrides the policy; it is a codec spec without the modality, e.g. "webp:quality=80"
+    if codec is not None:
+        return parse(f"{modal}={codec}")[modal]
+    return codec_for(bucket, modal)
+
+def extension(modal, codec=None):
+    # Extension of the keys written with codec, or with the modality's default policy
+    codecs = {"images": IMAGE_CODECS}[modal]
+    return codecs[choose(None, modal, codec)[0]][0]
+
+def encode_image(image, bucket, codec=None):
+    name, options = choose(bucket, "images", codec)
+    extension, encode = IMAGE_CODECS[name]
+    return extension, encode(image, options)
+
+# Texts: UTF-8 bytes -> bytes. zstd is transparent: the key keeps its extension,
+# the object is marked with CODEC_METADATA, and decode() (called by every
+# reader through cas.resolve) restores the text of marked objects.
+TEXT_CODECS = {
+    "plain": lambda data, options: data,
+    "zstd": lambda data, options: _zstandard().ZstdCompressor(level=options.get("level", 3)).compress(data),
+}
+
+def encode_text(data, bucket):
+    # Returns the bytes to store and their metadata (None when stored as they are)
+    name, options = codec_for(bucket, "texts")
+    encoded = TEXT_CODECS[name](data, options)
+    # Short chunks do not shrink; those are stored as they are
+    if name == "plain" or len(encoded) >= len(data):
+        return data, None
+    return encoded, {CODEC_METADATA: name}
+
+def decode(data, codec=None):
+    # codec is the CODEC_METADATA of the object, if it has one
+    if codec is None or codec == "plain":
+        return data
+    if codec != "zstd":
+        raise ValueError(f"Unknown content codec {codec}")
+    decompressor = getattr(_zstd, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd.decompressor = _zstandard().ZstdDecompressor()
+    return decompressor.decompress(data)
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The zstd text codec requires zstandard: pip install zstandard")
+    return zstandard
@@ -1,10 +1,50 @@
+import os
 from abc import ABC, abstractmethod
 
 class ADataObj(ABC):
+    # (bucket, serialize() outputs, catalog attributes) computed by encode()
+    encoded = None
+
+    def set_key(self, key):
+        self.path_prefix = key.split("/")[0]
+        split_filename = os.path.splitext(key.split("/")[1])
+        self.filename = split_filename[0]
+        self.extension = split_filename[1].lower()
+
+    @abstractmethod
+    def serialize(self, bucket_destination=None):
+        # Returns the list of (key, bytes, metadata) that save() uploads, encoded
+        # with the codecs src/codec_policy.py assigns to bucket_destination;
+        # metadata is the object's user metadata, or None
+        pass
+
+    def encode(self, bucket_destination, keep_payload=False):
+        # Serializes for bucket_destination ahead of save(), in the process pool
+        # worker, so that save() only uploads. Unless keep_payload, the decoded
+        # content is then dropped and is not sent back to the parent process.
+        self.encoded = (bucket_destination, self.serialize(bucket_destination), self.catalog_attributes())
+        if not keep_payload:
+            self.drop_payload()
+        return self.encoded[1]
+
+    def drop_payload(self):
+        # Releases the decoded content; only save() and catalog_attributes() may follow
+        pass
+
+    def outputs(self, bucket_destination):
+        # What save() uploads: the outputs of encode() for this bucket, if any
+        if self.encoded is not None and self.encoded[0] == bucket_destination:
+            return self.encoded[1]
+        return self.serialize(bucket_destination)
+
     @abstractmethod
     def save(self, bucket_destination):
         pass
 
+    def catalog_attributes(self):
+        # Content attributes recorded in the object catalog (see src/catalog.py)
+        return {}
+
     @abstractmethod    
     def format(self):
         pass
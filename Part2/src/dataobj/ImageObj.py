@@ -1,59 +1,99 @@
 from src.dataobj.ADataObj import ADataObj
-from PIL import Image, ImageEnhance, ImageFilter
-from src.minio_connection import MinIOConnection
+from PIL import Image
+from src import uploader
+from src import codec_policy
+from src import image_kernel
 from src.chroma_connection import ChromaConnection
+from src import metrics
 import os
 import io
+import math
 from src.embedder import embed_image
 
+# Images with more pixels are decoded at a reduced size
+MAX_DECODE_PIXELS = int(os.getenv("PIPELINE_MAX_DECODE_PIXELS", 50_000_000))
+# With a target size, images are still decoded at no less than this multiple
+# of it, so the final resize has pixels to filter (like Image.thumbnail)
+REDUCING_GAP = 2.0
+
+def decode(data, target_size=None):
+    # Decodes at the smallest size that keeps target_size * REDUCING_GAP and
+    # at most MAX_DECODE_PIXELS. JPEGs are scaled by 1/2, 1/4 or 1/8 in the
+    # DCT domain (draft) before any pixel is decoded; the reduction draft
+    # cannot do, and that of other formats, is done by reduce() after decoding.
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    bound = max(1, math.ceil(math.sqrt(width * height / MAX_DECODE_PIXELS)))
+    target = 1
+    if target_size is not None:
+        target = max(1, int(min(width / (target_size[0] * REDUCING_GAP), height / (target_size[1] * REDUCING_GAP))))
+    factor = max(bound, target)
+    if factor > 1:
+        image.draft(image.mode, (width // factor, height // factor))
+    image.load()
+    scale = round(width / image.size[0])
+    remaining = max(math.ceil(bound / scale), target // scale)
+    if remaining > 1 and image.mode not in ("1", "P"):
+        image = image.reduce(remaining)
+    return image
+
 class ImageObj(ADataObj):
-    def __init__(self, key, image_data):
-        self.path_prefix = key.split("/")[0]
-        split_filename = os.path.splitext(key.split("/")[1])
-        self.filename = split_filename[0]
-        self.extension = split_filename[1].lower()
+    def __init__(self, key, image_data, target_size=None):
+        self.set_key(key)
         self.extension_multimodal = "multimodal_collection_images"
-        self.image = Image.open(io.BytesIO(image_data))
+        # Decoded once; format(), clean() and embed() work on these pixels and
+        # the image is only encoded again in serialize(). target_size is the
+        # (width, height) the caller reduces the image to, when it is known.
+        self.image = decode(image_data, target_size)
+        # Codec spec ("webp:quality=80") set by format(); None uses the policy of the destination bucket
+        self.codec = None
         self.embeddings = None
 
+    def serialize(self, bucket_destination=None):
+        # Encoded with the codec set by format(), or the one the policy assigns to images in bucket_destination
+        extension, data = codec_policy.encode_image(self.image, bucket_destination, self.codec)
+        key = self.path_prefix + "/" + self.filename + extension
+        return [(key, data, None)]
+
     def save(self, bucket_destination, chromadb: bool=False, collection_name: str=None):        
-        buffer = io.BytesIO()
-        self.image.save(buffer, format=self.extension[1:])
-        buffer.seek(0)
-
-        key = self.path_prefix + "/" + self.filename + self.extension
-        minio_client = MinIOConnection()
-        minio_client.upload_fileobj(Fileobj=buffer, Bucket=bucket_destination, Key=key)
-        minio_client.head_object(Bucket=bucket_destination, Key=key)
+        [(key, data, metadata)] = self.outputs(bucket_destination)
+        written = [uploader.put(bucket_destination, key, data, metadata)]
         if chromadb:
             chroma_client = ChromaConnection()
             collection_name = f"image_{collection_name}"
             collection = chroma_client.get_or_create_collection(name=collection_name)
-            collection.add(
-                ids=[key],
-                embeddings=[self.embeddings],
-            )
-
-    def format(self):
-        buffer = io.BytesIO()
-        self.image.save(buffer, format="PNG")
-        buffer.seek(0)
-        self.image = Image.open(buffer)
-        self.extension = ".png"
+            with metrics.timed("chroma_upsert"):
+                collection.upsert(
+                    ids=[key],
+                    embeddings=[self.embeddings],
+                )
+        return written
+
+    def catalog_attributes(self):
+        if self.image is None:
+            return self.encoded[2]
+        width, height = self.image.size
+        return {"width": width, "height": height}
+
+    def drop_payload(self):
+        self.image = None
+
+    def format(self, codec=None):
+        # Only records the target format: the pixels are already decoded and
+        # are encoded once, when the object is saved
+        self.codec = codec
+        self.extension = codec_policy.extension("images", codec)
 
     def clean(self):
-        self.image = self.image.resize((600, 400))
-        
-        brightness_enhancer = ImageEnhance.Brightness(self.image)
-        self.image = brightness_enhancer.enhance(1.1)
-        
-        contrast_enhancer = ImageEnhance.Contrast(self.image)
-        self.image = contrast_enhancer.enhance(1.15)
-                
-        color_enhancer = ImageEnhance.Color(self.image)
-        self.image = color_enhancer.enhance(1.05)
-        self.image = self.image.filter(ImageFilter.GaussianBlur(radius=0.3))
-        self.image = self.image.filter(ImageFilter.SHARPEN)
+        # Resize to 600x400, brightness, contrast, colour, Gaussian blur and
+        # sharpen, fused into one pass (see src/image_kernel.py)
+        self.image = image_kernel.clean(self.image)
+
+    @staticmethod
+    def clean_batch(dataobjs):
+        # clean() of several images at once, stacked by mode
+        for dataobj, image in zip(dataobjs, image_kernel.clean_images([dataobj.image for dataobj in dataobjs])):
+            dataobj.image = image
 
     def embed(self):
         self.embeddings = embed_image(self.image)
\ No newline at end of file
@@ -1,24 +1,45 @@
-from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
+import threading
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Loading clip model on {device}...")
-model = CLIPModel.from_pretrained("openai/clip-vit-large-patch14").to(device)
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
+# torch and transformers are imported, and CLIP loaded onto the device, the
+# first time something is embedded, so zones that never embed start instantly.
+model = None
+processor = None
+device = None
+_load_lock = threading.Lock()
 
-def embed_image(image: Image):
+# Zones call the embedder from several I/O threads; inference is serialized so
+# the threads only overlap on network work.
+_model_lock = threading.Lock()
+
+def get_model():
+    global model, processor, device
+    if model is None:
+        with _load_lock:
+            if model is None:
+                import torch
+                from transformers import CLIPProcessor, CLIPModel
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                print(f"Loading clip model on {device}...")
+                processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
+                model = CLIPModel.from_pretrained("openai/clip-vit-large-patch14").to(device)
+    return model, processor
+
+def embed_image(image):
+    import torch
+    model, processor = get_model()
     inputs = processor(images=image, return_tensors="pt")
     inputs = {k: v.to(device) for k, v in inputs.items()}
-    with torch.no_grad():
+    with _model_lock, torch.no_grad():
         feats = model.get_image_features(**inputs)
     feats = feats / feats.norm(p=2, dim=-1, keepdim=True)
     return feats[0].cpu().tolist()
 
 def embed_text(text: str):
+    import torch
+    model, processor = get_model()
     inputs = processor(text=[text], return_tensors="pt", padding=True)
     inputs = {k: v.to(device) for k, v in inputs.items()}
-    with torch.no_grad():
+    with _model_lock, torch.no_grad():
         feats = model.get_text_features(**inputs)
     feats = feats / feats.norm(p=2, dim=-1, keepdim=True)
     return feats[0].cpu().tolist()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import streamlit as st
 from src.chroma_connection import ChromaConnection
-from src.minio_connection import MinIOConnection
+from src import object_cache
+from src import image_kernel
 from src.dataobj.TextObj import TextObj
 from src.dataobj.ImageObj import ImageObj
 from src.dataobj.AudioObj import AudioObj
@@ -43,8 +44,7 @@ def getImageFromText(prompt, k=10):
     print(keys)
     images = []
     for i in range(len(keys)):
-        obj = MinIOConnection().get_object(Bucket="exploitation-zone", Key=keys[i])
-        matched_image_data = obj["Body"].read()
+        matched_image_data = object_cache.read("exploitation-zone", keys[i])
         images.append(Image.open(io.BytesIO(matched_image_data)).convert('RGB'))
     return images
 
@@ -60,12 +60,11 @@ def getAudioFromText(prompt, k=10):
     audios = []
     num_results = min(k, len(keys))
     for i in range(num_results):
-        obj = MinIOConnection().get_object(Bucket="exploitation-zone", Key=keys[i])
-        audios.append(obj["Body"].read())
+        audios.append(object_cache.read("exploitation-zone", keys[i]))
     return audios
 
 def getTextFromImage(image_bytes, k=10):
-    o = ImageObj("images/dummy.png", image_bytes)
+    o = ImageObj("images/dummy.png", image_bytes, target_size=image_kernel.CLEAN_SIZE)
     o.clean()
     o.format()
     o.save("exploitation-zone")
@@ -81,7 +80,7 @@ def getTextFromImage(image_bytes, k=10):
     return "I'm sorry, I don't have a description for that image."
 
 def getImageFromImage(image_bytes, k=10):
-    o = ImageObj("images/dummy.png", image_bytes)
+    o = ImageObj("images/dummy.png", image_bytes, target_size=image_kernel.CLEAN_SIZE)
     o.clean()
     o.format()
     o.save("exploitation-zone")
@@ -93,13 +92,12 @@ def getImageFromImage(image_bytes, k=10):
     images = []
     num_results = min(k, len(keys))
     for i in range(num_results):
-        obj = MinIOConnection().get_object(Bucket="exploitation-zone", Key=keys[i])
-        matched_image_data = obj["Body"].read()
+        matched_image_data = object_cache.read("exploitation-zone", keys[i])
         images.append(Image.open(io.BytesIO(matched_image_data)).convert('RGB'))
     return images
 
 def getAudioFromImage(image_bytes, k=10):
-    o = ImageObj("images/dummy.png", image_bytes)
+    o = ImageObj("images/dummy.png", image_bytes, target_size=image_kernel.CLEAN_SIZE)
     o.clean()
     o.format()
     o.save("exploitation-zone")
@@ -111,8 +109,7 @@ def getAudioFromImage(image_bytes, k=10):
     audios = []
     num_results = min(k, len(keys))
     for i in range(num_results):
-        obj = MinIOConnection().get_object(Bucket="exploitation-zone", Key=keys[i])
-        audios.append(obj["Body"].read())
+        audios.append(object_cache.read("exploitation-zone", keys[i]))
     return audios
 
 def getTextFromAudio(audio_bytes, k=10):
@@ -142,8 +139,7 @@ def getImageFromAudio(audio_bytes, k=10):
     images = []
     num_results = min(k, len(keys))
     for i in range(num_results):
-        obj = MinIOConnection().get_object(Bucket="exploitation-zone", Key=keys[i])
-        matched_image_data = obj["Body"].read()
+        matched_image_data = object_cache.read("exploitation-zone", keys[i])
         images.append(Image.open(io.BytesIO(matched_image_data)).convert('RGB'))
     return images
 
@@ -160,6 +156,5 @@ def getAudioFromAudio(audio_bytes, k=10):
     audios = []
     num_results = min(k, len(keys))
     for i in range(num_results):
-        obj = MinIOConnection().get_object(Bucket="exploitation-zone", Key=keys[i])
-        audios.append(obj["Body"].read())
+        audios.append(object_cache.read("exploitation-zone", keys[i]))
     return audios
@@ -15,6 +15,9 @@ import math
 import re
 import unicodedata
 from dotenv import load_dotenv
+from src import cas
+from src import catalog
+from src import storage
 
 st.set_page_config(
     page_title="Data Quality Report",
@@ -22,8 +25,14 @@ st.set_page_config(
 )
 load_dotenv()
 
+# Objects of every modality that are downloaded and analyzed
+SAMPLE_SIZE = int(os.getenv("PIPELINE_QUALITY_SAMPLE_SIZE", 200))
+
 def get_minio_client():
     try:
+        if storage.backend() != "s3":
+            return storage.create()
+
         access_key_id = os.getenv("ACCESS_KEY_ID")
         secret_access_key = os.getenv("SECRET_ACCESS_KEY")
         minio_url = "http://" + os.getenv("S3_API_ENDPOINT")
@@ -242,38 +251,38 @@ def analyze_audio_file(audio_bytes):
         st.warning(f"Could not process an audio file. Error: {e}")
         return None
 
-def load_data(bucket, prefix, analysis_func, file_type):
+def load_data(bucket, keys, analysis_func, file_type):
     minio_client = get_minio_client()
     if minio_client is None:
         return pd.DataFrame()
 
     analysis_list = []
-    paginator = minio_client.get_paginator("list_objects_v2")
     
     with st.spinner(f"Loading and analyzing {file_type} files..."):
         try:
-            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-                for obj in page.get("Contents", []):
-                    key = obj["Key"]
-                    if key.endswith('/'): continue
-
+            for key in keys:
+                try:
                     response = minio_client.get_object(Bucket=bucket, Key=key)
-                    data_bytes = response["Body"].read()
-                    
-                    if file_type == 'text':
-                        data_to_analyze = data_bytes.decode("utf-8", errors="ignore")
-                        result = analysis_func(data_to_analyze)
-                    else:
-                        result = analysis_func(data_bytes)
-
-                    if result:
-                        analysis_list.append(result)
+                    data_bytes = cas.resolve(bucket, response)
+                except Exception as e:
+                    # e.g. deleted or replaced since it was cataloged; the other objects are still analyzed
+                    st.warning(f"Skipping {key}: {e}")
+                    continue
+                
+                if file_type == 'text':
+                    data_to_analyze = data_bytes.decode("utf-8", errors="ignore")
+                    result = analysis_func(data_to_analyze)
+                else:
+                    result = analysis_func(data_bytes)
+
+                if result:
+                    analysis_list.append(result)
         except Exception as e:
             st.error(f"Error loading data from MinIO: {e}")
             return pd.DataFrame()
 
     if not analysis_list:
-        st.warning(f"No {file_type} files found in 'formatted-zone' with prefix '{prefix}'.")
+        st.warning(f"No {file_type} files found in the catalog of '{bucket}'.")
         return pd.DataFrame()
         
     return pd.DataFrame(analysis_list)
@@ -694,9 +703,30 @@ encoding problems, low-quality media, and inconsistencies that could affect down
 if get_minio_client() is None:
     st.stop()
 
-df_text = load_data(bucket="formatted-zone", prefix="texts/", analysis_func=analisi_text, file_type="text")
-df_image = load_data(bucket="formatted-zone", prefix="images/", analysis_func=analisi_imagen, file_type="image")
-df_audio = load_data(bucket="formatted-zone", prefix="audios/", analysis_func=analyze_audio_file, file_type="audio")
+# Counts, sizes and per-modality statistics come from the object catalog;
+# only the sampled objects are downloaded and analyzed
+inventory = catalog.query("""
+    SELECT modality, count(*) AS files, sum(size) / 1e6 AS total_mb, avg(width) AS mean_width, avg(height) AS mean_height,
+           avg(duration_seconds) AS mean_duration_seconds, max(written_at) AS last_written
+    FROM catalog GROUP BY modality ORDER BY modality""", bucket="formatted-zone")
+# ORDER BY hash(key) gives a sample that is spread over the bucket and stable between reloads
+samples = catalog.query(f"""
+    SELECT modality, key FROM (
+        SELECT modality, key, row_number() OVER (PARTITION BY modality ORDER BY hash(key)) AS n FROM catalog
+    ) WHERE n <= {SAMPLE_SIZE}""", bucket="formatted-zone")
+if inventory.empty:
+    st.info("The object catalog of 'formatted-zone' is empty. Objects written before the catalog existed are added by a `pipeline.py --full` run.")
+else:
+    with st.expander("Show Inventory (object catalog)", expanded=False):
+        st.dataframe(inventory.set_index("modality"))
+        st.caption(f"Up to {SAMPLE_SIZE} objects of every modality are downloaded and analyzed below (PIPELINE_QUALITY_SAMPLE_SIZE).")
+
+def sampled_keys(modality):
+    return samples.loc[samples["modality"] == modality, "key"].tolist()
+
+df_text = load_data(bucket="formatted-zone", keys=sampled_keys("texts"), analysis_func=analisi_text, file_type="text")
+df_image = load_data(bucket="formatted-zone", keys=sampled_keys("images"), analysis_func=analisi_imagen, file_type="image")
+df_audio = load_data(bucket="formatted-zone", keys=sampled_keys("audios"), analysis_func=analyze_audio_file, file_type="audio")
 
 tab_text, tab_image, tab_audio = st.tabs(["Text Quality", "Image Quality", "Audio Quality"])
 
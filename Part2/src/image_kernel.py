@@ -0,0 +1,140 @@
+import math
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+# Output size and factors of ImageObj.clean()
+CLEAN_SIZE = (600, 400)
+BRIGHTNESS = 1.1
+CONTRAST = 1.15
+COLOR = 1.05
+BLUR_RADIUS = 0.3
+BLUR_PASSES = 3
+
+# Modes the fused kernel handles; anything else goes through the PIL chain
+FUSED_MODES = ("L", "RGB", "RGBA")
+
+LEVELS = np.arange(256, dtype=np.float32)
+SHARPEN = np.array([[-2, -2, -2], [-2, 32, -2], [-2, -2, -2]], dtype=np.float32) / 16
+
+# ImageObj.clean() over one 8-bit pixel buffer instead of six PIL passes that
+# each allocate a new image. Brightness and contrast are blends against a
+# constant image, so they are lookup tables; colour blends against the luma of
+# each pixel and runs in place in a float32 scratch buffer. The Gaussian blur
+# (PIL's box passes) and the sharpen filter run in OpenCV. The resize stays in
+# PIL, whose antialiased bicubic resampling OpenCV does not have.
+#
+# The enhancements reproduce PIL's arithmetic exactly; the blur and sharpen
+# differ by rounding only (see benchmarks/image_clean_benchmark.py).
+def pil_clean(image):
+    # The original PIL chain, for modes the kernel does not handle
+    image = image.resize(CLEAN_SIZE)
+    image = ImageEnhance.Brightness(image).enhance(BRIGHTNESS)
+    image = ImageEnhance.Contrast(image).enhance(CONTRAST)
+    image = ImageEnhance.Color(image).enhance(COLOR)
+    image = image.filter(ImageFilter.GaussianBlur(radius=BLUR_RADIUS))
+    return image.filter(ImageFilter.SHARPEN)
+
+def blur_box(radius, passes=BLUR_PASSES):
+    # PIL approximates the Gaussian with `passes` extended box blurs, each
+    # rounded to 8 bits; this is the 1-D kernel of one of them
+    sigma2 = radius * radius / passes
+    size = math.floor((math.sqrt(12 * sigma2 + 1) - 1) / 2)
+    box_radius = size + (2 * size + 1) * (size * (size + 1) - 3 * sigma2) / (6 * (sigma2 - (size + 1) ** 2))
+    inner = 1 / (box_radius * 2 + 1)
+    edge = (1 - (2 * size + 1) * inner) / 2
+    return np.array([edge] + [inner] * (2 * size + 1) + [edge], dtype=np.float32)
+
+BLUR_BOX = blur_box(BLUR_RADIUS)
+
+def _cv2():
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError("The image cleaning kernel requires OpenCV: pip install opencv-python")
+    return cv2
+
+def blend_table(factor, degenerate, channels):
+    # PIL's blend against a constant image, truncated to 8 bits, as a lookup
+    # table; alpha maps to itself like in PIL's enhancers
+    table = np.floor(np.clip(degenerate + factor * (LEVELS - degenerate), 0, 255)).astype(np.uint8)
+    if channels == 1:
+        return table
+    tables = [table] * 3 + [np.arange(256, dtype=np.uint8)] * (channels - 3)
+    return np.stack(tables, axis=-1).reshape(256, 1, channels)
+
+def luma(pixels, out=None):
+    # PIL's convert("L") (ITU-R 601-2 in 16-bit fixed point) as float32
+    cv2 = _cv2()
+    if pixels.ndim == 2:
+        if out is None:
+            return pixels.astype(np.float32)
+        np.copyto(out, pixels)
+        return out
+    weights = np.array([[19595, 38470, 7471] + [0] * (pixels.shape[-1] - 3) + [0x8000]], dtype=np.float32)
+    total = cv2.transform(pixels.astype(np.float32), weights)
+    return np.floor(np.multiply(total, 1 / 0x10000, out=out), out=out)
+
+def clean_pixels(pixels):
+    # (height, width[, channels]) uint8 pixels already at CLEAN_SIZE -> uint8
+    return clean_batch(pixels[None])[0]
+
+def clean_batch(stack):
+    # (images, height, width[, channels]) uint8 stack already at CLEAN_SIZE ->
+    # uint8 stack; scratch buffers are allocated once for the whole stack
+    cv2 = _cv2()
+    channels = 1 if stack.ndim == 3 else stack.shape[-1]
+    brightness = blend_table(BRIGHTNESS, 0, channels)
+    out = np.empty_like(stack)
+    height, width = stack.shape[1:3]
+    gray = np.empty((height, width), dtype=np.float32)
+    color = np.empty((height, width, 3), dtype=np.float32) if channels >= 3 else None
+    gray3 = np.empty((height, width, 3), dtype=np.float32) if channels >= 3 else None
+    for pixels, cleaned in zip(stack, out):
+        enhanced = cv2.LUT(pixels, brightness)
+        # Contrast blends against the mean luma, rounded like ImageStat
+        mean = math.floor(float(luma(enhanced, gray).mean()) + 0.5)
+        enhanced = cv2.LUT(enhanced, blend_table(CONTRAST, mean, channels))
+        if color is not None:
+            luma(enhanced, gray)
+            cv2.merge([gray, gray, gray], gray3)
+            np.copyto(color, enhanced[..., :3])
+            color -= gray3
+            color *= COLOR
+            color += gray3
+            np.clip(color, 0, 255, out=color)
+            # Truncated to 8 bits like PIL's blend
+            enhanced[..., :3] = color
+        cleaned[...] = filter_image(enhanced)
+    return out
+
+def filter_image(pixels):
+    # Gaussian blur then sharpen of one 8-bit image
+    cv2 = _cv2()
+    blurred = pixels
+    # Horizontal passes, then vertical ones
+    for kernel in [BLUR_BOX[None, :]] * BLUR_PASSES + [BLUR_BOX[:, None]] * BLUR_PASSES:
+        blurred = cv2.filter2D(blurred, -1, kernel, borderType=cv2.BORDER_REPLICATE)
+    sharpened = cv2.filter2D(blurred, -1, SHARPEN, borderType=cv2.BORDER_REPLICATE)
+    # PIL's 3x3 filters leave the outermost pixels as they were
+    sharpened[0], sharpened[-1], sharpened[:, 0], sharpened[:, -1] = blurred[0], blurred[-1], blurred[:, 0], blurred[:, -1]
+    return sharpened
+
+def clean(image):
+    # PIL image -> cleaned PIL image
+    return clean_images([image])[0]
+
+def clean_images(images):
+    # Cleans a list of PIL images. Those with a mode the kernel handles are
+    # resized, stacked by mode and cleaned as a batch; the others go through PIL.
+    cleaned = [None] * len(images)
+    by_mode = {}
+    for i, image in enumerate(images):
+        if image.mode in FUSED_MODES:
+            by_mode.setdefault(image.mode, []).append(i)
+        else:
+            cleaned[i] = pil_clean(image)
+    for indexes in by_mode.values():
+        stack = np.stack([np.asarray(images[i].resize(CLEAN_SIZE)) for i in indexes])
+        for i, pixels in zip(indexes, clean_batch(stack)):
+            cleaned[i] = Image.fromarray(pixels)
+    return cleaned
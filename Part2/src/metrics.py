@@ -0,0 +1,230 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.minio_connection import MinIOConnection
+
+METRICS_BUCKET = "pipeline-metrics"
+QUANTILES = (0.5, 0.95, 0.99)
+# Latencies are counted in log-spaced buckets from 1 us, 8 per doubling (each
+# about 9% wide), up to about an hour; longer calls land in the last one
+HISTOGRAM_MIN = 1e-6
+BUCKETS_PER_DOUBLING = 8
+HISTOGRAM_BUCKETS = 256
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value):
+        bucket = 0 if value <= HISTOGRAM_MIN else min(HISTOGRAM_BUCKETS - 1, int(math.log2(value / HISTOGRAM_MIN) * BUCKETS_PER_DOUBLING) + 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Geometric middle of the bucket that holds the q-th value, within the observed range
+        if not self.count:
+            return 0.0
+        rank = min(self.count - 1, int(q * self.count))
+        for bucket, count in enumerate(self.counts):
+            rank -= count
+            if rank < 0:
+                break
+        middle = HISTOGRAM_MIN * 2 ** ((bucket - 0.5) / BUCKETS_PER_DOUBLING) if bucket else HISTOGRAM_MIN
+        return min(max(middle, self.min), self.max)
+
+class _Stats:
+    def __init__(self):
+        self.wall = _Histogram()
+        self.cpu = _Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def add(self, sample):
+        wall, cpu, bytes_in, bytes_out = sample
+        self.wall.add(wall)
+        self.cpu.add(cpu)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+# Wall time, CPU time and bytes of the instrumented calls, aggregated per
+# (zone, modality, stage), so memory does not grow with the number of calls.
+# Zone and modality come from the labels set with context() by the caller, so
+# the DataObjs do not need to know where they run.
+_stats = defaultdict(_Stats)
+# Highest peak RSS (in KiB) reported by a process pool worker
+_peak_worker_rss = 0
+_lock = threading.Lock()
+_local = threading.local()
+
+class _Timer:
+    def __init__(self, bytes_in, bytes_out):
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+
+@contextmanager
+def context(**labels):
+    previous = current_context()
+    _local.labels = {**previous, **labels}
+    try:
+        yield
+    finally:
+        _local.labels = previous
+
+def current_context():
+    return dict(getattr(_local, "labels", {}))
+
+def run_in_context(labels, fn, *args):
+    # Re-applies the caller's labels in a pool thread
+    with context(**labels):
+        return fn(*args)
+
+@contextmanager
+def timed(stage, bytes_in=0, bytes_out=0):
+    timer = _Timer(bytes_in, bytes_out)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield timer
+    finally:
+        record(stage, time.perf_counter() - wall_start, time.thread_time() - cpu_start, timer.bytes_in, timer.bytes_out)
+
+def record(stage, wall, cpu, bytes_in=0, bytes_out=0):
+    labels = current_context()
+    key = (labels.get("zone", ""), labels.get("modal", ""), stage)
+    sample = (wall, cpu, bytes_in, bytes_out)
+    captured = getattr(_local, "captured", None)
+    if captured is not None:
+        captured.append((key, sample))
+        return
+    with _lock:
+        _stats[key].add(sample)
+
+def run_collected(labels, fn, *args):
+    # Runs fn in a worker process and hands its samples and the worker's peak
+    # RSS back to the parent, which adds them with merge(). The workers are
+    # not children of the parent (see execution_engine.START_METHOD), so
+    # RUSAGE_CHILDREN there does not see them.
+    import resource
+    _local.captured = []
+    try:
+        with context(**labels):
+            result = fn(*args)
+        return result, _local.captured, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        _local.captured = None
+
+def merge(samples, worker_rss=0):
+    global _peak_worker_rss
+    with _lock:
+        for key, sample in samples:
+            _stats[key].add(sample)
+        _peak_worker_rss = max(_peak_worker_rss, worker_rss)
+
+def peak_worker_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return _peak_worker_rss / 1024
+
+def reset():
+    global _peak_worker_rss
+    with _lock:
+        _stats.clear()
+        _peak_worker_rss = 0
+
+def report():
+    rows = []
+    with _lock:
+        for (zone, modal, stage), stats in sorted(_stats.items()):
+            wall_total = stats.wall.total
+            row = {
+                "zone": zone,
+                "modal": modal,
+                "stage": stage,
+                "count": stats.wall.count,
+                "wall_seconds": wall_total,
+                "cpu_seconds": stats.cpu.total,
+                "bytes_in": stats.bytes_in,
+                "bytes_out": stats.bytes_out,
+                "mb_per_second": (stats.bytes_in + stats.bytes_out) / 1e6 / wall_total if wall_total else 0.0,
+            }
+            for q in QUANTILES:
+                row[f"wall_p{int(q * 100)}"] = stats.wall.quantile(q)
+                row[f"cpu_p{int(q * 100)}"] = stats.cpu.quantile(q)
+            rows.append(row)
+    return rows
+
+def summary():
+    lines = [f"{'zone':<18}{'modal':<8}{'stage':<13}{'count':>7}{'wall s':>9}{'cpu s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'MB in':>9}{'MB out':>9}"]
+    for row in report():
+        lines.append(
+            f"{row['zone']:<18}{row['modal']:<8}{row['stage']:<13}{row['count']:>7}{row['wall_seconds']:>9.2f}{row['cpu_seconds']:>9.2f}"
+            f"{row['wall_p50'] * 1000:>9.1f}{row['wall_p95'] * 1000:>9.1f}{row['wall_p99'] * 1000:>9.1f}{row['bytes_in'] / 1e6:>9.2f}{row['bytes_out'] / 1e6:>9.2f}"
+        )
+    return "\n".join(lines)
+
+def prometheus_text():
+    lines = [
+        "# HELP pipeline_stage_seconds Wall time per instrumented call.",
+        "# TYPE pipeline_stage_seconds summary",
+    ]
+    rows = report()
+    for row in rows:
+        labels = f'zone="{row["zone"]}",modal="{row["modal"]}",stage="{row["stage"]}"'
+        for q in QUANTILES:
+            lines.append(f'pipeline_stage_seconds{{{labels},quantile="{q}"}} {row[f"wall_p{int(q * 100)}"]}')
+        lines.append(f"pipeline_stage_seconds_sum{{{labels}}} {row['wall_seconds']}")
+        lines.append(f"pipeline_stage_seconds_count{{{labels}}} {row['count']}")
+    for name, field, help_text in (
+        ("pipeline_stage_cpu_seconds_total", "cpu_seconds", "CPU time per stage."),
+        ("pipeline_stage_bytes_in_total", "bytes_in", "Bytes read per stage."),
+        ("pipeline_stage_bytes_out_total", "bytes_out", "Bytes written per stage."),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for row in rows:
+            lines.append(f'{name}{{zone="{row["zone"]}",modal="{row["modal"]}",stage="{row["stage"]}"}} {row[field]}')
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port):
+    # Prometheus endpoint at http://<host>:<port>/metrics
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_report(bucket=METRICS_BUCKET, run_name=None):
+    run_name = run_name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    minio_client = MinIOConnection()
+    try:
+        minio_client.create_bucket(Bucket=bucket)
+    except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
+        pass
+    key = f"runs/{run_name}.json"
+    body = json.dumps({"run": run_name, "stages": report()}, indent=2).encode("utf-8")
+    minio_client.put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json")
+    return key
@@ -0,0 +1,65 @@
+import importlib
+import os
+import re
+import threading
+
+# Registry of the modalities the pipeline knows about. Each modality maps to
+# the DataObj class that handles it (as a "module:Class" path, imported the
+# first time it is needed) and to the file extensions routed to it by the
+# Temporal Landing Zone. Zones that never build a DataObj therefore never
+# import PIL, pydub or the embedding model.
+_registry = {}
+_extensions = {}
+_signatures = []
+_lock = threading.Lock()
+
+# Bytes read from objects without an extension to recognise their content
+SNIFF_BYTES = 512
+
+def register(modal, dataobj_path, extensions=(), signatures=()):
+    # dataobj_path may be None for a modality that is routed but not processed.
+    # signatures are byte regexes matched against the first SNIFF_BYTES bytes.
+    with _lock:
+        _registry[modal] = {"path": dataobj_path, "class": None}
+        for extension in extensions:
+            _extensions[extension.lower()] = modal
+        for signature in signatures:
+            _signatures.append((re.compile(signature, re.DOTALL), modal))
+
+def registered_modals():
+    return list(_registry)
+
+def dataobj_class(modal):
+    entry = _registry.get(modal)
+    if entry is None or entry["path"] is None:
+        return None
+    if entry["class"] is None:
+        with _lock:
+            if entry["class"] is None:
+                module_name, class_name = entry["path"].split(":")
+                entry["class"] = getattr(importlib.import_module(module_name), class_name)
+    return entry["class"]
+
+def modal_for_key(key):
+    # Destination folder of a temporal-landing object, or None when the key has
+    # no extension and the content has to be sniffed
+    file_ext = os.path.splitext(key)[1].lower()
+    if not file_ext:
+        return None
+    return _extensions.get(file_ext) or file_ext.strip(".")
+
+def sniff(head):
+    for signature, modal in _signatures:
+        if signature.match(head):
+            return modal
+    # Anything that decodes as UTF-8 (ignoring a cut-off last character) is text
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:
+            return "others"
+    return "texts" if head else "others"
+
+register("images", "src.dataobj.ImageObj:ImageObj", [".png", ".jpg", ".jpeg", ".webp", ".avif"], [rb"\x89PNG\r\n\x1a\n", rb"\xff\xd8\xff", rb"RIFF....WEBP", rb"....ftypavi[fs]"])
+register("audios", None, [".mp3", ".wav", ".ogg", ".opus", ".flac"], [rb"RIFF....WAVE", rb"ID3", rb"\xff[\xe0-\xff]", rb"OggS", rb"fLaC"])
+register("texts", "src.dataobj.TextObj:TextObj", [".txt", ".md", ".json"])
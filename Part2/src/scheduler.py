@@ -0,0 +1,55 @@
+import os
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from src.execution_engine import ExecutionEngine, DEFAULT_IO_WORKERS, DEFAULT_CPU_WORKERS, cpu_pool
+from src import metrics
+
+def parse_weights(value):
+    # "images=2,texts=1" -> {"images": 2.0, "texts": 1.0}
+    weights = {}
+    for pair in filter(None, value.split(",")):
+        modal, weight = pair.split("=")
+        weights[modal.strip()] = float(weight)
+    return weights
+
+DEFAULT_MODAL_WEIGHTS = parse_weights(os.getenv("PIPELINE_MODAL_WEIGHTS", "images=1,audios=1,texts=1"))
+
+# Runs every modality of a zone at the same time, each on its own
+# ExecutionEngine. The zone's worker budget is split between modalities
+# proportionally to their weights, so e.g. PIL-bound images, model-bound texts
+# and ffmpeg-bound audios overlap instead of waiting for each other. The
+# engines share one process pool, created before the modality threads start;
+# each runs at most its share of CPU tasks on it.
+class ModalityScheduler:
+    def __init__(self, modals, weights=None, io_workers=None, cpu_workers=None):
+        self.modals = modals
+        self.weights = {modal: (weights or DEFAULT_MODAL_WEIGHTS).get(modal, 1.0) for modal in modals}
+        self.io_workers = io_workers if io_workers is not None else DEFAULT_IO_WORKERS
+        self.cpu_workers = cpu_workers if cpu_workers is not None else DEFAULT_CPU_WORKERS
+
+    def budgets(self):
+        total_weight = sum(self.weights.values()) or 1.0
+        budgets = {}
+        for modal, weight in self.weights.items():
+            share = weight / total_weight
+            io_workers = max(1, round(self.io_workers * share))
+            cpu_workers = max(1, round(self.cpu_workers * share)) if self.cpu_workers > 0 else 0
+            budgets[modal] = (io_workers, cpu_workers)
+        return budgets
+
+    def run(self, fn):
+        # fn(modal, engine, position) is called once per modality in its own thread
+        budgets = self.budgets()
+        for modal, (io_workers, cpu_workers) in budgets.items():
+            print(f"{modal}: {io_workers} I/O workers, {cpu_workers} CPU workers")
+
+        def run_modal(shared_cpu_pool, position, modal):
+            io_workers, cpu_workers = budgets[modal]
+            with metrics.context(modal=modal), ExecutionEngine(io_workers=io_workers, cpu_workers=cpu_workers, shared_cpu_pool=shared_cpu_pool) as engine:
+                return fn(modal, engine, position)
+
+        labels = metrics.current_context()
+        with (cpu_pool(self.cpu_workers) if self.cpu_workers > 0 else nullcontext()) as shared_cpu_pool:
+            with ThreadPoolExecutor(max_workers=max(1, len(self.modals))) as pool:
+                futures = {modal: pool.submit(metrics.run_in_context, labels, run_modal, shared_cpu_pool, position, modal) for position, modal in enumerate(self.modals)}
+                return {modal: future.result() for modal, future in futures.items()}
@@ -0,0 +1,371 @@
+import base64
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+# Objects of the local backend at least this large are read through mmap
+MMAP_THRESHOLD = int(os.getenv("PIPELINE_STORAGE_MMAP_THRESHOLD", 1024 * 1024))
+
+# Storage backends other than MinIO/S3, selected with PIPELINE_STORAGE:
+#   s3     (default) boto3 against S3_API_ENDPOINT
+#   local  a directory (PIPELINE_STORAGE_DIR, default .storage), large objects read through mmap
+#   memory the memory of the current process, e.g. for tests and benchmarks
+# Both implement the subset of the boto3 S3 client that the pipeline uses,
+# with the same responses and error codes, and MinIOConnection() returns them
+# in place of the boto3 client, so zones, DataObjs and the frontend work
+# unchanged on any backend. ETags are computed the way S3 computes them.
+def backend():
+    return os.getenv("PIPELINE_STORAGE", "s3")
+
+def storage_dir():
+    return os.getenv("PIPELINE_STORAGE_DIR", ".storage")
+
+def compute_etag(data, config=None):
+    # MD5 of the content, or S3's multipart form when config would upload it in parts
+    if config is None or len(data) < config.multipart_threshold:
+        return f'"{hashlib.md5(data).hexdigest()}"'
+    chunk_size = config.multipart_chunksize
+    parts = [hashlib.md5(data[i:i + chunk_size]).digest() for i in range(0, len(data), chunk_size)]
+    return f'"{hashlib.md5(b"".join(parts)).hexdigest()}-{len(parts)}"'
+
+def _error(code, message, operation):
+    return ClientError({"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": 404 if code in ("404", "NoSuchKey", "NoSuchBucket") else 400}}, operation)
+
+class Exceptions:
+    # Mirrors client.exceptions for the errors the pipeline catches by class
+    class BucketAlreadyExists(ClientError):
+        pass
+
+    class BucketAlreadyOwnedByYou(ClientError):
+        pass
+
+    class NoSuchBucket(ClientError):
+        pass
+
+    class NoSuchKey(ClientError):
+        pass
+
+class Body:
+    # Streaming body over bytes[start:end] or an mmap; slicing an mmap only reads those pages
+    def __init__(self, data, on_close=None, start=0, end=None):
+        self._data = data
+        self._position = start
+        self._end = len(data) if end is None else end
+        self._on_close = on_close
+
+    def read(self, amt=None):
+        end = self._end if amt is None else min(self._end, self._position + amt)
+        chunk = bytes(self._data[self._position:end])
+        self._position = end
+        return chunk
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Paginator:
+    def __init__(self, store):
+        self.store = store
+
+    def paginate(self, Bucket, Prefix="", Delimiter=None, PaginationConfig=None):
+        token = None
+        while True:
+            page = self.store.list_objects_v2(Bucket=Bucket, Prefix=Prefix, Delimiter=Delimiter, ContinuationToken=token)
+            yield page
+            if not page["IsTruncated"]:
+                return
+            token = page["NextContinuationToken"]
+
+# Everything but the storage primitives (_bucket_exists, _make_bucket,
+# _remove_bucket, _buckets, _keys, _stat, _data, _write, _link, _remove),
+# which the backends implement.
+class ObjectStore:
+    exceptions = Exceptions
+    PAGE_SIZE = 1000
+
+    def create_bucket(self, Bucket, **kwargs):
+        if self._bucket_exists(Bucket):
+            raise Exceptions.BucketAlreadyOwnedByYou({"Error": {"Code": "BucketAlreadyOwnedByYou", "Message": Bucket}}, "CreateBucket")
+        self._make_bucket(Bucket)
+        return {}
+
+    def delete_bucket(self, Bucket):
+        self._check_bucket(Bucket, "DeleteBucket")
+        if self._keys(Bucket, ""):
+            raise _error("BucketNotEmpty", Bucket, "DeleteBucket")
+        self._remove_bucket(Bucket)
+        return {}
+
+    def list_buckets(self):
+        return {"Buckets": [{"Name": name} for name in sorted(self._buckets())]}
+
+    def get_paginator(self, operation):
+        if operation != "list_objects_v2":
+            raise NotImplementedError(f"{type(self).__name__} only paginates list_objects_v2")
+        return Paginator(self)
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, ContinuationToken=None, StartAfter=None, MaxKeys=None, **kwargs):
+        self._check_bucket(Bucket, "ListObjectsV2")
+        max_keys = MaxKeys or self.PAGE_SIZE
+        after = ContinuationToken or StartAfter or ""
+        contents, prefixes = [], []
+        for key in self._keys(Bucket, Prefix or ""):
+            if key <= after:
+                continue
+            if Delimiter and Delimiter in key[len(Prefix or ""):]:
+                common = key[:key.index(Delimiter, len(Prefix or "")) + len(Delimiter)]
+                if common not in prefixes:
+                    prefixes.append(common)
+                continue
+            meta = self._stat(Bucket, key)
+            contents.append({"Key": key, "Size": meta["size"], "ETag": meta["etag"], "LastModified": _timestamp(meta)})
+            if len(contents) >= max_keys:
+                break
+        page = {"Name": Bucket, "Prefix": Prefix or "", "KeyCount": len(contents), "MaxKeys": max_keys, "IsTruncated": len(contents) >= max_keys}
+        if contents:
+            page["Contents"] = contents
+        if prefixes:
+            page["CommonPrefixes"] = [{"Prefix": prefix} for prefix in prefixes]
+        if page["IsTruncated"]:
+            page["NextContinuationToken"] = contents[-1]["Key"]
+        return page
+
+    def head_object(self, Bucket, Key, **kwargs):
+        meta = self._meta(Bucket, Key, "HeadObject", missing="404")
+        return self._headers(meta)
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None, **kwargs):
+        meta = self._meta(Bucket, Key, "GetObject")
+        if IfNoneMatch is not None and IfNoneMatch == meta["etag"]:
+            raise _error("304", "Not Modified", "GetObject")
+        data, on_close = self._data(Bucket, Key)
+        response = self._headers(meta)
+        start, end = 0, meta["size"] - 1
+        if Range is not None:
+            start, end = Range.replace("bytes=", "").split("-")
+            start, end = int(start), min(int(end) if end else meta["size"] - 1, meta["size"] - 1)
+            response["ContentRange"] = f"bytes {start}-{end}/{meta['size']}"
+            response["ContentLength"] = end + 1 - start
+        response["Body"] = Body(data, on_close, start, end + 1)
+        return response
+
+    def put_object(self, Bucket, Key, Body=b"", ContentMD5=None, Metadata=None, ContentType=None, **kwargs):
+        self._check_bucket(Bucket, "PutObject")
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        etag = compute_etag(data)
+        if ContentMD5 is not None and hashlib.md5(data).hexdigest() != _md5_hex(ContentMD5):
+            raise _error("BadDigest", "The Content-MD5 you specified did not match what was received", "PutObject")
+        self._write(Bucket, Key, data, self._new_meta(len(data), etag, Metadata, ContentType))
+        return {"ETag": etag}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        self._check_bucket(Bucket, "PutObject")
+        data = Fileobj.read()
+        extra_args = ExtraArgs or {}
+        self._write(Bucket, Key, data, self._new_meta(len(data), compute_etag(data, Config), extra_args.get("Metadata"), extra_args.get("ContentType")))
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        with open(Filename, "rb") as f:
+            self.upload_fileobj(f, Bucket, Key, ExtraArgs=ExtraArgs, Config=Config)
+
+    def copy_object(self, CopySource, Bucket, Key, **kwargs):
+        meta = self._meta(CopySource["Bucket"], CopySource["Key"], "CopyObject")
+        self._check_bucket(Bucket, "CopyObject")
+        meta = {**meta, "last_modified": datetime.now(timezone.utc).isoformat()}
+        self._link(CopySource["Bucket"], CopySource["Key"], Bucket, Key, meta)
+        return {"CopyObjectResult": {"ETag": meta["etag"], "LastModified": _timestamp(meta)}}
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        # Managed copy; there are no parts to split a local copy into
+        self.copy_object(CopySource=CopySource, Bucket=Bucket, Key=Key)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._check_bucket(Bucket, "DeleteObject")
+        self._remove(Bucket, Key)
+        return {}
+
+    def _check_bucket(self, bucket, operation):
+        if not self._bucket_exists(bucket):
+            raise Exceptions.NoSuchBucket({"Error": {"Code": "NoSuchBucket", "Message": bucket}}, operation)
+
+    def _meta(self, bucket, key, operation, missing="NoSuchKey"):
+        self._check_bucket(bucket, operation)
+        meta = self._stat(bucket, key)
+        if meta is None:
+            if missing == "NoSuchKey":
+                raise Exceptions.NoSuchKey({"Error": {"Code": "NoSuchKey", "Message": key}}, operation)
+            raise _error(missing, "Not Found", operation)
+        return meta
+
+    def _new_meta(self, size, etag, metadata, content_type):
+        return {"size": size, "etag": etag, "metadata": metadata or {}, "content_type": content_type or "binary/octet-stream", "last_modified": datetime.now(timezone.utc).isoformat()}
+
+    def _headers(self, meta):
+        return {"ContentLength": meta["size"], "ETag": meta["etag"], "Metadata": dict(meta["metadata"]), "ContentType": meta["content_type"], "LastModified": _timestamp(meta)}
+
+def _timestamp(meta):
+    return datetime.fromisoformat(meta["last_modified"])
+
+def _md5_hex(content_md5):
+    return base64.b64decode(content_md5).hex()
+
+_memory_buckets = {}
+_memory_lock = threading.Lock()
+
+# Objects live in a dict of this process. Every MemoryStorage of a process sees
+# the same objects, so the pipeline, its zones and a benchmark share them.
+class MemoryStorage(ObjectStore):
+    def _bucket_exists(self, bucket):
+        return bucket in _memory_buckets
+
+    def _make_bucket(self, bucket):
+        with _memory_lock:
+            _memory_buckets.setdefault(bucket, {})
+
+    def _remove_bucket(self, bucket):
+        with _memory_lock:
+            _memory_buckets.pop(bucket, None)
+
+    def _buckets(self):
+        return list(_memory_buckets)
+
+    def _keys(self, bucket, prefix):
+        with _memory_lock:
+            return sorted(key for key in _memory_buckets[bucket] if key.startswith(prefix))
+
+    def _stat(self, bucket, key):
+        entry = _memory_buckets[bucket].get(key)
+        return None if entry is None else entry[1]
+
+    def _data(self, bucket, key):
+        return _memory_buckets[bucket][key][0], None
+
+    def _write(self, bucket, key, data, meta):
+        with _memory_lock:
+            _memory_buckets[bucket][key] = (data, meta)
+
+    def _link(self, source_bucket, source_key, bucket, key, meta):
+        # Objects are immutable bytes, so a copy shares them
+        with _memory_lock:
+            _memory_buckets[bucket][key] = (_memory_buckets[source_bucket][source_key][0], meta)
+
+    def _remove(self, bucket, key):
+        with _memory_lock:
+            _memory_buckets[bucket].pop(key, None)
+
+# Objects are files under <root>/data/<bucket>/<key> with their ETag and
+# metadata in <root>/meta/<bucket>/<key>.json. Reads of large objects map the
+# file instead of copying it through a socket, ranged reads only touch the
+# pages they need, writes go through a temporary file and a rename so readers
+# never see a partial object, and copies are hard links.
+class LocalStorage(ObjectStore):
+    def __init__(self, root=None):
+        self.root = root or storage_dir()
+        os.makedirs(os.path.join(self.root, "data"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "meta"), exist_ok=True)
+
+    def _path(self, bucket, key=""):
+        return os.path.join(self.root, "data", bucket, *key.split("/")) if key else os.path.join(self.root, "data", bucket)
+
+    def _meta_path(self, bucket, key):
+        return os.path.join(self.root, "meta", bucket, *key.split("/")) + ".json"
+
+    def _bucket_exists(self, bucket):
+        return os.path.isdir(self._path(bucket))
+
+    def _make_bucket(self, bucket):
+        os.makedirs(self._path(bucket), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "meta", bucket), exist_ok=True)
+
+    def _remove_bucket(self, bucket):
+        shutil.rmtree(self._path(bucket), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.root, "meta", bucket), ignore_errors=True)
+
+    def _buckets(self):
+        return [name for name in os.listdir(os.path.join(self.root, "data")) if os.path.isdir(self._path(name))]
+
+    def _keys(self, bucket, prefix):
+        base = self._path(bucket)
+        keys = []
+        for root, _, files in os.walk(base):
+            relative = os.path.relpath(root, base).replace(os.sep, "/")
+            for name in files:
+                if ".tmp-" in name:
+                    continue
+                key = name if relative == "." else f"{relative}/{name}"
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def _stat(self, bucket, key):
+        try:
+            with open(self._meta_path(bucket, key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _data(self, bucket, key):
+        with open(self._path(bucket, key), "rb") as f:
+            # Small objects are read whole: mapping them saves no copy worth
+            # having and leaves a mapping open until the body is closed
+            if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+                return f.read(), None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped, mapped.close
+
+    def _write(self, bucket, key, data, meta):
+        self._replace(self._path(bucket, key), lambda f: f.write(data))
+        self._write_meta(bucket, key, meta)
+
+    def _link(self, source_bucket, source_key, bucket, key, meta):
+        source = self._path(source_bucket, source_key)
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, path)
+        self._write_meta(bucket, key, meta)
+
+    def _write_meta(self, bucket, key, meta):
+        self._replace(self._meta_path(bucket, key), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    def _replace(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+
+    def _remove(self, bucket, key):
+        for path in (self._path(bucket, key), self._meta_path(bucket, key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def create(name=None):
+    # Client for a non-S3 backend, or None when the backend is S3
+    name = name or backend()
+    if name == "local":
+        return LocalStorage()
+    if name == "memory":
+        return MemoryStorage()
+    if name != "s3":
+        raise ValueError(f"Unknown storage backend {name}")
+    return None
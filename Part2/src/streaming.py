@@ -0,0 +1,126 @@
+import os
+import threading
+from queue import Queue
+from src import metrics
+
+DEFAULT_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 64))
+DEFAULT_REPORT_INTERVAL = float(os.getenv("PIPELINE_QUEUE_REPORT_INTERVAL", 10))
+
+_DONE = object()
+
+class Stage:
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.processed = 0
+        self.failed = 0
+        self.peak_depth = 0
+        self.depth_samples = 0
+        self.depth_total = 0
+
+# Runs a chain of stages connected by bounded queues. Every stage has its own
+# worker threads and reads from its own input queue, so a slow stage fills the
+# queue in front of it and blocks the stages upstream (backpressure) instead of
+# letting items pile up in memory. Items for which a stage returns None or
+# raises are dropped (the ones that raise are passed to on_failure with the
+# error); everything that leaves the last stage is yielded by run().
+class StreamingPipeline:
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE, report_interval=DEFAULT_REPORT_INTERVAL, describe=str, labels=None, on_failure=None):
+        self.stages = stages
+        self.queues = [Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self.report_interval = report_interval
+        self.describe = describe
+        # Optional item -> metrics labels function, applied around every stage call
+        self.labels = labels or (lambda item: {})
+        self.on_failure = on_failure or (lambda item, error: None)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._producer_error = None
+
+    def queue_depths(self):
+        # Depth of the queue in front of every stage, i.e. items waiting for it
+        return {stage.name: queue.qsize() for stage, queue in zip(self.stages, self.queues)}
+
+    def run(self, items):
+        threads = []
+        labels = metrics.current_context()
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=metrics.run_in_context, args=(labels, self._work, stage, self.queues[i], self.queues[i + 1], remaining), daemon=True)
+                thread.start()
+                threads.append(thread)
+        threading.Thread(target=self._produce, args=(items,), daemon=True).start()
+        monitor = threading.Thread(target=self._monitor, daemon=True)
+        monitor.start()
+
+        sink = self.queues[-1]
+        while True:
+            item = sink.get()
+            if item is _DONE:
+                break
+            yield item
+
+        for thread in threads:
+            thread.join()
+        self._stopped.set()
+        monitor.join()
+        if self._producer_error is not None:
+            raise self._producer_error
+
+    def summary(self):
+        lines = [f"{'stage':<12}{'workers':>8}{'processed':>11}{'failed':>8}{'avg queue':>11}{'peak queue':>12}"]
+        for stage in self.stages:
+            avg_depth = stage.depth_total / stage.depth_samples if stage.depth_samples else 0
+            lines.append(f"{stage.name:<12}{stage.workers:>8}{stage.processed:>11}{stage.failed:>8}{avg_depth:>11.1f}{stage.peak_depth:>12}")
+        return "\n".join(lines)
+
+    def _produce(self, items):
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        except Exception as e:
+            self._producer_error = e
+        finally:
+            self.queues[0].put(_DONE)
+
+    def _work(self, stage, inbox, outbox, remaining):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                # Leave the marker for the sibling workers; the last one to
+                # finish forwards it downstream.
+                inbox.put(_DONE)
+                with self._lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+                return
+            try:
+                with metrics.context(**self.labels(item)):
+                    result = stage.fn(item)
+            except Exception as e:
+                with self._lock:
+                    stage.failed += 1
+                print(f"Failed to {stage.name} {self.describe(item)}: {e}")
+                self.on_failure(item, f"{stage.name}: {e}")
+                continue
+            with self._lock:
+                stage.processed += 1
+            if result is not None:
+                outbox.put(result)
+
+    def _monitor(self):
+        elapsed = 0.0
+        while not self._stopped.wait(0.1):
+            depths = self.queue_depths()
+            for stage in self.stages:
+                stage.peak_depth = max(stage.peak_depth, depths[stage.name])
+                stage.depth_samples += 1
+                stage.depth_total += depths[stage.name]
+            elapsed += 0.1
+            if self.report_interval and elapsed >= self.report_interval:
+                elapsed = 0.0
+                print("Queue depths: " + ", ".join(f"{name}={depth}" for name, depth in depths.items()))
@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from src.execution_engine import ExecutionEngine
+
+WORK_QUEUE_PATH = os.getenv("PIPELINE_WORK_QUEUE", os.path.join(".checkpoints", "work_queue.sqlite"))
+DEFAULT_UNIT_SIZE = int(os.getenv("PIPELINE_UNIT_SIZE", 50))
+DEFAULT_LEASE_SECONDS = float(os.getenv("PIPELINE_LEASE_SECONDS", 300))
+
+# Lease-based work queue backed by SQLite. A coordinator shards a zone's
+# pending objects into units; any number of worker processes lease units,
+# process them and ack them. A unit whose lease expires (the worker died or
+# hung) is handed to the next worker that asks for work. SQLite is the local
+# stand-in: every process on the host (or on hosts sharing the file through a
+# filesystem with working locks) can use the same queue file.
+class WorkQueue:
+    def __init__(self, path=WORK_QUEUE_PATH, max_attempts=3):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        # The connection is shared with the heartbeat threads; statements run
+        # one at a time so that none lands inside another's transaction
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS units (
+            unit_id TEXT PRIMARY KEY, zone TEXT, modal TEXT, objs TEXT, status TEXT,
+            worker TEXT, lease_expires REAL, attempts INTEGER, failed TEXT)""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _transaction(self):
+        # Rolled back on any error (e.g. "database is locked"), so the shared
+        # connection is never left inside an open transaction
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._conn.execute(sql, parameters)
+
+    def open(self):
+        # Starts a new run: the units of earlier runs are dropped, and workers
+        # tell this run's close from a stale one by its id
+        run_id = uuid.uuid4().hex
+        with self._transaction():
+            self._conn.execute("DELETE FROM units")
+            self._conn.execute("INSERT OR REPLACE INTO state VALUES ('run', ?)", (run_id,))
+            self._conn.execute("INSERT OR REPLACE INTO state VALUES ('closed', '0')")
+        return run_id
+
+    def close(self):
+        self._execute("INSERT OR REPLACE INTO state VALUES ('closed', '1')")
+
+    def run_state(self):
+        # (id of the last opened run or None, whether it is closed)
+        state = dict(self._execute("SELECT name, value FROM state").fetchall())
+        return state.get("run"), state.get("closed") == "1"
+
+    def enqueue(self, zone, modal, objs, unit_size=DEFAULT_UNIT_SIZE):
+        units = [objs[i:i + unit_size] for i in range(0, len(objs), unit_size)]
+        with self._transaction():
+            for unit in units:
+                self._conn.execute(
+                    "INSERT INTO units VALUES (?, ?, ?, ?, 'pending', NULL, NULL, 0, '[]')",
+                    (uuid.uuid4().hex, zone, modal, json.dumps([_listed(obj) for obj in unit])),
+                )
+        return len(units)
+
+    def clear(self, zone):
+        self._execute("DELETE FROM units WHERE zone = ?", (zone,))
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._transaction():
+            self.fail_expired(now)
+            row = self._conn.execute(
+                """SELECT unit_id, zone, modal, objs, status FROM units
+                   WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                   ORDER BY rowid LIMIT 1""",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            unit_id, zone, modal, objs, status = row
+            if status == "leased":
+                print(f"Lease on unit {unit_id} expired, re-queuing it")
+            self._conn.execute(
+                "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE unit_id = ?",
+                (worker_id, now + lease_seconds, unit_id),
+            )
+        return {"unit_id": unit_id, "zone": zone, "modal": modal, "objs": json.loads(objs)}
+
+    def fail_expired(self, now=None):
+        # An expired unit that has used up its attempts most likely kills its
+        # workers (a crash or the OOM killer) before they can release it, so it
+        # is failed instead of being leased again
+        failed = self._execute(
+            "UPDATE units SET status = 'failed', worker = NULL WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (time.time() if now is None else now, self.max_attempts),
+        ).rowcount
+        if failed:
+            print(f"{failed} units failed: their leases expired after {self.max_attempts} attempts")
+        return failed
+
+    def heartbeat(self, unit_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self._execute(
+            "UPDATE units SET lease_expires = ? WHERE unit_id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, unit_id, worker_id),
+        )
+
+    @contextmanager
+    def keep_leased(self, unit_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        # Renews the lease from a timer thread, a third of the lease apart, so
+        # that a single object slower than the lease does not lose it
+        stopped = threading.Event()
+
+        def renew():
+            while not stopped.wait(lease_seconds / 3):
+                try:
+                    self.heartbeat(unit_id, worker_id, lease_seconds)
+                except sqlite3.Error as e:
+                    print(f"Failed to renew the lease on unit {unit_id}: {e}")
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def ack(self, unit_id, worker_id, failed_objs):
+        # A worker that lost its lease cannot ack; the unit's new owner will
+        cursor = self._execute(
+            "UPDATE units SET status = 'done', failed = ? WHERE unit_id = ? AND worker = ? AND status = 'leased'",
+            (json.dumps([_listed(obj) for obj in failed_objs]), unit_id, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, unit_id, worker_id):
+        # Gives the unit back after an unexpected worker error
+        self._execute(
+            "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL WHERE unit_id = ? AND worker = ?",
+            (self.max_attempts, unit_id, worker_id),
+        )
+
+    def stats(self, zone):
+        return dict(self._execute("SELECT status, COUNT(*) FROM units WHERE zone = ? GROUP BY status", (zone,)).fetchall())
+
+    def completed_objects(self, zone):
+        # Listed objects of every acked unit, minus the ones that failed in it
+        completed = []
+        for objs, failed in self._execute("SELECT objs, failed FROM units WHERE zone = ? AND status = 'done'", (zone,)).fetchall():
+            failed_keys = {obj["Key"] for obj in json.loads(failed)}
+            completed.extend(obj for obj in json.loads(objs) if obj["Key"] not in failed_keys)
+        return completed
+
+def _listed(obj):
+    return {"Key": obj["Key"], "ETag": obj["ETag"], "Size": obj["Size"]}
+
+def run_worker(queue, zones, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=5):
+    # zones maps zone names to zone instances; runs until the coordinator
+    # closes a run this worker has seen open. A worker started before the
+    # coordinator opens its run waits for it instead of exiting on the close
+    # left by the previous run.
+    worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}"
+    print(f"Worker {worker_id} waiting for work")
+    active_run = None
+    # One engine per worker configuration, kept for the whole loop so that
+    # units do not each start their own thread and process pools
+    engines = {}
+    with ExitStack() as stack:
+        while True:
+            run_id, closed = queue.run_state()
+            if not closed:
+                active_run = run_id
+            unit = queue.lease(worker_id, lease_seconds)
+            if unit is None:
+                if closed and run_id is not None and run_id == active_run:
+                    print(f"Worker {worker_id} done")
+                    return
+                time.sleep(poll_interval)
+                continue
+            zone = zones[unit["zone"]]
+            config = (zone.io_workers, zone.cpu_workers)
+            if config not in engines:
+                engines[config] = stack.enter_context(ExecutionEngine(io_workers=zone.io_workers, cpu_workers=zone.cpu_workers))
+            try:
+                zone.work_unit(queue, unit, worker_id, engines[config], lease_seconds)
+            except Exception as e:
+                print(f"Failed unit {unit['unit_id']} of {unit['zone']}: {e}")
+                queue.release(unit["unit_id"], worker_id)
@@ -1,42 +1,285 @@
-from abc import ABC, abstractmethod
+from abc import ABC
 from src.minio_connection import MinIOConnection
-from src.dataobj.ImageObj import ImageObj
-from src.dataobj.TextObj import TextObj
+from src.execution_engine import ExecutionEngine
+from src.manifest import Manifest
+from src.checkpoint import CheckpointLedger
+from src.streaming import Stage, StreamingPipeline
+from src.scheduler import ModalityScheduler
+from src.work_queue import DEFAULT_UNIT_SIZE, DEFAULT_LEASE_SECONDS
+from src import metrics
+from src import cas
+from src.catalog import CatalogWriter, lineage
+import time
 from tqdm import tqdm
+from src import modalities
+
+def build_dataobj(modal, key, data, target_size=None):
+    # Apply factory pattern; the DataObj classes are registered in src/modalities.py
+    dataobj_class = modalities.dataobj_class(modal)
+    if dataobj_class is None:
+        return None
+    with metrics.timed("decode", bytes_in=len(data)):
+        if target_size is not None:
+            return dataobj_class(key, data, target_size=target_size)
+        return dataobj_class(key, data)
+
+def decode_and_transform(zone, modal, key, data):
+    # Module-level so it can be shipped to the engine's process pool. The
+    # object is also encoded there and comes back without its decoded
+    # content, so only the upload is left for the I/O threads.
+    dataobj = build_dataobj(modal, key, data, zone.TARGET_SIZES.get(modal))
+    if dataobj is not None:
+        zone.transform(dataobj)
+        zone.encode(dataobj)
+    return dataobj
 
 class AZone(ABC):
+    # Bump in a zone whenever its transform changes so that the next
+    # incremental run reprocesses every object.
+    TRANSFORM_VERSION = 1
+    # (width, height) the transform reduces the objects of a modality to, if
+    # it does; their DataObjs may then decode them at a reduced size
+    TARGET_SIZES = {}
 
-    def __init__(self, bucket_origin, bucket_destination):
+    def __init__(self, supported_modals, bucket_origin, bucket_destination, io_workers=None, cpu_workers=None, incremental=True, modal_weights=None):
+        self.supported_modals = supported_modals
         self.bucket_origin = bucket_origin
         self.bucket_destination = bucket_destination
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.incremental = incremental
+        self.modal_weights = modal_weights
+        self.catalog = None
+
+    def __getstate__(self):
+        # The zone is shipped to the engine's process pool; the catalog writer stays in this process
+        state = self.__dict__.copy()
+        state["catalog"] = None
+        return state
 
-    @abstractmethod
-    def treatData(obj):
+    def transform(self, dataobj):
+        # Zones that change their objects override this; the default leaves
+        # them as they are (TemporalLanding only copies)
         pass
 
-    def execute(self):
+    def encode(self, dataobj):
+        with metrics.timed("serialize") as timer:
+            outputs = dataobj.encode(self.bucket_destination)
+            timer.bytes_out = sum(len(data) for _, data, _ in outputs)
+
+    def load(self, dataobj):
+        return dataobj.save(self.bucket_destination)
+
+    def treatData(self, dataobj):
+        self.transform(dataobj)
+        self.load(dataobj)
+
+    def process(self, engine, modal, key):
+        minio_client = MinIOConnection()
+        try:
+            with metrics.timed("get_object") as timer:
+                response = minio_client.get_object(Bucket=self.bucket_origin, Key=key)
+                data = cas.resolve(self.bucket_origin, response)
+                timer.bytes_in = len(data)
+            dataobj = engine.run_cpu(decode_and_transform, self, modal, key, data)
+            if dataobj is not None:
+                written = self.load(dataobj)
+                self.record_written(modal, written, dataobj, lineage(self.bucket_origin, [{"Key": key, "ETag": response["ETag"]}]))
+            return True
+        except Exception as e:
+            print(f"Failed to process {key}: {e}")
+            return False
+
+    def record_written(self, modal, written, dataobj, source):
+        if self.catalog is not None:
+            self.catalog.record(written, modal, dataobj.catalog_attributes(), source)
+
+    def load_manifest(self):
+        return Manifest(type(self).__name__, self.bucket_destination, self.TRANSFORM_VERSION).load()
+
+    def start_ledger(self, manifest, resume):
+        ledger = CheckpointLedger(type(self).__name__, self.bucket_destination).start(resume)
+        # Objects finished by an interrupted run may not have reached the manifest yet
+        for obj in ledger.done_objects():
+            manifest.record(obj)
+        return ledger
+
+    def is_pending(self, manifest, ledger, obj):
+        if ledger is not None and ledger.is_done(obj):
+            return False
+        return not (self.incremental and manifest.is_current(obj))
+
+    def pending_objects(self, manifest, ledger, objs, label):
+        pending = [obj for obj in objs if self.is_pending(manifest, ledger, obj)]
+        print(f"{len(objs) - len(pending)} {label} objects already up to date, {len(pending)} to process")
+        return pending
+
+    def execute(self, streaming=False, resume=False):
+        with metrics.context(zone=type(self).__name__):
+            self.execute_zone(streaming, resume)
+
+    def execute_zone(self, streaming=False, resume=False):
         minio_client = MinIOConnection()
         try:
             minio_client.create_bucket(Bucket=self.bucket_destination)
         except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
             print(f"Bucket '{self.bucket_destination}' already exists")
-        
+
         paginator = minio_client.get_paginator("list_objects_v2")
 
+        manifest = self.load_manifest()
+        ledger = self.start_ledger(manifest, resume)
+        self.catalog = CatalogWriter(type(self).__name__, self.bucket_destination)
+        try:
+            self.process_zone(paginator, manifest, ledger, streaming)
+            self.catalog.flush()
+            ledger.finish()
+        finally:
+            ledger.close()
+
+    def process_zone(self, paginator, manifest, ledger, streaming=False):
+        # Processes the pending objects of every modality; the bucket, manifest,
+        # ledger and catalog are set up (and finished) by execute_zone()
+        print(self.supported_modals)
+        if streaming:
+            with ExecutionEngine(io_workers=self.io_workers, cpu_workers=self.cpu_workers) as engine:
+                self.execute_streaming(engine, paginator, manifest, ledger)
+        else:
+            scheduler = ModalityScheduler(self.supported_modals, self.modal_weights, self.io_workers, self.cpu_workers)
+            scheduler.run(lambda modal, engine, position: self.execute_modal(engine, paginator, manifest, ledger, modal, position))
+
+    def execute_modal(self, engine, paginator, manifest, ledger, modal, position=None):
+        print(f"Processing modal: {modal}")
+        objs = [obj for page in paginator.paginate(Bucket=self.bucket_origin, Prefix=modal) for obj in page.get("Contents", [])]
+        objs = self.pending_objects(manifest, ledger, objs, modal)
+        self.run_tracked(engine, manifest, ledger, objs, lambda obj: self.process(engine, modal, obj["Key"]), modal, position)
+
+    def run_tracked(self, engine, manifest, ledger, objs, process, label, position=None):
+        # Runs process(obj) -> bool on every object, marking it in the ledger
+        # and recording the successful ones in the manifest; returns those
+        def process_tracked(obj):
+            ledger.mark_in_flight(obj)
+            ok = process(obj)
+            if ok:
+                ledger.mark_done(obj)
+            else:
+                ledger.mark_failed(obj)
+            return ok
+
+        done = []
+        for obj, ok in engine.map(process_tracked, objs, desc=label, total=len(objs), position=position):
+            if ok:
+                manifest.record(obj)
+                done.append(obj)
+        manifest.save()
+        if len(done) < len(objs):
+            print(f"{len(objs) - len(done)} {label} objects failed in {type(self).__name__}")
+        return done
+
+    # Streaming mode: listing, fetching, decoding and transforming (one process
+    # pool call) and uploading run as separate stages joined by bounded queues.
+    # Items are (modal, listed object, payload) tuples.
+    def execute_streaming(self, engine, paginator, manifest, ledger):
+        failed = []
+
+        def mark_failed(item, error):
+            ledger.mark_failed(item[1], error)
+            failed.append(item[1]["Key"])
+
+        pipeline = StreamingPipeline(self.stages(engine), describe=lambda item: item[1]["Key"], labels=lambda item: {"modal": item[0]}, on_failure=mark_failed)
+        for modal, obj, _ in tqdm(pipeline.run(self.list_pending(paginator, manifest, ledger)), desc=type(self).__name__):
+            ledger.mark_done(obj)
+            manifest.record(obj)
+        manifest.save()
+        print(pipeline.summary())
+        if failed:
+            print(f"{len(failed)} objects failed in {type(self).__name__}: {', '.join(sorted(failed))}")
+
+    def list_pending(self, paginator, manifest, ledger):
         for modal in self.supported_modals:
-            print(f"Processing modal: {modal}")
             for page in paginator.paginate(Bucket=self.bucket_origin, Prefix=modal):
-                for obj in tqdm(page.get("Contents",[])):
-                    key = obj["Key"]
-                    response = minio_client.get_object(Bucket=self.bucket_origin, Key=key)
-                    if modal == "images":
-                        o = ImageObj(key, response["Body"].read())
-                        self.treatData(o)
-                    #elif modal == "audios":
-                    #    o = AudioObj(key, response["Body"].read())
-                    #    self.treatData(o)
-                    elif modal == "texts":
-                        o = TextObj(key, response["Body"].read())
-                        self.treatData(o)
-
-                    
\ No newline at end of file
+                for obj in page.get("Contents", []):
+                    if self.is_pending(manifest, ledger, obj):
+                        ledger.mark_in_flight(obj)
+                        yield modal, obj, None
+
+    def stages(self, engine):
+        cpu_workers = max(engine.cpu_workers, 1)
+        return [
+            Stage("fetch", self.fetch_stage, workers=engine.io_workers),
+            Stage("transform", lambda item: self.transform_stage(engine, item), workers=cpu_workers),
+            Stage("upload", self.upload_stage, workers=engine.io_workers),
+        ]
+
+    def fetch_stage(self, item):
+        modal, obj, _ = item
+        with metrics.timed("get_object") as timer:
+            response = MinIOConnection().get_object(Bucket=self.bucket_origin, Key=obj["Key"])
+            data = cas.resolve(self.bucket_origin, response)
+            timer.bytes_in = len(data)
+        return modal, obj, data
+
+    def transform_stage(self, engine, item):
+        modal, obj, data = item
+        return modal, obj, engine.run_cpu(decode_and_transform, self, modal, obj["Key"], data)
+
+    def upload_stage(self, item):
+        modal, obj, dataobj = item
+        # Modalities without a DataObj pass through, as in process()
+        if dataobj is not None:
+            written = self.load(dataobj)
+            self.record_written(modal, written, dataobj, lineage(self.bucket_origin, [obj]))
+        return modal, obj, None
+
+    # Distributed mode: the coordinator shards the pending objects into leased
+    # work units (see src/work_queue.py), waits until workers have acked all
+    # of them and then folds the results into the manifest.
+    def distribute(self, queue, unit_size=DEFAULT_UNIT_SIZE, poll_interval=5):
+        with metrics.context(zone=type(self).__name__):
+            self.distribute_zone(queue, unit_size, poll_interval)
+
+    def distribute_zone(self, queue, unit_size=DEFAULT_UNIT_SIZE, poll_interval=5):
+        minio_client = MinIOConnection()
+        try:
+            minio_client.create_bucket(Bucket=self.bucket_destination)
+        except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
+            print(f"Bucket '{self.bucket_destination}' already exists")
+
+        paginator = minio_client.get_paginator("list_objects_v2")
+        manifest = self.load_manifest()
+        zone = type(self).__name__
+
+        queue.clear(zone)
+        for modal in self.supported_modals:
+            objs = [obj for page in paginator.paginate(Bucket=self.bucket_origin, Prefix=modal) for obj in page.get("Contents", [])]
+            objs = self.pending_objects(manifest, None, objs, modal)
+            print(f"Queued {queue.enqueue(zone, modal, objs, unit_size)} {modal} units")
+
+        while True:
+            # Also fails the units whose workers all died, when none is left to lease
+            queue.fail_expired()
+            stats = queue.stats(zone)
+            if stats.get("pending", 0) + stats.get("leased", 0) == 0:
+                break
+            print(f"{zone}: " + ", ".join(f"{count} {status}" for status, count in stats.items()))
+            time.sleep(poll_interval)
+
+        for obj in queue.completed_objects(zone):
+            manifest.record(obj)
+        manifest.save()
+        stats = queue.stats(zone)
+        if stats.get("failed", 0):
+            print(f"{stats['failed']} units of {zone} failed after every attempt")
+
+    def work_unit(self, queue, unit, worker_id, engine, lease_seconds=DEFAULT_LEASE_SECONDS):
+        modal = unit["modal"]
+        failed = []
+        self.catalog = CatalogWriter(type(self).__name__, self.bucket_destination)
+        with metrics.context(zone=type(self).__name__, modal=modal), queue.keep_leased(unit["unit_id"], worker_id, lease_seconds):
+            results = engine.map(lambda obj: self.process(engine, modal, obj["Key"]), unit["objs"], desc=f"{type(self).__name__} {modal}", total=len(unit["objs"]))
+            for obj, ok in results:
+                if not ok:
+                    failed.append(obj)
+        self.catalog.flush()
+        if not queue.ack(unit["unit_id"], worker_id, failed):
+            print(f"Lost the lease on unit {unit['unit_id']} before acking it")
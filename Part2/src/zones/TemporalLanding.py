@@ -1,56 +1,73 @@
 import os
+import time
+from boto3.s3.transfer import TransferConfig
 from src.minio_connection import MinIOConnection
+from src.execution_engine import ExecutionEngine
 from src.zones.AZone import AZone
+from src import metrics
+from src import modalities
+from src.catalog import lineage
 
+# Objects at least this large are copied with a multipart server-side copy
+MULTIPART_COPY_THRESHOLD = int(os.getenv("PIPELINE_MULTIPART_COPY_THRESHOLD", 64 * 1024 * 1024))
+MULTIPART_COPY_CHUNKSIZE = int(os.getenv("PIPELINE_MULTIPART_COPY_CHUNKSIZE", 64 * 1024 * 1024))
+
+# Routes every temporal-landing object to its modality folder with server-side
+# copies. Objects are never downloaded: the route comes from the key's
+# extension, or from a small ranged read when the key has none.
 class TemporalLanding(AZone):
-    def __init__(self, supported_modals, bucket_origin, bucket_destination):
-        self.bucket_origin = bucket_origin
-        self.bucket_destination = bucket_destination
-        self.supported_modals = supported_modals
+    def __init__(self, supported_modals, bucket_origin, bucket_destination, **kwargs):
+        super().__init__(supported_modals, bucket_origin, bucket_destination, **kwargs)
+        self.copy_config = TransferConfig(multipart_threshold=MULTIPART_COPY_THRESHOLD, multipart_chunksize=MULTIPART_COPY_CHUNKSIZE, max_concurrency=4)
 
-    def treatData(self, dataobj):
-        dataobj.save(self.bucket_destination)
+    def route(self, key):
+        dest_folder = modalities.modal_for_key(key)
+        if dest_folder is None:
+            with metrics.timed("sniff") as timer:
+                response = MinIOConnection().get_object(Bucket=self.bucket_origin, Key=key, Range=f"bytes=0-{modalities.SNIFF_BYTES - 1}")
+                with response["Body"] as body:
+                    head = body.read()
+                timer.bytes_in = len(head)
+            dest_folder = modalities.sniff(head)
+        return f"{dest_folder}/{os.path.basename(key)}"
 
-    def execute(self):
+    def copy(self, obj):
         minio_client = MinIOConnection()
+        key = obj["Key"]
         try:
-            minio_client.create_bucket(Bucket=self.bucket_destination)
-        except (minio_client.exceptions.BucketAlreadyExists, minio_client.exceptions.BucketAlreadyOwnedByYou):
-            print(f"Bucket '{self.bucket_destination}' already exists")
-        
-        folder_map = {
-            ".mp3": "audios",
-            ".wav": "audios",
-            ".ogg": "audios",
-            ".png": "images",
-            ".jpg": "images",
-            ".jpeg": "images",
-            ".txt": "texts",
-            ".md": "texts",
-            ".json": "texts",
-        }
-        
-        paginator = minio_client.get_paginator("list_objects_v2")
+            new_key = self.route(key)
+            copy_source = {
+                'Bucket': self.bucket_origin,
+                'Key': key
+            }
+            with metrics.timed("copy_object", bytes_out=obj["Size"]):
+                if obj["Size"] >= MULTIPART_COPY_THRESHOLD:
+                    minio_client.copy(copy_source, self.bucket_destination, new_key, Config=self.copy_config)
+                    # Managed copies do not return the ETag of the new object
+                    etag = minio_client.head_object(Bucket=self.bucket_destination, Key=new_key)["ETag"]
+                else:
+                    response = minio_client.copy_object(
+                        CopySource=copy_source,
+                        Bucket=self.bucket_destination,
+                        Key=new_key
+                    )
+                    etag = response["CopyObjectResult"]["ETag"]
+            self.catalog.record([{"Key": new_key, "ETag": etag, "Size": obj["Size"]}], new_key.split("/")[0], source=lineage(self.bucket_origin, [obj]))
+            return True
+        except Exception as e:
+            print(f"Failed to copy {key}: {e}")
+            return False
+
+    def process_zone(self, paginator, manifest, ledger, streaming=False):
+        # The whole origin bucket is routed at once, in either mode: a copy is
+        # one server-side request, with nothing to decode or transform
+        objs = [obj for page in paginator.paginate(Bucket=self.bucket_origin) for obj in page.get("Contents",[])]
+        objs = self.pending_objects(manifest, ledger, objs, self.bucket_origin)
 
-        for page in paginator.paginate(Bucket=self.bucket_origin):
-            for obj in page.get("Contents",[]):
-                key = obj["Key"]
-                response = minio_client.get_object(Bucket=self.bucket_origin, Key=key)
-                
-                file_ext = os.path.splitext(key)[1].lower()
-                dest_folder = folder_map.get(file_ext, file_ext.strip("."))
-                if not dest_folder:
-                    dest_folder = "others"
-        
-                new_key = f"{dest_folder}/{os.path.basename(key)}"
-                copy_source = {
-                    'Bucket': self.bucket_origin,
-                    'Key': key
-                }
-                
-                minio_client.copy_object(
-                    CopySource=copy_source,
-                    Bucket=self.bucket_destination,
-                    Key=new_key
-                )
-        
+        start = time.perf_counter()
+        with ExecutionEngine(io_workers=self.io_workers, cpu_workers=0) as engine:
+            copied = self.run_tracked(engine, manifest, ledger, objs, self.copy, self.bucket_origin)
+        seconds = time.perf_counter() - start
+        copied_bytes = sum(obj["Size"] for obj in copied)
+        if copied:
+            print(f"Copied {len(copied)} objects ({copied_bytes / 1e6:.1f} MB) in {seconds:.2f}s: {len(copied) / seconds:.1f} objects/s, {copied_bytes / 1e6 / seconds:.1f} MB/s")
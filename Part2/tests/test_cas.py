@@ -0,0 +1,43 @@
+import hashlib
+import pytest
+from src import cas
+from src import uploader
+
+@pytest.fixture
+def content_addressed(storage, monkeypatch):
+    monkeypatch.setenv("PIPELINE_CONTENT_ADDRESSED", "1")
+    storage.create_bucket(Bucket="formatted-zone")
+    return storage
+
+def blobs(storage, bucket):
+    return [obj["Key"] for obj in storage.list_objects_v2(Bucket=bucket, Prefix=cas.CAS_PREFIX).get("Contents", [])]
+
+def test_pointer_round_trip(content_addressed):
+    data = b"the same sentence"
+    digest = hashlib.sha256(data).hexdigest()
+    first = uploader.put("formatted-zone", "texts/a_0.txt", data)
+    second = uploader.put("formatted-zone", "texts/b_0.txt", data)
+
+    # Stored once, and both pointers share an ETag
+    assert blobs(content_addressed, "formatted-zone") == [cas.blob_key(digest)]
+    assert first["ETag"] == second["ETag"]
+    pointer = content_addressed.get_object(Bucket="formatted-zone", Key="texts/a_0.txt")
+    assert pointer["Metadata"] == {cas.POINTER_METADATA: digest}
+    assert cas.read("formatted-zone", "texts/a_0.txt") == data
+    assert cas.read("formatted-zone", "texts/b_0.txt") == data
+    assert cas.physical_key("formatted-zone", "texts/a_0.txt") == cas.blob_key(digest)
+
+def test_existing_blob_is_not_uploaded_again(content_addressed, monkeypatch):
+    uploader.put("formatted-zone", "texts/a_0.txt", b"shared")
+    # A new process only knows the blob from the bucket
+    monkeypatch.setattr(cas, "_known_blobs", set())
+    keys = []
+    cas.put("formatted-zone", "texts/b_0.txt", b"shared", lambda bucket, key, data, metadata: keys.append(key))
+    assert keys == ["texts/b_0.txt"]
+
+def test_plain_objects_are_read_as_they_are(storage):
+    storage.create_bucket(Bucket="formatted-zone")
+    uploader.put("formatted-zone", "texts/a_0.txt", b"plain")
+    assert blobs(storage, "formatted-zone") == []
+    assert cas.read("formatted-zone", "texts/a_0.txt") == b"plain"
+    assert cas.physical_key("formatted-zone", "texts/a_0.txt") == "texts/a_0.txt"
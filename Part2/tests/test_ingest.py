@@ -0,0 +1,46 @@
+import hashlib
+import os
+import pytest
+from src import ingest
+from src import storage as storage_backends
+from src import uploader
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    # Multipart from 4 KiB on, in parts of at least 1 KiB, hashed 300 bytes at a time
+    monkeypatch.setattr(uploader, "MULTIPART_THRESHOLD", 4096)
+    monkeypatch.setattr(uploader, "MIN_PART_SIZE", 1024)
+    monkeypatch.setattr(ingest, "HASH_BLOCK_SIZE", 300)
+
+def write(path, size):
+    data = os.urandom(size)
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+def test_local_etag_of_a_single_part_file(small_parts):
+    data = write("file", 4095)
+    assert ingest.local_etag("file", 4095) == f'"{hashlib.md5(data).hexdigest()}"'
+
+@pytest.mark.parametrize("size, parts", [(4096, 4), (5120, 5), (5121, 6), (10000, 10)])
+def test_local_etag_of_a_multipart_file(small_parts, size, parts):
+    data = write("file", size)
+    etag = ingest.local_etag("file", size)
+    assert etag == storage_backends.compute_etag(data, uploader.transfer_config(size))
+    assert etag.endswith(f'-{parts}"')
+
+def test_local_etag_when_parts_grow_past_max_parts(small_parts, monkeypatch):
+    monkeypatch.setattr(uploader, "MAX_PARTS", 3)
+    data = write("file", 10000)
+    etag = ingest.local_etag("file", 10000)
+    assert etag == storage_backends.compute_etag(data, uploader.transfer_config(10000))
+    assert etag.endswith('-3"')
+
+def test_ingest_skips_files_already_uploaded(small_parts):
+    os.makedirs("drop/images")
+    for name, size in (("a.jpg", 100), ("b.jpg", 4096), ("c.jpg", 9999)):
+        write(os.path.join("drop", "images", name), size)
+    summary = ingest.ingest("drop", "landing", workers=2)
+    assert (summary["uploaded"], summary["skipped"], summary["failed"]) == (3, 0, [])
+    summary = ingest.ingest("drop", "landing", workers=2)
+    assert (summary["uploaded"], summary["skipped"], summary["failed"]) == (0, 3, [])
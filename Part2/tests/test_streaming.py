@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+from src.checkpoint import CheckpointLedger
+from src.manifest import Manifest
+from src.execution_engine import ExecutionEngine
+from src.streaming import Stage, StreamingPipeline
+from src.zones.AZone import AZone
+from src.zones.TrustedZone import TrustedZone
+from src.dataobj.ADataObj import ADataObj
+from src import modalities
+from src import uploader
+
+def test_full_queue_blocks_the_upstream_stages():
+    produced = []
+    release = threading.Event()
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    def slow(item):
+        release.wait()
+        return item
+
+    pipeline = StreamingPipeline([Stage("fast", lambda item: item), Stage("slow", slow)], queue_size=2, report_interval=0)
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(pipeline.run(items())))
+    thread.start()
+    time.sleep(0.5)
+    # Two full queues, one item in each stage's worker and one in the producer
+    assert len(produced) <= 2 * 2 + 2 + 1
+    release.set()
+    thread.join(timeout=10)
+    assert sorted(results) == list(range(100))
+    assert [(stage.processed, stage.failed) for stage in pipeline.stages] == [(100, 0), (100, 0)]
+
+def test_stage_errors_are_passed_to_on_failure():
+    failures = []
+
+    def check(item):
+        if item % 2:
+            raise ValueError("odd")
+        return item
+
+    pipeline = StreamingPipeline([Stage("check", check, workers=3)], report_interval=0, on_failure=lambda item, error: failures.append((item, error)))
+    assert sorted(pipeline.run(range(6))) == [0, 2, 4]
+    assert sorted(failures) == [(1, "check: odd"), (3, "check: odd"), (5, "check: odd")]
+
+class FailingZone(AZone):
+    def stages(self, engine):
+        return [Stage("fetch", self.fetch_stage, workers=2), Stage("transform", self.transform_stage)]
+
+    def transform_stage(self, item):
+        if item[1]["Key"].endswith("corrupt.txt"):
+            raise ValueError("cannot decode")
+        return item
+
+def test_streaming_failures_reach_the_ledger(storage):
+    storage.create_bucket(Bucket="origin")
+    for key in ("texts/a.txt", "texts/corrupt.txt", "texts/b.txt"):
+        storage.put_object(Bucket="origin", Key=key, Body=b"text")
+    FailingZone(["texts"], "origin", "destination", io_workers=2, cpu_workers=0).execute(streaming=True)
+
+    ledger = CheckpointLedger("FailingZone", "destination")
+    assert ledger.counts() == {"done": 2, "failed": 1}
+    assert sorted(obj["Key"] for obj in ledger.done_objects()) == ["texts/a.txt", "texts/b.txt"]
+    ledger.close()
+    with sqlite3.connect(ledger.path) as conn:
+        assert conn.execute("SELECT key, error FROM items WHERE status = 'failed'").fetchall() == [("texts/corrupt.txt", "transform: cannot decode")]
+    # Only the objects that made it through every stage are up to date
+    manifest = Manifest("FailingZone", "destination", AZone.TRANSFORM_VERSION).load()
+    assert sorted(manifest.entries) == ["texts/a.txt", "texts/b.txt"]
+
+class StubObj(ADataObj):
+    def __init__(self, key, data):
+        self.set_key(key)
+        self.data = data
+
+    def serialize(self, bucket_destination=None):
+        return [(self.path_prefix + "/" + self.filename + self.extension, self.data, None)]
+
+    def save(self, bucket_destination, chromadb=False, collection_name=None):
+        return uploader.put_many(bucket_destination, self.outputs(bucket_destination))
+
+    def format(self):
+        pass
+
+    def clean(self):
+        pass
+
+    def embed(self):
+        if self.data == b"corrupt":
+            raise ValueError("no embedding")
+
+def test_trusted_zone_embeds_in_its_own_stage(storage):
+    modalities.register("stubs", f"{__name__}:StubObj")
+    storage.create_bucket(Bucket="trusted")
+    for key, body in (("stubs/a.bin", b"a"), ("stubs/b.bin", b"corrupt")):
+        storage.put_object(Bucket="trusted", Key=key, Body=body)
+    zone = TrustedZone(["stubs"], "trusted", "exploitation", io_workers=2)
+    assert [stage.name for stage in zone.stages(ExecutionEngine(io_workers=2, cpu_workers=0))] == ["fetch", "decode", "embed", "upload"]
+    zone.execute(streaming=True)
+
+    assert storage.get_object(Bucket="exploitation", Key="stubs/a.bin")["Body"].read() == b"a"
+    ledger = CheckpointLedger("TrustedZone", "exploitation")
+    assert ledger.counts() == {"done": 1, "failed": 1}
+    ledger.close()
+    with sqlite3.connect(ledger.path) as conn:
+        assert conn.execute("SELECT key, error FROM items WHERE status = 'failed'").fetchall() == [("stubs/b.bin", "embed: no embedding")]